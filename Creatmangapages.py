@@ -1,774 +1,3954 @@
 import os
+import argparse
+import hashlib
+import struct
+import stat
+import shutil
+import filecmp
+import zipfile
+import zlib
+import gzip
+import mimetypes
+import posixpath
+import threading
+import time
+import select
+import ctypes
+import errno
+import sys
+import contextlib
+from collections import OrderedDict, deque
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import quote, unquote, urlsplit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 import re
 import json # 需要导入 json 来序列化全局目录信息
+import html
+import sqlite3
+
+try:
+    from PIL import Image # 可选依赖，只有生成缩略图时需要: pip install pillow
+except ImportError:
+    Image = None
 
 # 全局变量，用于存储整个项目的目录结构信息
 # 键是相对于根目录的路径 ('.' 代表根目录)，值是包含 'name', 'tags', 'clean_name' 等信息的字典
 all_directories_info = {}
 
-def collect_all_subdirs(root_path):
+# 生成器自身数据 (搜索索引等) 存放在根目录下的这个目录中，扫描时跳过
+SITE_DIR_NAME = '.mangapages'
+# 支持的图片扩展名
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tiff'}
+# gitignore 风格的忽略规则文件，对所在目录及其下所有目录生效，被忽略的目录不会被扫描
+IGNORE_FILE_NAME = '.mangaignore'
+# 作为虚拟目录处理的压缩包扩展名 (只读取中央目录，页面和图片由内置服务器提供)
+ARCHIVE_EXTENSIONS = {'.cbz', '.zip'}
+# 搜索索引按去掉标签后的名称建立字符 n-gram 倒排表，这是 n 的值
+SEARCH_NGRAM = 2
+# 全局搜索索引文件 (相对于根目录)
+SEARCH_INDEX_FILE = 'search.json'
+# 目录数超过这个值时，按一级目录把搜索索引拆分成多个分片文件
+SEARCH_INDEX_SHARD_SIZE = 5000
+# 目录库 (相对于 SITE_DIR_NAME)：SQLite 数据库，以目录路径为键保存扫描清单
+# (上一次运行的目录 mtime、文件列表、图片元数据和页面签名)，以及统计查询用的图片数、大小和标签
+CATALOG_FILE = 'catalog.sqlite'
+# 目录库格式版本，只在表结构或清单记录的结构变化时增加 (页面模板的变化由 GENERATOR_VERSION 处理)
+CATALOG_VERSION = 1
+# 旧版本的 JSON 扫描清单，没有目录库时读取一次，之后由目录库代替
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 2
+# stats 命令默认列出的项数 (dupes 命令列出的重复组数也使用它)
+STATS_TOP = 20
+# 查找重复图片时先比较文件开头这么多字节的哈希，只有开头也相同的文件才读取全文
+DUPES_PARTIAL_BYTES = 64 * 1024
+# 缩略图缓存目录 (相对于 SITE_DIR_NAME)，文件名由原图内容的哈希决定
+THUMB_DIR_NAME = 'thumbs'
+# 缩略图默认宽度、格式、质量和缓存大小上限 (MB)
+THUMB_WIDTH = 800
+THUMB_FORMAT = 'webp'
+THUMB_QUALITY = 80
+THUMB_CACHE_SIZE_MB = 2048
+# 转码后的图片存放目录 (相对于 SITE_DIR_NAME)，文件按原图内容哈希命名
+DERIVED_DIR_NAME = 'derived'
+TRANSCODE_FORMAT = 'webp'
+TRANSCODE_QUALITY = 85
+# 总是转码的格式 (浏览器不支持或体积过大)；PNG 只有超过 TRANSCODE_PNG_MIN_MB 时才转码
+TRANSCODE_EXTENSIONS = {'.bmp', '.tiff'}
+TRANSCODE_PNG_MIN_MB = 4
+# WebP 的最大边长，更大的图片改用 JPEG
+WEBP_MAX_SIZE = 16383
+# 响应式图片 (srcset) 的宽度档位和存放目录 (相对于 SITE_DIR_NAME)，文件按原图内容哈希和宽度命名
+VARIANT_DIR_NAME = 'variants'
+SRCSET_WIDTHS = (480, 1080, 2160)
+VARIANT_FORMAT = 'webp'
+VARIANT_QUALITY = 82
+# 流式写入页面时每次编码、比较和写入的块大小 (字符数)
+PAGE_WRITE_BUFFER = 64 * 1024
+# 并行生成时每个任务包含的最多页面数 (同一个一级目录下的页面尽量放在同一个任务里)
+PAGES_PER_TASK = 200
+# 双页视图默认向后预读的跨页数
+PREFETCH_SPREADS = 2
+# 启用虚拟滚动时，图片数达到这个值的目录只渲染视口附近的图片
+VIRTUAL_SCROLL_MIN_IMAGES = 200
+# 离线缓存的 service worker 脚本 (放在根目录，作用范围才能覆盖整个站点)、默认存储上限 (MB)，
+# 以及已缓存的页面多久之后在后台重新验证 (秒)
+SERVICE_WORKER_NAME = 'mangapages-sw.js'
+OFFLINE_CACHE_MB = 1024
+OFFLINE_REVALIDATE_SECONDS = 3600
+# 单页应用模式下每个目录中的数据文件名
+SPA_MANIFEST_NAME = 'manifest.json'
+# 内置服务器默认的监听地址、端口和工作线程数
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8000
+SERVE_WORKERS = 16
+# 这些类型的响应在客户端支持时使用 gzip 压缩
+COMPRESSIBLE_TYPES = {'text/html', 'application/json', 'text/css', 'text/javascript', 'application/javascript'}
+# 小于这个字节数的响应不压缩；压缩结果在内存中最多缓存这么多份
+GZIP_MIN_SIZE = 1024
+GZIP_CACHE_ENTRIES = 256
+# 服务器保持打开的压缩包数量
+ARCHIVE_CACHE_ENTRIES = 32
+# 数据目录中以内容哈希命名、可以被永久缓存的文件
+IMMUTABLE_ASSET_PATTERN = re.compile(r'^[a-z]+\.[0-9a-f]{10}\.(?:css|js)$|^(?:' + THUMB_DIR_NAME + '|' + DERIVED_DIR_NAME + '|' + VARIANT_DIR_NAME + ')/')
+# 监视模式：事件停止这么多秒后开始更新，持续有事件时最多等待 WATCH_MAX_DELAY 秒
+WATCH_DEBOUNCE = 0.2
+WATCH_MAX_DELAY = 0.8
+# 没有 inotify 时轮询目录 mtime 的间隔 (秒)
+WATCH_POLL_INTERVAL = 0.5
+# 生成器版本：取脚本自身内容的哈希，模板改动后旧的页面签名自动失效
+try:
+    GENERATOR_VERSION = hashlib.sha1(Path(__file__).read_bytes()).hexdigest()[:12]
+except OSError:
+    GENERATOR_VERSION = 'unknown'
+
+# 影响页面内容的生成选项，计入页面签名，并随任务一起传给生成页面的子进程
+page_options = {
+    # 'pages': 每个目录一个完整的 index.html；'spa': 根目录一个阅读器 + 每个目录一个 manifest.json
+    'mode': 'pages',
+    'prefetch_spreads': PREFETCH_SPREADS,
+    # 图片数达到这个值的目录使用虚拟滚动视图，0 表示不使用
+    'virtual_scroll': 0,
+    # 离线缓存的存储上限 (MB)，0 表示不注册 service worker
+    'offline': 0,
+    # 页面输出到图片目录之外时原图根目录的地址 (以 / 结尾)：相对于输出根目录的路径或完整的 URL；
+    # 为空表示页面和图片在同一个目录，直接用文件名引用
+    'image_base': '',
+}
+
+# 页面、数据目录和 service worker 的输出位置，None 表示直接写入图片目录本身
+output_options = {
+    'dir': None,
+}
+
+# 影响目录模型的扫描选项，保存在扫描清单中，变化时清单中的文件列表全部重新读取
+scan_options = {
+    # 最多扫描到第几层目录 (根目录为第 0 层)，None 表示不限制
+    'max_depth': None,
+    # 只保留自身或下级目录中有图片的目录
+    'only_image_dirs': False,
+    # 是否进入指向目录的符号链接 (以及读取指向文件的符号链接)
+    'follow_symlinks': True,
+}
+
+# 每个目录生效的忽略规则：相对路径 -> (规则链, 规则链的哈希)，
+# 规则链是从根目录到这个目录的 ((规则文件所在目录, 规则列表), ...)
+ignore_chains = {}
+
+# 缓存目录 -> 其中已有文件的相对路径集合 (见 cache_listing)
+cache_listings = {}
+
+# 目录模型中每个物理目录 (设备号, inode) 对应的相对路径，用来发现符号链接造成的循环和重复目录
+directory_inodes = {}
+
+# 符号链接指向的重复目录 (不是上级目录)：相对路径 -> 同一个物理目录在模型中的路径。
+# 它们不再扫描，但父目录照常列出，链接指向模型中那个路径的页面
+directory_aliases = {}
+
+# --only-image-dirs 剪枝掉的目录 (整棵子树没有图片)：相对路径 -> 目录信息。
+# 监视模式仍然监视它们，新章节目录先建好、之后才放进图片时也能发现
+pruned_directories = {}
+
+def compile_ignore_pattern(line):
+    """
+    把忽略文件中的一行 (gitignore 语法) 编译为 (正则, 是否取反, 是否只匹配目录, 是否按完整路径匹配)。
+    空行和注释返回 None。不含 / 的模式在任意层级匹配名称，含 / 的模式相对于规则文件所在目录匹配路径。
+    """
+    line = line.rstrip('\n').rstrip('\r')
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    if not line or line.startswith('#'):
+        return None
+    negate = line.startswith('!')
+    if negate or line.startswith('\\'):
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    anchored = '/' in line
+    line = line.lstrip('/')
+    regex = ''
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if line.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        if line.startswith('/**', i) and i + 3 == len(line):
+            regex += '/.*'
+            break
+        if line.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[':
+            end = line.find(']', i + 2)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                body = line[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                regex += '[' + body.replace('\\', '\\\\') + ']'
+                i = end
+        elif c == '\\' and i + 1 < len(line):
+            i += 1
+            regex += re.escape(line[i])
+        else:
+            regex += re.escape(c)
+        i += 1
+    return re.compile(regex), negate, dir_only, anchored
+
+def load_ignore_chain(root_path_str, relative_path_str, has_ignore_file):
+    """
+    计算目录生效的忽略规则：父目录的规则链加上这个目录自己的忽略文件 (如果有)。
+    结果记录在 ignore_chains 中，返回 (规则链, 规则链的哈希, 本目录忽略文件的哈希)。
+    """
+    if relative_path_str == '.':
+        chain, key = (), ''
+    else:
+        parent = relative_path_str.rpartition('/')[0] or '.'
+        chain, key = ignore_chains.get(parent, ((), ''))
+    own_sig = None
+    if has_ignore_file:
+        ignore_path = os.path.join(root_path_str, relative_path_str, IGNORE_FILE_NAME)
+        try:
+            with open(ignore_path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            print(f"警告: 无法读取忽略文件 '{ignore_path}': {e}")
+            data = None
+        if data is not None:
+            own_sig = hashlib.sha1(data).hexdigest()
+            rules = [rule for rule in map(compile_ignore_pattern, data.decode('utf-8', 'replace').splitlines()) if rule]
+            if rules:
+                chain = chain + ((relative_path_str, rules),)
+            key = hashlib.sha1(f"{key}:{relative_path_str}:{own_sig}".encode('utf-8')).hexdigest()
+    ignore_chains[relative_path_str] = (chain, key)
+    return chain, key, own_sig
+
+def is_ignored(chain, relative_path_str, name, is_dir):
+    """按规则链判断目录中的一项是否被忽略：规则按顺序匹配，最后一条匹配的规则生效"""
+    ignored = False
+    full_path = child_path(relative_path_str, name)
+    for base, rules in chain:
+        path = full_path if base == '.' else full_path[len(base) + 1:]
+        for regex, negate, dir_only, anchored in rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path if anchored else name):
+                ignored = not negate
+    return ignored
+
+def scan_directory(root_path_str, relative_path_str, cached=None):
+    """
+    扫描单个目录，返回它的目录信息 (不递归)，无法访问时返回 None。
+    cached 是清单中这个目录上一次的记录，目录 mtime 没变时直接复用其中的列表。
+    """
+    current_path = os.path.join(root_path_str, relative_path_str)
+    try:
+        st = os.stat(current_path)
+    except OSError as e:
+        print(f"警告: 无法读取目录 '{current_path}': {e}")
+        return None
+    mtime = st.st_mtime_ns
+    # 普通文件只可能是作为虚拟目录的压缩包
+    is_archive = stat.S_ISREG(st.st_mode)
+    if cached and cached.get('mtime') == mtime and not is_archive:
+        # 忽略文件被原地修改时目录 mtime 不变，重新读取忽略文件检查生效的规则有没有变化
+        own_sig, key = cached.get('ignore') or (None, '')
+        if load_ignore_chain(root_path_str, relative_path_str, own_sig is not None)[1] != key:
+            cached = dict(cached, mtime=None)
+    if cached and cached.get('mtime') == mtime:
+        # 目录内容没有增删，沿用清单中的列表，不需要再列目录
+        info = make_directory_info(relative_path_str)
+        info['images'] = cached['images']
+        info['subdirs'] = cached['subdirs']
+        info['mtime'] = mtime
+        info['has_index'] = True
+        info['page_key'] = cached.get('page')
+        info['image_meta'] = cached.get('meta', {})
+        info['archive'] = is_archive
+        info['rescanned'] = False
+        info['inode'] = (st.st_dev, st.st_ino)
+        if cached.get('ignore'):
+            info['ignore'] = cached['ignore']
+        if cached.get('links'):
+            info['links'] = cached['links']
+        return info
+    if is_archive:
+        info = scan_archive(current_path, relative_path_str, mtime, cached)
+        if info is not None:
+            info['inode'] = (st.st_dev, st.st_ino)
+        return info
+
+    try:
+        with os.scandir(current_path) as it:
+            entries = list(it)
+    except PermissionError:
+        print(f"警告: 无法访问目录 '{current_path}' (权限不足).")
+        return None
+    except OSError as e:
+        print(f"警告: 无法读取目录 '{current_path}': {e}")
+        return None
+
+    images = []
+    subdirs = []
+    links = []
+    has_index = False
+
+    output_name = output_file_name()
+    chain, key, own_sig = load_ignore_chain(root_path_str, relative_path_str,
+                                            any(entry.name == IGNORE_FILE_NAME for entry in entries))
+    # 达到最大深度的目录不再列出子目录
+    max_depth = scan_options['max_depth']
+    depth = 0 if relative_path_str == '.' else relative_path_str.count('/') + 1
+    at_max_depth = max_depth is not None and depth >= max_depth
+    follow_symlinks = scan_options['follow_symlinks']
+    for entry in entries:
+        if entry.name == output_name:
+            has_index = True
+        # 点文件背景图片/目录不显示
+        if entry.name.startswith('.dotfile_background'):
+            continue
+        # DirEntry 的类型信息来自目录列表本身，通常不需要额外的 stat
+        try:
+            is_link = entry.is_symlink()
+            if is_link and not follow_symlinks:
+                # 不跟随符号链接时跳过，只记下名称以便报告
+                links.append(entry.name)
+                continue
+            is_dir = entry.is_dir()
+        except OSError:
+            continue
+        if is_dir:
+            if relative_path_str == '.' and entry.name == SITE_DIR_NAME:
+                continue
+            # 被忽略的目录在这里剪掉，不会被扫描
+            if at_max_depth or (chain and is_ignored(chain, relative_path_str, entry.name, True)):
+                continue
+            subdirs.append(entry.name) # 不再忽略隐藏目录，但不在面包屑中显示
+            if is_link:
+                links.append(entry.name)
+            continue
+        ext = os.path.splitext(entry.name)[1].lower()
+        if ext not in IMAGE_EXTENSIONS and ext not in ARCHIVE_EXTENSIONS:
+            continue
+        if chain and is_ignored(chain, relative_path_str, entry.name, False):
+            continue
+        if ext in IMAGE_EXTENSIONS and entry.is_file():
+            images.append(entry.name)
+        elif not at_max_depth and entry.is_file():
+            subdirs.append(entry.name) # 压缩包作为虚拟子目录
+            if is_link:
+                links.append(entry.name)
+
+    # 对文件和目录进行排序
+    images.sort(key=str.lower)
+    subdirs.sort(key=str.lower)
+
+    # 保存当前目录信息
+    info = make_directory_info(relative_path_str)
+    info['images'] = images
+    info['subdirs'] = subdirs
+    info['mtime'] = mtime
+    info['has_index'] = has_index
+    info['page_key'] = cached.get('page') if cached else None
+    info['image_meta'] = cached.get('meta', {}) if cached else {}
+    info['archive'] = False
+    info['rescanned'] = True
+    info['inode'] = (st.st_dev, st.st_ino)
+    if key:
+        info['ignore'] = [own_sig, key]
+    if links:
+        links.sort(key=str.lower)
+        info['links'] = links
+    return info
+
+def scan_archive(archive_path, relative_path_str, mtime, cached=None):
     """
-    递归收集所有子目录信息，用于全局搜索。
-    填充全局字典 all_directories_info。
+    把压缩包当作虚拟目录扫描：zipfile 只读取文件末尾的中央目录，不读取任何成员数据。
+    成员的大小和 CRC 与清单中的记录相同时沿用已经读到的宽高。
+    """
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            members = zf.infolist()
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"警告: 无法读取压缩包 '{archive_path}': {e}")
+        return None
+    old_meta = cached.get('meta', {}) if cached else {}
+    image_meta = {}
+    for member in members:
+        name = member.filename
+        # 跳过目录、加密成员以及 macOS 打包时附带的资源文件
+        if member.is_dir() or member.flag_bits & 0x1 or name.startswith('__MACOSX/'):
+            continue
+        if posixpath.basename(name).startswith('.') or os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        entry = old_meta.get(name)
+        if not entry or entry.get('size') != member.file_size or entry.get('crc') != member.CRC:
+            entry = {'size': member.file_size, 'crc': member.CRC}
+        image_meta[name] = entry
+    images = sorted(image_meta, key=str.lower)
+
+    info = make_directory_info(relative_path_str)
+    info['images'] = images
+    info['subdirs'] = []
+    info['mtime'] = mtime
+    info['has_index'] = False
+    info['page_key'] = cached.get('page') if cached else None
+    info['image_meta'] = {img: image_meta[img] for img in images}
+    info['archive'] = True
+    info['rescanned'] = True
+    return info
+
+def child_path(relative_path_str, name):
+    """子目录相对于根目录的路径"""
+    return name if relative_path_str == '.' else f"{relative_path_str}/{name}"
+
+def register_directory(relative_path_str, info):
+    """
+    记录目录对应的物理目录 (设备号, inode)。
+    同一个物理目录已经以另一个路径出现在目录模型中时不记录，返回那个路径；否则返回 None。
+    """
+    inode = info.get('inode')
+    if not inode or not inode[1]:
+        # 有些文件系统不提供 inode，无法判断
+        return None
+    other = directory_inodes.get(inode)
+    if other is not None and other != relative_path_str and other in all_directories_info:
+        return other
+    directory_inodes[inode] = relative_path_str
+    return None
+
+def collect_all_subdirs(root_path, manifest_dirs=None):
+    """
+    用 os.scandir 遍历一次整个目录树，建立内存中的目录模型。
+    填充全局字典 all_directories_info：除搜索用的信息外，
+    每个目录还记录它的图片文件 ('images') 和子目录 ('subdirs')，
+    页面生成直接使用这些信息，不再重新遍历或逐项 stat。
+    manifest_dirs 是上一次运行的清单，目录 mtime 没变时直接复用其中的文件列表。
+
+    遍历使用显式的栈 (先序、按名称排序，和递归的顺序相同)，目录树再深也不会超出递归深度。
+    符号链接指向的目录放到所有真实目录之后再扫描，这样同一个物理目录总是以它在树中的真实路径出现；
+    指回上级目录的循环会被跳过，并从父目录的子目录列表中去掉；
+    重复出现的物理目录不再扫描，父目录中的链接指向它在模型中的路径 (见 directory_aliases)。
+    返回跳过的 [(相对路径, 原因), ...]。
     """
     global all_directories_info
     all_directories_info = {} # 重置字典
+    ignore_chains.clear()
+    directory_inodes.clear()
+    directory_aliases.clear()
+    pruned_directories.clear()
+    manifest_dirs = manifest_dirs or {}
+    root_path_str = os.fspath(root_path)
+    skipped = []
 
-    def _scan_dir(current_path, relative_base=Path('.')):
+    stack = ['.']
+    linked = deque()
+    while stack or linked:
+        relative_path_str = stack.pop() if stack else linked.popleft()
+        info = scan_directory(root_path_str, relative_path_str, manifest_dirs.get(relative_path_str))
+        if info is None:
+            skipped.append((relative_path_str, "无法读取"))
+            continue
+        other = register_directory(relative_path_str, info)
+        if other is not None:
+            skipped.append(alias_directory(relative_path_str, other))
+            continue
+        all_directories_info[relative_path_str] = info
+        links = set(info.get('links', ()))
+        for subdir in info['subdirs']:
+            if subdir in links:
+                linked.append(child_path(relative_path_str, subdir))
+        # 倒序入栈，出栈时按名称顺序扫描
+        stack.extend(child_path(relative_path_str, subdir)
+                     for subdir in reversed(info['subdirs']) if subdir not in links)
+        if not scan_options['follow_symlinks']:
+            skipped.extend((child_path(relative_path_str, name), "符号链接 (未跟随)") for name in links)
+
+    drop_unscanned_subdirs(all_directories_info)
+    return skipped
+
+def alias_directory(relative_path_str, other):
+    """
+    处理和模型中的目录 other 是同一个物理目录的 relative_path_str：
+    other 是它的上级目录时是循环，跳过；否则记为 other 的别名，父目录中仍然列出。返回报告用的 (路径, 原因)。
+    """
+    if other == '.' or relative_path_str.startswith(other + '/'):
+        return relative_path_str, f"指回上级目录 '{other}' (循环)"
+    directory_aliases[relative_path_str] = other
+    return relative_path_str, f"与 '{other}' 是同一个目录 (链接到 '{other}' 的页面)"
+
+def drop_unscanned_subdirs(paths):
+    """
+    从这些目录的子目录列表中去掉不在目录模型中的子目录 (无法读取的目录和循环)，
+    别名目录保留，记在 'aliases' ({子目录名: 模型中的路径}) 中。
+    去掉之前的列表记在 'scanned_subdirs' 中，和剪枝一样写入清单，以后恢复时还能被发现。
+    """
+    for relative_path_str in paths:
+        info = all_directories_info.get(relative_path_str)
+        if info is None:
+            continue
+        aliases = {}
+        kept = []
+        for subdir in info['subdirs']:
+            path = child_path(relative_path_str, subdir)
+            if path in directory_aliases:
+                aliases[subdir] = directory_aliases[path]
+            elif path not in all_directories_info:
+                continue
+            kept.append(subdir)
+        if aliases:
+            info['aliases'] = aliases
+        else:
+            info.pop('aliases', None)
+        if len(kept) != len(info['subdirs']):
+            info.setdefault('scanned_subdirs', info['subdirs'])
+            info['subdirs'] = kept
+
+def report_skipped(skipped, limit=10):
+    """打印遍历时跳过的目录，最多列出 limit 项"""
+    if not skipped:
+        return
+    print(f"警告: 扫描时跳过了 {len(skipped)} 项:")
+    for relative_path_str, reason in skipped[:limit]:
+        print(f"  {relative_path_str}: {reason}")
+    if len(skipped) > limit:
+        print(f"  ... 还有 {len(skipped) - limit} 项")
+
+def prune_empty_directories():
+    """
+    只保留有图片的目录：从目录模型中删除整棵子树都没有图片的目录 (根目录总是保留)，
+    并从父目录的子目录列表中去掉它们。剪枝前的列表记在 'scanned_subdirs' 中，
+    删除的目录信息移到 pruned_directories。
+    返回子目录列表被修改过的目录。
+    """
+    modified = []
+    has_images = {}
+    # 先处理深层目录，父目录根据子目录的结果判断；别名目录按它指向的目录判断，
+    # 指向的目录可能在别处更浅的位置，有别名时重复计算直到结果不再变化
+    order = sorted(all_directories_info, key=lambda p: 0 if p == '.' else p.count('/') + 1, reverse=True)
+
+    def _kept(relative_path_str, subdirs):
+        return [subdir for subdir in subdirs if has_images.get(
+            directory_aliases.get(child_path(relative_path_str, subdir), child_path(relative_path_str, subdir)))]
+
+    while True:
+        previous = dict(has_images)
+        for relative_path_str in order:
+            info = all_directories_info[relative_path_str]
+            has_images[relative_path_str] = bool(info['images']) or bool(
+                _kept(relative_path_str, info.get('scanned_subdirs', info['subdirs'])))
+        if not directory_aliases or has_images == previous:
+            break
+    for relative_path_str in order:
+        info = all_directories_info[relative_path_str]
+        subdirs = info.get('scanned_subdirs', info['subdirs'])
+        kept = _kept(relative_path_str, subdirs)
+        if info.get('aliases'):
+            info['aliases'] = {subdir: path for subdir, path in info['aliases'].items() if subdir in kept}
+        if len(kept) != len(subdirs):
+            info['scanned_subdirs'] = subdirs
+        else:
+            info.pop('scanned_subdirs', None)
+        if kept != info['subdirs']:
+            info['subdirs'] = kept
+            modified.append(relative_path_str)
+    for relative_path_str, keep in has_images.items():
+        if not keep and relative_path_str != '.':
+            pruned_directories[relative_path_str] = all_directories_info.pop(relative_path_str)
+    return [path for path in modified if path in all_directories_info]
+
+def restore_pruned_directories():
+    """把剪枝掉的目录放回目录模型 (重新扫描之后再用 prune_empty_directories 剪枝)"""
+    all_directories_info.update(pruned_directories)
+    pruned_directories.clear()
+
+def rescan_directory(root_path_str, relative_path_str, force=False):
+    """
+    重新扫描目录模型中的一个目录，目录 mtime 没变且 force 为 False 时什么也不做。
+    消失的子目录连同其下所有目录从模型中删除，新出现的子目录递归扫描加入模型。
+    返回 (重新扫描过的目录列表, 目录集合是否变化)；目录本身不存在了时也会从模型中删除。
+    """
+    old_info = all_directories_info.get(relative_path_str)
+    cached = manifest_entry(old_info) if old_info else None
+    if cached and force:
+        # 文件内容被覆盖时目录 mtime 不变，强制重新列目录并检查每张图片
+        cached['mtime'] = None
+    info = scan_directory(root_path_str, relative_path_str, cached)
+    if info is None:
+        remove_subtree(relative_path_str)
+        return [], old_info is not None
+    if old_info is not None and not info['rescanned']:
+        return [], False
+    if register_directory(relative_path_str, info) is not None:
+        # 现在和模型中的另一个目录是同一个物理目录 (例如被替换成了符号链接)
+        remove_subtree(relative_path_str)
+        return [], old_info is not None
+    all_directories_info[relative_path_str] = info
+    changed = [relative_path_str]
+    # 压缩包被原地覆盖时所在目录的 mtime 不变，随目录一起检查
+    for subdir in info['subdirs']:
+        sub_info = all_directories_info.get(child_path(relative_path_str, subdir))
+        if sub_info is not None and sub_info['archive']:
+            changed.extend(rescan_directory(root_path_str, child_path(relative_path_str, subdir))[0])
+    old_subdirs = set(old_info.get('scanned_subdirs', old_info['subdirs'])) if old_info else set()
+    if old_info is not None and (old_info.get('ignore') or [None, ''])[1] != (info.get('ignore') or [None, ''])[1]:
+        # 生效的忽略规则变了，下面所有目录都要按新规则重新扫描
+        for subdir in old_subdirs:
+            remove_subtree(child_path(relative_path_str, subdir))
+        old_subdirs = set()
+    elif old_info is not None and old_subdirs == set(info['subdirs']):
+        drop_unscanned_subdirs(changed)
+        return changed, False
+    for subdir in old_subdirs - set(info['subdirs']):
+        remove_subtree(child_path(relative_path_str, subdir))
+    pending = [child_path(relative_path_str, subdir) for subdir in info['subdirs']
+               if child_path(relative_path_str, subdir) not in all_directories_info]
+    skipped = []
+    while pending:
+        path = pending.pop()
+        sub_info = scan_directory(root_path_str, path)
+        if sub_info is None:
+            continue
+        # 新出现的符号链接可能指回上级目录，已经在模型中的物理目录不再扫描
+        other = register_directory(path, sub_info)
+        if other is not None:
+            skipped.append(alias_directory(path, other))
+            continue
+        all_directories_info[path] = sub_info
+        changed.append(path)
+        pending.extend(child_path(path, subdir) for subdir in sub_info['subdirs'])
+    drop_unscanned_subdirs(changed)
+    report_skipped(skipped)
+    return changed, True
+
+def remove_subtree(relative_path_str):
+    """从目录模型中删除一个目录和它下面的所有目录 (以及其中的和指向其中的别名、剪枝掉的目录)"""
+    prefix = relative_path_str + '/'
+    for path in [p for p in pruned_directories if p == relative_path_str or p.startswith(prefix)]:
+        inode = pruned_directories.pop(path).get('inode')
+        if directory_inodes.get(inode) == path:
+            del directory_inodes[inode]
+    for path in [p for p in all_directories_info if p == relative_path_str or p.startswith(prefix)]:
+        inode = all_directories_info.pop(path).get('inode')
+        if directory_inodes.get(inode) == path:
+            del directory_inodes[inode]
+    for path, target in list(directory_aliases.items()):
+        if any(p == relative_path_str or p.startswith(prefix) for p in (path, target)):
+            del directory_aliases[path]
+
+def site_root(root_path):
+    """页面、数据目录和 service worker 所在的根目录：指定了输出目录时为输出目录，否则为图片根目录"""
+    return Path(output_options['dir']) if output_options['dir'] else Path(root_path)
+
+def output_file_name():
+    """当前生成模式下每个目录要写入的文件名"""
+    return SPA_MANIFEST_NAME if page_options['mode'] == 'spa' else 'index.html'
+
+def folder_label(dir_name):
+    """子目录在目录网格中显示的名称 (去掉标签，隐藏目录前加点)"""
+    display_name = re.sub(r'\[\[([^\]]+)\]\]', '', dir_name).strip()  # 移除标签
+    if display_name.startswith('.'):
+        display_name = f"·{display_name[1:]}"  # 隐藏目录前加点
+    elif not display_name:
+        display_name = dir_name  # 如果移除标签后为空，显示原名
+    return display_name
+
+def make_directory_info(relative_path_str):
+    """根据相对路径生成目录的搜索信息 (名称、去掉标签后的名称、标签)"""
+    display_name = relative_path_str if relative_path_str != '.' else "根目录"
+
+    # 提取标签
+    tags = re.findall(r'\[\[([^\]]+)\]\]', display_name)
+    clean_name = re.sub(r'\[\[([^\]]+)\]\]', '', display_name).strip()
+    if clean_name.startswith('.'):
+        clean_name = f"·{clean_name[1:]}"
+    elif not clean_name:
+        clean_name = display_name
+
+    return {
+        'name': display_name,
+        'clean_name': clean_name,
+        'full_path': relative_path_str, # 存储完整相对路径
+        'tags': tags
+    }
+
+def page_signature(relative_path_str):
+    """
+    计算一个页面的输入签名。页面内容只取决于生成器版本、目录路径
+    (标题、面包屑)、生成选项、图片列表及宽高、子目录列表 (含标签和别名)、使用的缩略图、转码图片及响应式图片
+    和下一章的路径，签名相同就不必重新生成。
+    """
+    info = all_directories_info[relative_path_str]
+    meta = info['image_meta']
+    sizes = [[meta.get(img, {}).get('width'), meta.get(img, {}).get('height')] for img in info['images']]
+    payload = json.dumps([GENERATOR_VERSION, page_options, relative_path_str, info['images'], sizes,
+                          info['subdirs'], info.get('aliases', {}), info.get('thumbs', {}), info.get('derived', {}),
+                          info.get('variants', {}), info.get('next')],
+                         ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def link_chapters(paths):
+    """
+    为 paths 中的目录找出 "下一章"：同一父目录下按顺序排在它后面的第一个可见子目录，
+    写入目录信息的 'next' (没有时为 None)。离线缓存在读到本章末尾时预先缓存下一章。
+    """
+    positions = {}
+    for relative_path_str in paths:
+        info = all_directories_info[relative_path_str]
+        info['next'] = None
+        if relative_path_str == '.':
+            continue
+        parent, _, name = relative_path_str.rpartition('/')
+        parent = parent or '.'
+        parent_info = all_directories_info.get(parent)
+        if parent_info is None:
+            continue
+        if parent not in positions:
+            # 别名目录的页面在别处，不作为下一章
+            aliases = parent_info.get('aliases', {})
+            siblings = [dir_name for dir_name in parent_info['subdirs']
+                        if not dir_name.startswith('.') and dir_name not in aliases]
+            positions[parent] = (siblings, {dir_name: i for i, dir_name in enumerate(siblings)})
+        siblings, index = positions[parent]
+        i = index.get(name)
+        if i is not None and i + 1 < len(siblings):
+            info['next'] = child_path(parent, siblings[i + 1])
+
+def write_if_changed(file_path, content):
+    """
+    只有当内容和磁盘上已有的文件不同时才写入，返回是否写入。
+    写入是原子的 (临时文件 + os.replace)。写入失败时打印错误并返回 False。
+    """
+    data = content.encode('utf-8')
+    try:
+        with open(file_path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+    # 先写临时文件再改名，读取方 (浏览器、服务器) 不会看到写了一半的文件
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+    except Exception as e:
+        print(f"错误: 无法写入文件 '{file_path}': {e}")
         try:
-            items = list(current_path.iterdir())
-        except PermissionError:
-            print(f"警告: 无法访问目录 '{current_path}' (权限不足).")
-            return
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
 
-        subdirs = []
-
-        for item in items:
-            if item.is_dir() and not item.name.startswith('.dotfile_background'):
-                subdirs.append(item.name)
-
-        # 保存当前目录信息
-        relative_path_str = relative_base.as_posix() # 转换为字符串路径
-        display_name = relative_path_str if relative_path_str != '.' else "根目录"
-
-        # 提取标签
-        tags = re.findall(r'\[\[([^\]]+)\]\]', display_name)
-        clean_name = re.sub(r'\[\[([^\]]+)\]\]', '', display_name).strip()
-        if clean_name.startswith('.'):
-            clean_name = f"·{clean_name[1:]}"
-        elif not clean_name:
-            clean_name = display_name
-
-        all_directories_info[relative_path_str] = {
-            'name': display_name,
-            'clean_name': clean_name,
-            'full_path': relative_path_str, # 存储完整相对路径
-            'tags': tags
-        }
+def encode_chunks(chunks, size=PAGE_WRITE_BUFFER):
+    """把字符串片段攒到至少 size 个字符再编码为 UTF-8，减少逐段比较和写入的次数"""
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= size:
+            yield ''.join(pending).encode('utf-8')
+            pending = []
+            pending_size = 0
+    if pending:
+        yield ''.join(pending).encode('utf-8')
+
+def write_chunks_if_changed(file_path, chunks):
+    """
+    流式版本的 write_if_changed：chunks 是按顺序生成的字符串片段，整个文件不需要同时放在内存中。
+    生成的内容边和已有文件逐块比较，出现不同后才开始写临时文件 (相同的前缀从旧文件复制)，
+    内容完全相同时不写入也不创建临时文件。返回是否写入，写入失败时打印错误并返回 False。
+    """
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    old = out = None
+    matched = 0
 
-        # 递归扫描子目录
-        for subdir in subdirs:
-            subdir_path = current_path / subdir
-            new_relative_base = relative_base / subdir
-            _scan_dir(subdir_path, new_relative_base)
+    def _open_output():
+        f = open(tmp_path, 'wb')
+        if matched:
+            old.seek(0)
+            remaining = matched
+            while remaining:
+                data = old.read(min(remaining, 1024 * 1024))
+                if not data:
+                    raise OSError(f"文件 '{file_path}' 在比较过程中被截断")
+                f.write(data)
+                remaining -= len(data)
+        return f
 
-    _scan_dir(root_path)
+    try:
+        try:
+            old = open(file_path, 'rb')
+        except OSError:
+            pass
+        for block in encode_chunks(chunks):
+            if out is None and old is not None and old.read(len(block)) == block:
+                matched += len(block)
+                continue
+            if out is None:
+                out = _open_output()
+            out.write(block)
+        if out is None:
+            if old is not None and not old.read(1):
+                return False
+            # 旧文件比新内容长 (或不存在)
+            out = _open_output()
+        out.close()
+        os.replace(tmp_path, file_path)
+    except Exception as e:
+        print(f"错误: 无法写入文件 '{file_path}': {e}")
+        if out is not None:
+            out.close()
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        return False
+    finally:
+        if old is not None:
+            old.close()
+    return True
+
+# 目录库的表：meta 保存格式版本、生成器版本和扫描选项；dirs 每个目录一行，entry 是清单记录 (JSON)，
+# digest 是它的哈希，保存时只改写变化的行；tags 是每个目录 (含上级目录名中) 的标签
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER,
+    digest TEXT NOT NULL,
+    entry TEXT NOT NULL,
+    series TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    image_count INTEGER NOT NULL,
+    image_bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tags (path TEXT NOT NULL, tag TEXT NOT NULL, PRIMARY KEY (path, tag));
+CREATE INDEX IF NOT EXISTS tags_by_tag ON tags (tag);
+"""
 
-def generate_index_html(directory_path):
+def catalog_path(root_path):
+    """目录库文件的路径"""
+    return site_root(root_path) / SITE_DIR_NAME / CATALOG_FILE
+
+def load_manifest(root_path):
     """
-    为给定目录生成 index.html 文件。
-    包含该目录下的所有支持的图片和子目录链接。
-    递归处理所有子目录。
+    从目录库读取上一次运行的扫描清单 ({相对路径: 清单记录})。
+    没有目录库时读取旧版本的 JSON 清单；版本不同或文件损坏时返回空清单。
     """
-    directory_path = Path(directory_path).resolve()
-    root_path = Path.cwd().resolve()
-    # 支持的图片扩展名
-    image_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tiff'}
-    # 获取目录内容
+    path = catalog_path(root_path)
+    if not path.exists():
+        return load_legacy_manifest(root_path)
     try:
-        items = list(directory_path.iterdir())
-    except PermissionError:
-        print(f"警告: 无法访问目录 '{directory_path}' (权限不足).")
+        with contextlib.closing(sqlite3.connect(path)) as db:
+            meta = dict(db.execute('SELECT key, value FROM meta'))
+            if meta.get('version') != str(CATALOG_VERSION):
+                return {}
+            dirs = {relative_path_str: json.loads(entry)
+                    for relative_path_str, entry in db.execute('SELECT path, entry FROM dirs')}
+            scan = json.loads(meta.get('scan', 'null'))
+    except (sqlite3.Error, ValueError) as e:
+        # 损坏的目录库删除后在这次运行结束时重新创建
+        print(f"警告: 无法读取目录库 '{path}'，将重新创建: {e}")
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        return {}
+    if scan != scan_options:
+        # 扫描选项变了，清单中的文件列表不再可信，全部重新列目录 (图片元数据仍然可以复用)
+        for entry in dirs.values():
+            entry['mtime'] = None
+    return dirs
+
+def load_legacy_manifest(root_path):
+    """读取旧版本的 JSON 扫描清单 (升级后第一次运行时使用)"""
+    manifest_path = site_root(root_path) / SITE_DIR_NAME / MANIFEST_FILE
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    dirs = manifest.get('dirs', {})
+    if manifest.get('scan') != scan_options:
+        for entry in dirs.values():
+            entry['mtime'] = None
+    return dirs
+
+def manifest_entry(info):
+    """目录信息在扫描清单中的记录，也可以作为 scan_directory 的 cached 参数"""
+    entry = {
+        'mtime': info['mtime'],
+        'images': info['images'],
+        # 只保留有图片的目录时记录剪枝前的子目录列表，子目录以后有了图片也能被发现
+        'subdirs': info.get('scanned_subdirs', info['subdirs']),
+        'meta': info['image_meta'],
+        'page': info['page_key'],
+    }
+    if info.get('ignore'):
+        entry['ignore'] = info['ignore']
+    if info.get('links'):
+        entry['links'] = info['links']
+    return entry
+
+def save_manifest(root_path):
+    """
+    把当前的目录模型 (mtime、文件列表、图片元数据、页面签名) 保存到目录库。
+    只改写记录有变化的目录，删除已经不在模型中的目录，整个更新在一个事务中完成。
+    """
+    path = catalog_path(root_path)
+    rows = []
+    for relative_path_str, info in all_directories_info.items():
+        entry = json.dumps(manifest_entry(info), ensure_ascii=False, separators=(',', ':'))
+        rows.append((relative_path_str, entry, hashlib.sha1(entry.encode('utf-8')).hexdigest()))
+    try:
+        with contextlib.closing(sqlite3.connect(path)) as db:
+            db.executescript(CATALOG_SCHEMA)
+            with db:
+                if db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone() != (str(CATALOG_VERSION),):
+                    db.execute('DELETE FROM dirs')
+                    db.execute('DELETE FROM tags')
+                stored = dict(db.execute('SELECT path, digest FROM dirs'))
+                for relative_path_str, entry, digest in rows:
+                    if stored.pop(relative_path_str, None) == digest:
+                        continue
+                    info = all_directories_info[relative_path_str]
+                    parts = relative_path_str.split('/') if relative_path_str != '.' else []
+                    image_bytes = sum(meta.get('size') or 0 for meta in info['image_meta'].values())
+                    db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (relative_path_str, info['mtime'], digest, entry, parts[0] if parts else '.',
+                                len(parts), len(info['images']), image_bytes))
+                    db.execute('DELETE FROM tags WHERE path = ?', (relative_path_str,))
+                    db.executemany('INSERT OR IGNORE INTO tags VALUES (?, ?)',
+                                   [(relative_path_str, tag) for tag in info['tags']])
+                db.executemany('DELETE FROM dirs WHERE path = ?', [(p,) for p in stored])
+                db.executemany('DELETE FROM tags WHERE path = ?', [(p,) for p in stored])
+                db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', [
+                    ('version', str(CATALOG_VERSION)),
+                    ('generator', GENERATOR_VERSION),
+                    ('scan', json.dumps(scan_options)),
+                    ('updated', str(int(time.time()))),
+                ])
+    except sqlite3.Error as e:
+        print(f"错误: 无法写入目录库 '{path}': {e}")
         return
-    # 分离图片文件和子目录
-    image_files = []
-    subdirectories = []
-    for item in items:
-        if item.is_file() and item.suffix.lower() in image_extensions:
-            # 隐藏点文件背景图片
-            if not item.name.startswith('.dotfile_background'):
-                image_files.append(item.name)
-        elif item.is_dir(): # 不再忽略隐藏目录，但不在面包屑中显示
-            subdirectories.append(item.name)
-    # 对文件和目录进行排序
-    image_files.sort(key=str.lower)
-    subdirectories.sort(key=str.lower)
-    # 提取目录标签
+    # 旧版本的 JSON 清单已经由目录库代替
+    try:
+        (site_root(root_path) / SITE_DIR_NAME / MANIFEST_FILE).unlink()
+    except OSError:
+        pass
+
+def probe_image_size(file_path):
+    """
+    只读取文件头获取图片的宽高，不解码像素。
+    支持 PNG、JPEG、WebP、GIF、BMP 和 TIFF，无法识别时返回 None。
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            return probe_image_stream(f)
+    except OSError:
+        return None
+
+def probe_image_stream(f):
+    """probe_image_size 的实现，f 是任何可读、可向前 seek 的二进制文件对象 (包括压缩包成员)"""
+    try:
+        head = f.read(32)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+            return struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', head[6:10])
+        if head.startswith(b'BM') and len(head) >= 26:
+            width, height = struct.unpack('<ii', head[18:26])
+            return width, abs(height)
+        if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+            chunk = head[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', head[26:30])
+                return width & 0x3fff, height & 0x3fff
+            if chunk == b'VP8L':
+                bits = int.from_bytes(head[21:25], 'little')
+                return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+            if chunk == b'VP8X':
+                return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+            return None
+        if head[:4] in (b'II*\x00', b'MM\x00*'):
+            # TIFF：在第一个 IFD 中查找 ImageWidth (256) 和 ImageLength (257)
+            endian = '<' if head[:2] == b'II' else '>'
+            f.seek(struct.unpack(endian + 'I', head[4:8])[0])
+            count = struct.unpack(endian + 'H', f.read(2))[0]
+            dims = {}
+            for _ in range(count):
+                tag, field_type, _, value = struct.unpack(endian + 'HHI4s', f.read(12))
+                if tag in (256, 257):
+                    # SHORT (3) 或 LONG (4)
+                    dims[tag] = struct.unpack(endian + 'H', value[:2])[0] if field_type == 3 else struct.unpack(endian + 'I', value)[0]
+            return (dims[256], dims[257]) if 256 in dims and 257 in dims else None
+        if head.startswith(b'\xff\xd8'):
+            # 逐个跳过 JPEG 段，直到遇到 SOF 段
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                while len(marker) == 2 and marker[0] == 0xff and marker[1] == 0xff:
+                    marker = marker[1:] + f.read(1)  # 跳过填充字节
+                if len(marker) < 2 or marker[0] != 0xff:
+                    return None
+                code = marker[1]
+                if code == 0xd8 or 0xd0 <= code <= 0xd7 or code == 0x01:
+                    continue  # 没有长度字段的标记
+                length_bytes = f.read(2)
+                if len(length_bytes) < 2:
+                    return None
+                length = struct.unpack('>H', length_bytes)[0]
+                if 0xc0 <= code <= 0xcf and code not in (0xc4, 0xc8, 0xcc):
+                    data = f.read(5)
+                    if len(data) < 5:
+                        return None
+                    height, width = struct.unpack('>HH', data[1:5])
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error, EOFError, zlib.error, zipfile.BadZipFile):
+        return None
+    return None
+
+def _stat_and_probe(file_path):
+    """读取一张图片的大小、修改时间和宽高，文件不可访问时返回 None"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    entry = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'width': None, 'height': None}
+    size = probe_image_size(file_path)
+    if size:
+        entry['width'], entry['height'] = size
+    return entry
+
+def probe_archive_images(archive_path, names):
+    """读取压缩包中若干图片的宽高，每张只解压文件头，返回 {成员名: (宽, 高) 或 None}"""
+    sizes = {}
+    try:
+        with zipfile.ZipFile(archive_path) as zf:
+            for name in names:
+                try:
+                    with zf.open(name) as f:
+                        sizes[name] = probe_image_stream(f)
+                except (KeyError, RuntimeError, NotImplementedError, zipfile.BadZipFile, zlib.error):
+                    sizes[name] = None
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"警告: 无法读取压缩包 '{archive_path}': {e}")
+    return sizes
+
+def update_image_meta(root_path, jobs=1, paths=None, verify=False):
+    """
+    维护每个目录的图片元数据 'image_meta' (大小、mtime、宽高)。
+    目录 mtime 没变时直接信任清单里的记录；目录有变化时逐个 stat，
+    只有大小或修改时间变化的图片才重新读取文件头。
+    图片被原地覆盖时目录 mtime 不变，verify 为 True 时目录没变也逐个 stat 检查
+    (缩略图等缓存按记录中的原图哈希查找，记录过期就会一直用旧图片)；否则需要 --force。
+    文件头读取是 I/O 密集的，jobs > 1 时用线程池并发，适合网络存储。
+    压缩包成员的记录在扫描时已经按大小和 CRC 复用，只需读取新成员的文件头。
+    paths 不为 None 时只处理其中列出的目录。返回有图片记录变化的目录列表。
+    """
+    root_path_str = os.fspath(root_path)
+    to_check = []
+    archive_checks = []
+    for relative_path_str in (all_directories_info if paths is None else paths):
+        info = all_directories_info[relative_path_str]
+        if info['archive']:
+            names = [img for img in info['images'] if 'width' not in info['image_meta'][img]]
+            if names:
+                archive_checks.append((relative_path_str, names))
+            continue
+        old_meta = info['image_meta']
+        meta = {}
+        for img_name in info['images']:
+            entry = old_meta.get(img_name)
+            if verify or info['rescanned'] or entry is None or 'width' not in entry:
+                to_check.append((relative_path_str, img_name, entry))
+            else:
+                meta[img_name] = entry
+        info['image_meta'] = meta
+    if not to_check and not archive_checks:
+        return []
+
+    def _check(item):
+        relative_path_str, img_name, entry = item
+        file_path = os.path.join(root_path_str, relative_path_str, img_name)
+        if entry is not None and 'width' in entry:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                return None
+            if entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime_ns:
+                return entry
+        return _stat_and_probe(file_path)
+
+    def _check_archive(item):
+        relative_path_str, names = item
+        return probe_archive_images(os.path.join(root_path_str, relative_path_str), names)
+
+    if jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs * 4) as executor:
+            results = list(executor.map(_check, to_check))
+            archive_results = list(executor.map(_check_archive, archive_checks))
+    else:
+        results = list(map(_check, to_check))
+        archive_results = list(map(_check_archive, archive_checks))
+    modified = dict.fromkeys(relative_path_str for relative_path_str, _ in archive_checks)
+    for (relative_path_str, _), sizes in zip(archive_checks, archive_results):
+        meta = all_directories_info[relative_path_str]['image_meta']
+        for img_name, size in sizes.items():
+            meta[img_name]['width'], meta[img_name]['height'] = size if size else (None, None)
+    for (relative_path_str, img_name, old_entry), entry in zip(to_check, results):
+        if entry is not None:
+            all_directories_info[relative_path_str]['image_meta'][img_name] = entry
+        if entry is not old_entry:
+            modified[relative_path_str] = None
+    # 元数据字典保持和图片列表相同的顺序
+    for relative_path_str, _, _ in to_check:
+        info = all_directories_info[relative_path_str]
+        if len(info['image_meta']) > 1:
+            meta = info['image_meta']
+            info['image_meta'] = {img: meta[img] for img in info['images'] if img in meta}
+    return list(modified)
+
+def file_sha1(file_path):
+    """分块计算文件内容的 SHA-1"""
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def partial_sha1(file_path):
+    """
+    读取文件开头 DUPES_PARTIAL_BYTES 字节的 SHA-1 (可以在子进程中运行)。
+    返回 (哈希, 设备号, inode)，不能读取时返回 None。文件不超过这个大小时就是整个文件的哈希。
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            return hashlib.sha1(f.read(DUPES_PARTIAL_BYTES)).hexdigest(), st.st_dev, st.st_ino
+    except OSError as e:
+        print(f"警告: 无法读取图片 '{file_path}': {e}")
+        return None
+
+def full_sha1(file_path):
+    """file_sha1 的子进程版本，不能读取时打印警告并返回 None"""
+    try:
+        return file_sha1(file_path)
+    except OSError as e:
+        print(f"警告: 无法读取图片 '{file_path}': {e}")
+        return None
+
+def thumbnail_name(sha1, width, fmt):
+    """缩略图在缓存目录中的相对路径，按哈希前两位分子目录"""
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    return f"{sha1[:2]}/{sha1}-{width}.{ext}"
+
+def make_thumbnail(src_path, cache_dir, sha1, width, fmt, quality):
+    """
+    为一张图片生成缩略图 (可以在子进程中运行)。
+    sha1 为 None 时先计算原图哈希；缓存中已有同名缩略图时直接复用。
+    返回 (sha1, 缩略图相对路径)，失败时缩略图路径为 None。
+    """
+    try:
+        if sha1 is None:
+            sha1 = file_sha1(src_path)
+    except OSError as e:
+        print(f"警告: 无法读取图片 '{src_path}': {e}")
+        return None, None
+    name = thumbnail_name(sha1, width, fmt)
+    thumb_path = os.path.join(cache_dir, name)
+    if os.path.exists(thumb_path):
+        return sha1, name
+    try:
+        with Image.open(src_path) as img:
+            # JPEG 可以在解码时直接缩小，省去大部分解码开销
+            img.draft('RGB', (width, width * 4))
+            if img.width > width:
+                img.thumbnail((width, img.height * width // img.width or 1))
+            if fmt == 'jpeg':
+                img = img.convert('RGB')
+            elif img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            # 先写临时文件再改名，中断时不会留下不完整的缩略图
+            tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+            img.save(tmp_path, format=fmt.upper(), quality=quality)
+            os.replace(tmp_path, thumb_path)
+    except Exception as e:
+        print(f"警告: 无法为 '{src_path}' 生成缩略图: {e}")
+        return sha1, None
+    return sha1, name
+
+def cache_listing(cache_dir, refresh=True):
+    """
+    缓存目录 (缩略图、转码、响应式图片) 中已有文件的相对路径集合。
+    refresh 为 True (完整生成) 时重新列出目录；否则复用上一次的结果，由调用方随生成的文件增量维护，
+    监视模式下每批事件不必列出整个缓存目录。
+    """
+    existing = cache_listings.get(cache_dir)
+    if existing is None or refresh:
+        existing = set()
+        for bucket in os.scandir(cache_dir):
+            if bucket.is_dir():
+                existing.update(f"{bucket.name}/{name}" for name in os.listdir(bucket.path))
+        cache_listings[cache_dir] = existing
+    return existing
+
+def evict_thumbnails(cache_dir, referenced, cache_size_mb):
+    """
+    缩略图缓存超过大小上限时，按最近使用时间从旧到新删除当前没有页面引用的缩略图。
+    被引用的缩略图不会被删除。
+    """
+    files = []
+    total = 0
+    try:
+        buckets = list(os.scandir(cache_dir))
+    except OSError:
+        return
+    for bucket in buckets:
+        if not bucket.is_dir():
+            continue
+        for entry in os.scandir(bucket.path):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            total += st.st_size
+            files.append((st.st_mtime, st.st_size, f"{bucket.name}/{entry.name}", entry.path))
+    limit = cache_size_mb * 1024 * 1024
+    if total <= limit:
+        return
+    removed = 0
+    listing = cache_listings.get(cache_dir, set())
+    for _, size, name, path in sorted(files):
+        if total <= limit:
+            break
+        if name in referenced:
+            continue
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        listing.discard(name)
+        total -= size
+        removed += 1
+    print(f"缩略图缓存：删除了 {removed} 个不再使用的缩略图。")
+    if total > limit:
+        print(f"警告: 当前使用中的缩略图 ({total // (1024 * 1024)} MB) 超过了缓存上限 {cache_size_mb} MB。")
+
+def update_thumbnails(root_path, width=THUMB_WIDTH, fmt=THUMB_FORMAT, quality=THUMB_QUALITY,
+                      cache_size_mb=THUMB_CACHE_SIZE_MB, jobs=1, paths=None):
+    """
+    为目录模型中的图片准备滚动视图用的缩略图，结果写入每个目录的 'thumbs'。
+    原图哈希和 (大小, mtime) 一起缓存在清单里，只有新增或修改过的图片才需要重新读取；
+    缩略图按原图内容哈希命名，因此目录改名或重复的图片都能复用已有的缩略图。
+    paths 不为 None 时只处理其中列出的目录，也不检查缓存大小 (留给下一次完整生成)。
+    """
+    if Image is None:
+        print("警告: 未安装 Pillow，跳过缩略图生成 (pip install pillow)。")
+        return
+    cache_dir = os.path.join(os.fspath(site_root(root_path)), SITE_DIR_NAME, THUMB_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    # 列出一次缓存目录，避免对每张图片检查缩略图是否存在
+    existing = cache_listing(cache_dir, refresh=paths is None)
+
+    todo = []
+    for relative_path_str in (all_directories_info if paths is None else paths):
+        info = all_directories_info[relative_path_str]
+        thumbs = {}
+        if info['archive']:
+            # 压缩包中的图片没有独立的文件，滚动视图直接使用原图
+            info['thumbs'] = thumbs
+            continue
+        for img_name, entry in info['image_meta'].items():
+            # GIF 可能是动图，滚动视图里继续使用原图
+            if img_name.lower().endswith('.gif'):
+                continue
+            src_path = os.path.join(os.fspath(root_path), relative_path_str, img_name)
+            sha1 = entry.get('sha1')
+            if sha1 and thumbnail_name(sha1, width, fmt) in existing:
+                thumbs[img_name] = thumbnail_name(sha1, width, fmt)
+            else:
+                todo.append((relative_path_str, img_name, src_path, sha1))
+        info['thumbs'] = thumbs
+
+    if todo:
+        print(f"正在生成 {len(todo)} 张缩略图...")
+        args = ([src_path for _, _, src_path, _ in todo], [cache_dir] * len(todo),
+                [sha1 for _, _, _, sha1 in todo], [width] * len(todo),
+                [fmt] * len(todo), [quality] * len(todo))
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(make_thumbnail, *args, chunksize=16))
+        else:
+            results = list(map(make_thumbnail, *args))
+        for (relative_path_str, img_name, _, _), (sha1, name) in zip(todo, results):
+            info = all_directories_info[relative_path_str]
+            if sha1:
+                info['image_meta'][img_name]['sha1'] = sha1
+            if name:
+                info['thumbs'][img_name] = name
+                existing.add(name)
+        # 缩略图字典保持和图片列表相同的顺序，使页面签名稳定
+        for relative_path_str in dict.fromkeys(item[0] for item in todo):
+            info = all_directories_info[relative_path_str]
+            info['thumbs'] = {img: info['thumbs'][img] for img in info['images'] if img in info['thumbs']}
+
+    if paths is None:
+        referenced = {name for info in all_directories_info.values() for name in info['thumbs'].values()}
+        evict_thumbnails(cache_dir, referenced, cache_size_mb)
+
+def _delta_encode(ids):
+    """递增的编号列表改写成相邻差值，索引文件更小"""
+    previous = 0
+    deltas = []
+    for i in ids:
+        deltas.append(i - previous)
+        previous = i
+    return deltas
+
+def build_search_shard(paths):
+    """
+    为一组目录生成搜索倒排索引。目录按深度 (稳定) 排序后编号，
+    客户端按编号顺序遍历就是原来按深度排序的结果顺序，可以在凑够结果数后提前停止。
+    - paths/names/parents: 按编号排列的路径、去掉标签后的名称和父目录编号 (父目录不在本分片时为 -1)
+    - grams: 小写名称的字符 n-gram -> 目录编号列表
+    - tags/tagDirs: 标签表和每个标签对应的目录编号列表；dirTags: 目录编号 -> 标签编号
+    编号列表都以差值形式存储。
+    """
+    paths = sorted(paths, key=lambda p: 0 if p == '.' else p.count('/') + 1)
+    ids = {path: i for i, path in enumerate(paths)}
+    names = []
+    parents = []
+    tags = []
+    tag_ids = {}
+    tag_dirs = []
     dir_tags = {}
-    visible_subdirs = []
-    for dir_name in subdirectories:
-        # 过滤掉点文件背景目录
-        if not dir_name.startswith('.dotfile_background'):
-            # 提取标签 [[tag]]
-            tags = re.findall(r'\[\[([^\]]+)\]\]', dir_name)
-            if tags:
-                dir_tags[dir_name] = tags
-            visible_subdirs.append(dir_name)
-    # 生成 HTML 内容
-    relative_path_from_root = directory_path.relative_to(root_path)
-    page_title = relative_path_from_root.as_posix() if relative_path_from_root != Path('.') else '根目录'
-    # 计算返回根目录的路径（用于背景图片路径）
-    depth = len(relative_path_from_root.parts) if relative_path_from_root != Path('.') else 0
-    back_to_root_path = "../" * depth
-    # 构建图片列表的JavaScript数组
-    js_image_list = "[" + ", ".join([f'"{img}"' for img in image_files]) + "]"
-    # 构建子目录列表的JavaScript数组（用于搜索，排除点文件背景）
-    filtered_subdirs = [dir for dir in subdirectories if not dir.startswith('.')]
-    js_subdirs_list = "[" + ", ".join([f'"{dir}"' for dir in filtered_subdirs]) + "]"
-    # 构建目录标签的JavaScript对象
-    js_dir_tags = "{"
-    for dir_name, tags in dir_tags.items():
-        js_dir_tags += f'"{dir_name}": ["' + '", "'.join(tags) + '"], '
-    if js_dir_tags.endswith(', '):
-        js_dir_tags = js_dir_tags[:-2]
-    js_dir_tags += "}"
-    
-    # 只在根目录收集一次全局信息
-    if directory_path == root_path:
-        print("正在收集全局目录信息用于搜索...")
-        collect_all_subdirs(root_path)
-    
-    # 将全局目录信息序列化为 JSON 字符串，供 JavaScript 使用
-    # ensure_ascii=False 保持中文可读性，separators 使输出更紧凑
-    js_all_dirs = json.dumps(all_directories_info, ensure_ascii=False, separators=(',', ':'))
-
-    html_content = f"""<!DOCTYPE html>
+    grams = {}
+    for i, path in enumerate(paths):
+        info = all_directories_info[path]
+        names.append(info['clean_name'])
+        parent = -1
+        if path != '.':
+            parent = ids.get(path.rsplit('/', 1)[0] if '/' in path else '.', -1)
+        parents.append(parent)
+        if info['tags']:
+            dir_tag_ids = []
+            for tag in info['tags']:
+                if tag not in tag_ids:
+                    tag_ids[tag] = len(tags)
+                    tags.append(tag)
+                    tag_dirs.append([])
+                tag_id = tag_ids[tag]
+                dir_tag_ids.append(tag_id)
+                if not tag_dirs[tag_id] or tag_dirs[tag_id][-1] != i:
+                    tag_dirs[tag_id].append(i)
+            dir_tags[str(i)] = dir_tag_ids
+        lower = info['clean_name'].lower()
+        for gram in dict.fromkeys(lower[k:k + SEARCH_NGRAM] for k in range(len(lower) - SEARCH_NGRAM + 1)):
+            grams.setdefault(gram, []).append(i)
+    return {
+        'n': SEARCH_NGRAM,
+        'paths': paths,
+        'names': names,
+        'parents': parents,
+        'tags': tags,
+        'tagDirs': [_delta_encode(dirs) for dirs in tag_dirs],
+        'dirTags': dir_tags,
+        'grams': {gram: _delta_encode(dirs) for gram, dirs in grams.items()},
+    }
+
+def derivative_name(sha1, fmt):
+    """转码图片在 derived 目录中的相对路径，按哈希前两位分子目录"""
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    return f"{sha1[:2]}/{sha1}.{ext}"
+
+def needs_transcode(img_name, entry, png_min_mb=TRANSCODE_PNG_MIN_MB):
+    """BMP/TIFF 总是转码，PNG 只在文件超过 png_min_mb 时转码"""
+    ext = os.path.splitext(img_name)[1].lower()
+    if ext in TRANSCODE_EXTENSIONS:
+        return True
+    return ext == '.png' and (entry.get('size') or 0) >= png_min_mb * 1024 * 1024
+
+def make_derivative(src_path, cache_dir, sha1, fmt, quality):
+    """
+    把一张图片转码为适合网页的格式 (可以在子进程中运行)，原图不做任何修改。
+    sha1 为 None 时先计算原图哈希；已有同名的转码结果时直接复用。
+    返回 (sha1, 转码图片相对路径)，失败时路径为 None。
+    """
+    try:
+        if sha1 is None:
+            sha1 = file_sha1(src_path)
+    except OSError as e:
+        print(f"警告: 无法读取图片 '{src_path}': {e}")
+        return None, None
+    name = derivative_name(sha1, fmt)
+    derived_path = os.path.join(cache_dir, name)
+    if os.path.exists(derived_path):
+        return sha1, name
+    try:
+        with Image.open(src_path) as img:
+            if fmt == 'jpeg':
+                img = img.convert('RGB')
+            elif img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+            os.makedirs(os.path.dirname(derived_path), exist_ok=True)
+            # 先写临时文件再改名，中断时不会留下不完整的文件
+            tmp_path = f"{derived_path}.{os.getpid()}.tmp"
+            img.save(tmp_path, format=fmt.upper(), quality=quality)
+            os.replace(tmp_path, derived_path)
+    except Exception as e:
+        print(f"警告: 无法转码图片 '{src_path}': {e}")
+        return sha1, None
+    return sha1, name
+
+def update_derivatives(root_path, fmt=TRANSCODE_FORMAT, quality=TRANSCODE_QUALITY,
+                       png_min_mb=TRANSCODE_PNG_MIN_MB, jobs=1, paths=None):
+    """
+    把浏览器无法显示或体积过大的图片 (BMP、TIFF、大 PNG) 转码为 WebP/JPEG，结果写入每个目录的 'derived'。
+    和缩略图一样按原图内容哈希缓存，原图的大小和 mtime 不变时不会重新读取
+    (原地覆盖的原图由 update_image_meta 的 verify 检查出来)；不再被任何页面引用的转码结果会被删除。
+    paths 不为 None 时只处理其中列出的目录，不删除任何文件 (留给下一次完整生成)。
+    """
+    if Image is None:
+        print("警告: 未安装 Pillow，跳过图片转码 (pip install pillow)。")
+        return
+    root_path_str = os.fspath(root_path)
+    cache_dir = os.path.join(os.fspath(site_root(root_path)), SITE_DIR_NAME, DERIVED_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    existing = cache_listing(cache_dir, refresh=paths is None)
+
+    todo = []
+    for relative_path_str in (all_directories_info if paths is None else paths):
+        info = all_directories_info[relative_path_str]
+        derived = {}
+        if not info['archive']:
+            for img_name, entry in info['image_meta'].items():
+                if not needs_transcode(img_name, entry, png_min_mb):
+                    continue
+                # 超出 WebP 尺寸上限的图片改用 JPEG
+                img_fmt = fmt
+                if fmt == 'webp' and max(entry.get('width') or 0, entry.get('height') or 0) > WEBP_MAX_SIZE:
+                    img_fmt = 'jpeg'
+                sha1 = entry.get('sha1')
+                if sha1 and derivative_name(sha1, img_fmt) in existing:
+                    derived[img_name] = derivative_name(sha1, img_fmt)
+                else:
+                    todo.append((relative_path_str, img_name,
+                                 os.path.join(root_path_str, relative_path_str, img_name), sha1, img_fmt))
+        info['derived'] = derived
+
+    if todo:
+        print(f"正在转码 {len(todo)} 张图片...")
+        args = ([src_path for _, _, src_path, _, _ in todo], [cache_dir] * len(todo),
+                [sha1 for _, _, _, sha1, _ in todo], [img_fmt for _, _, _, _, img_fmt in todo],
+                [quality] * len(todo))
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(make_derivative, *args, chunksize=4))
+        else:
+            results = list(map(make_derivative, *args))
+        for (relative_path_str, img_name, _, _, _), (sha1, name) in zip(todo, results):
+            info = all_directories_info[relative_path_str]
+            if sha1:
+                info['image_meta'][img_name]['sha1'] = sha1
+            if name:
+                info['derived'][img_name] = name
+                existing.add(name)
+        # 保持和图片列表相同的顺序，使页面签名稳定
+        for relative_path_str in dict.fromkeys(item[0] for item in todo):
+            info = all_directories_info[relative_path_str]
+            info['derived'] = {img: info['derived'][img] for img in info['images'] if img in info['derived']}
+
+    if paths is None:
+        remove_unreferenced(cache_dir, existing,
+                            {name for info in all_directories_info.values() for name in info['derived'].values()},
+                            "转码缓存")
+
+def remove_unreferenced(cache_dir, existing, referenced, label):
+    """删除缓存目录中不再被任何页面引用的文件，同时从 existing 中去掉"""
+    removed = 0
+    for name in existing - referenced:
+        try:
+            os.unlink(os.path.join(cache_dir, name))
+            removed += 1
+        except OSError:
+            pass
+        existing.discard(name)
+    if removed:
+        print(f"{label}：删除了 {removed} 个不再使用的文件。")
+
+def variant_plan(entry, widths=SRCSET_WIDTHS, fmt=VARIANT_FORMAT):
+    """
+    一张图片需要的响应式宽度档位，返回 [(宽度, 格式), ...]。
+    只生成比原图窄的档位 (不放大)；缩放后高度超出 WebP 上限的档位改用 JPEG。
+    """
+    width = entry.get('width')
+    height = entry.get('height')
+    if not width or not height:
+        return []
+    plan = []
+    for w in sorted(set(widths)):
+        if w >= width:
+            break
+        w_fmt = fmt
+        if fmt == 'webp' and height * w // width > WEBP_MAX_SIZE:
+            w_fmt = 'jpeg'
+        plan.append((w, w_fmt))
+    return plan
+
+def make_variants(src_path, cache_dir, sha1, plan, quality):
+    """
+    为一张图片生成 plan 中的所有宽度档位 (可以在子进程中运行)，原图只解码一次。
+    sha1 为 None 时先计算原图哈希；缓存中已有的档位直接复用。
+    返回 (sha1, [[宽度, 相对路径], ...])，失败的档位不会出现在结果中。
+    """
+    try:
+        if sha1 is None:
+            sha1 = file_sha1(src_path)
+    except OSError as e:
+        print(f"警告: 无法读取图片 '{src_path}': {e}")
+        return None, []
+    variants = []
+    missing = []
+    for w, fmt in plan:
+        name = thumbnail_name(sha1, w, fmt)
+        if os.path.exists(os.path.join(cache_dir, name)):
+            variants.append([w, name])
+        else:
+            missing.append((w, fmt, name))
+    if not missing:
+        return sha1, variants
+    try:
+        with Image.open(src_path) as img:
+            # JPEG 可以在解码时直接缩小到最大档位附近
+            max_width = max(w for w, _, _ in missing)
+            img.draft('RGB', (max_width, max(1, img.height * max_width // img.width)))
+            img.load()
+            for w, fmt, name in missing:
+                variant = img.resize((w, max(1, img.height * w // img.width)), Image.LANCZOS)
+                if fmt == 'jpeg':
+                    variant = variant.convert('RGB')
+                elif variant.mode not in ('RGB', 'RGBA'):
+                    variant = variant.convert('RGBA' if 'A' in variant.getbands() else 'RGB')
+                variant_path = os.path.join(cache_dir, name)
+                os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+                # 先写临时文件再改名，中断时不会留下不完整的文件
+                tmp_path = f"{variant_path}.{os.getpid()}.tmp"
+                variant.save(tmp_path, format=fmt.upper(), quality=quality)
+                os.replace(tmp_path, variant_path)
+                variants.append([w, name])
+    except Exception as e:
+        print(f"警告: 无法为 '{src_path}' 生成响应式图片: {e}")
+    variants.sort()
+    return sha1, variants
+
+def update_variants(root_path, widths=SRCSET_WIDTHS, fmt=VARIANT_FORMAT, quality=VARIANT_QUALITY, jobs=1,
+                    paths=None):
+    """
+    为目录模型中的图片生成几个宽度档位的缩小版本，结果写入每个目录的 'variants'，
+    页面用它们生成 srcset，让手机等小屏幕只下载需要的分辨率。
+    和缩略图一样按原图内容哈希缓存 (原地覆盖的原图由 update_image_meta 的 verify 检查出来)；
+    不再被任何页面引用的文件会被删除。
+    paths 不为 None 时只处理其中列出的目录，不删除任何文件 (留给下一次完整生成)。
+    """
+    if Image is None:
+        print("警告: 未安装 Pillow，跳过响应式图片生成 (pip install pillow)。")
+        return
+    root_path_str = os.fspath(root_path)
+    cache_dir = os.path.join(os.fspath(site_root(root_path)), SITE_DIR_NAME, VARIANT_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    existing = cache_listing(cache_dir, refresh=paths is None)
+
+    todo = []
+    for relative_path_str in (all_directories_info if paths is None else paths):
+        info = all_directories_info[relative_path_str]
+        variants = {}
+        if not info['archive']:
+            for img_name, entry in info['image_meta'].items():
+                # GIF 可能是动图，始终使用原图
+                if img_name.lower().endswith('.gif'):
+                    continue
+                plan = variant_plan(entry, widths, fmt)
+                if not plan:
+                    continue
+                sha1 = entry.get('sha1')
+                names = [thumbnail_name(sha1, w, w_fmt) for w, w_fmt in plan] if sha1 else []
+                if names and all(name in existing for name in names):
+                    variants[img_name] = [[w, name] for (w, _), name in zip(plan, names)]
+                else:
+                    todo.append((relative_path_str, img_name,
+                                 os.path.join(root_path_str, relative_path_str, img_name), sha1, plan))
+        info['variants'] = variants
+
+    if todo:
+        print(f"正在为 {len(todo)} 张图片生成响应式图片...")
+        args = ([src_path for _, _, src_path, _, _ in todo], [cache_dir] * len(todo),
+                [sha1 for _, _, _, sha1, _ in todo], [plan for _, _, _, _, plan in todo],
+                [quality] * len(todo))
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(make_variants, *args, chunksize=4))
+        else:
+            results = list(map(make_variants, *args))
+        for (relative_path_str, img_name, _, _, _), (sha1, variants) in zip(todo, results):
+            info = all_directories_info[relative_path_str]
+            if sha1:
+                info['image_meta'][img_name]['sha1'] = sha1
+            if variants:
+                info['variants'][img_name] = variants
+                existing.update(name for _, name in variants)
+        # 保持和图片列表相同的顺序，使页面签名稳定
+        for relative_path_str in dict.fromkeys(item[0] for item in todo):
+            info = all_directories_info[relative_path_str]
+            info['variants'] = {img: info['variants'][img] for img in info['images'] if img in info['variants']}
+
+    if paths is None:
+        remove_unreferenced(cache_dir, existing,
+                            {name for info in all_directories_info.values()
+                             for variants in info['variants'].values() for _, name in variants},
+                            "响应式图片缓存")
+
+def build_search_index():
+    """
+    根据 all_directories_info 生成全局搜索索引文件的内容，返回 {文件名: JSON 文本}。
+    目录数很多时按一级目录分片，每个分片有自己的倒排索引，入口文件只列出分片文件名。
+    """
+    def _dump(data):
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+    if len(all_directories_info) <= SEARCH_INDEX_SHARD_SIZE:
+        return {SEARCH_INDEX_FILE: _dump(build_search_shard(list(all_directories_info)))}
+
+    # 按一级目录分组，同一个一级目录下的所有目录放在同一个分片里
+    groups = {}
+    for path in all_directories_info:
+        groups.setdefault(path.split('/', 1)[0], []).append(path)
+    shards = []
+    current = []
+    for top in sorted(groups):
+        if current and len(current) + len(groups[top]) > SEARCH_INDEX_SHARD_SIZE:
+            shards.append(current)
+            current = []
+        current.extend(groups[top])
+    if current:
+        shards.append(current)
+
+    files = {}
+    for i, shard in enumerate(shards):
+        files[f'search-{i}.json'] = _dump(build_search_shard(shard))
+    files[SEARCH_INDEX_FILE] = _dump({'shards': [name for name in files]})
+    return files
+
+def write_search_index(root_path):
+    """
+    把 all_directories_info 写成根目录下的全局搜索索引文件。
+    页面只在第一次搜索时按需加载它，而不是在每个 index.html 里内嵌一份。
+    """
+    site_dir = site_root(root_path) / SITE_DIR_NAME
+    try:
+        site_dir.mkdir(exist_ok=True)
+    except OSError as e:
+        print(f"错误: 无法创建目录 '{site_dir}': {e}")
+        return
+
+    files = build_search_index()
+    for file_name, content in files.items():
+        write_if_changed(site_dir / file_name, content)
+    # 清理上一次运行留下、这次不再使用的分片
+    for old_shard in site_dir.glob('search-*.json'):
+        if old_shard.name not in files:
+            try:
+                old_shard.unlink()
+            except OSError:
+                pass
+
+# 所有页面共享的样式表，写入根目录数据目录中以内容哈希命名的文件
+APP_CSS = """/* 默认主题 (浅色) */
+:root {
+    --bg-color: #fdf6f0;
+    --text-color: #5a3e36;
+    --header-bg: rgba(255, 255, 255, 0.9);
+    --card-bg: rgba(255, 255, 255, 0.85);
+    --border-color: #d9c7b0;
+    --shadow-color: rgba(180, 150, 130, 0.3);
+    --button-bg: #f8f0e5;
+    --button-hover: #f0e0d0;
+    --primary-color: #ff9a8b;
+    --primary-hover: #ff6b6b;
+    --nav-button-bg: rgba(255, 255, 255, 0.9);
+    --nav-button-hover: rgba(255, 255, 255, 1);
+    --zoom-button-bg: rgba(255, 255, 255, 0.9);
+    --zoom-button-hover: rgba(255, 255, 255, 1);
+    --page-number-bg: rgba(0, 0, 0, 0.5);
+    --page-number-color: #fff;
+    --accent-color: #ffb6c1;
+    --accent-hover: #ff9aa2;
+    --search-bg: rgba(255, 255, 255, 0.9);
+    --tag-bg: #ffe5e5;
+    --tag-color: #d63384;
+}
+body.dark-theme {
+    --bg-color: #2b2b3b;
+    --text-color: #e0d6eb;
+    --header-bg: rgba(50, 50, 65, 0.9);
+    --card-bg: rgba(50, 50, 65, 0.85);
+    --border-color: #6a5a8c;
+    --shadow-color: rgba(0, 0, 0, 0.5);
+    --button-bg: #3a3a4a;
+    --button-hover: #4a4a5a;
+    --primary-color: #ff7bac;
+    --primary-hover: #ff5299;
+    --nav-button-bg: rgba(50, 50, 65, 0.9);
+    --nav-button-hover: rgba(70, 70, 90, 1);
+    --zoom-button-bg: rgba(50, 50, 65, 0.9);
+    --zoom-button-hover: rgba(70, 70, 90, 1);
+    --page-number-bg: rgba(255, 255, 255, 0.2);
+    --page-number-color: #fff;
+    --accent-color: #c29fbf;
+    --accent-hover: #a97fa7;
+    --search-bg: rgba(50, 50, 65, 0.9);
+    --tag-bg: #5a3e50;
+    --tag-color: #ff7bac;
+}
+body {
+    font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+    margin: 0;
+    padding: 0;
+    background-color: var(--bg-color);
+    color: var(--text-color);
+    transition: background-color 0.3s, color 0.3s;
+    position: relative;
+    min-height: 100vh;
+}
+/* 背景图片 */
+body.bg-enabled {
+    background-size: cover;
+    background-position: center;
+    background-repeat: no-repeat;
+    background-attachment: fixed;
+}
+body.bg-blur {
+    backdrop-filter: blur(5px);
+}
+.container {
+    max-width: 100%;
+    margin: 0 auto;
+    padding: 20px;
+}
+header {
+    display: flex;
+    justify-content: space-between;
+    align-items: center;
+    flex-wrap: nowrap; /* 修改: 禁止换行 */
+    padding: 15px 20px;
+    background-color: var(--header-bg);
+    border-bottom: 3px solid var(--primary-color);
+    margin-bottom: 20px;
+    position: sticky;
+    top: 0;
+    z-index: 100;
+    border-radius: 0 0 10px 10px;
+    box-shadow: 0 4px 12px var(--shadow-color);
+}
+h1 {
+    margin: 0;
+    color: var(--primary-color);
+    font-size: 1.8em;
+    flex: 1 1 auto; /* 新增: 弹性布局 */
+    min-width: 0; /* 新增: 允许内容溢出容器 */
+    overflow-x: auto; /* 新增: 水平滚动 */
+    white-space: nowrap; /* 新增: 禁止换行 */
+    padding-bottom: 5px; /* 新增: 为滚动条留出空间 */
+    /* 添加滚动条样式 */
+    scrollbar-width: thin;
+    scrollbar-color: var(--border-color) transparent;
+}
+h1::-webkit-scrollbar {
+    height: 8px; /* 新增: 水平滚动条高度 */
+}
+h1::-webkit-scrollbar-track {
+    background: transparent;
+}
+h1::-webkit-scrollbar-thumb {
+    background-color: var(--border-color);
+    border-radius: 4px;
+}
+.breadcrumb {
+    margin: 10px 0;
+    font-size: 0.9em;
+    overflow-x: auto; /* 新增: 水平滚动 */
+    white-space: nowrap; /* 新增: 禁止换行 */
+    padding-bottom: 5px; /* 新增: 为滚动条留出空间 */
+    /* 添加滚动条样式 */
+    scrollbar-width: thin;
+    scrollbar-color: var(--border-color) transparent;
+}
+.breadcrumb::-webkit-scrollbar {
+    height: 8px; /* 新增: 水平滚动条高度 */
+}
+.breadcrumb::-webkit-scrollbar-track {
+    background: transparent;
+}
+.breadcrumb::-webkit-scrollbar-thumb {
+    background-color: var(--border-color);
+    border-radius: 4px;
+}
+.breadcrumb a {
+    text-decoration: none;
+    color: var(--primary-color);
+    padding: 4px 8px;
+    border-radius: 4px;
+    transition: all 0.3s;
+}
+.breadcrumb a:hover {
+    background-color: var(--button-hover);
+    text-decoration: underline;
+}
+.view-controls {
+    display: flex;
+    gap: 10px;
+    margin: 15px 0;
+}
+.view-btn {
+    padding: 8px 15px;
+    background-color: var(--button-bg);
+    border: 2px solid var(--border-color);
+    border-radius: 20px;
+    cursor: pointer;
+    transition: all 0.3s;
+    font-weight: bold;
+    box-shadow: 0 2px 5px var(--shadow-color);
+}
+.view-btn.active {
+    background-color: var(--primary-color);
+    color: white;
+    border-color: var(--primary-hover);
+}
+.view-btn:hover:not(.active) {
+    background-color: var(--button-hover);
+    transform: translateY(-2px);
+    box-shadow: 0 4px 8px var(--shadow-color);
+}
+.theme-controls {
+    display: flex;
+    gap: 10px;
+    margin: 15px 0;
+    align-items: center;
+}
+.theme-toggle, .bg-toggle, .blur-toggle {
+    padding: 8px 15px;
+    background-color: var(--button-bg);
+    border: 2px solid var(--border-color);
+    border-radius: 20px;
+    cursor: pointer;
+    transition: all 0.3s;
+    font-weight: bold;
+    box-shadow: 0 2px 5px var(--shadow-color);
+}
+.theme-toggle:hover, .bg-toggle:hover, .blur-toggle:hover {
+    background-color: var(--button-hover);
+    transform: translateY(-2px);
+    box-shadow: 0 4px 8px var(--shadow-color);
+}
+/* 搜索框 */
+.search-container {
+    position: relative;
+    margin: 15px 0;
+    width: 100%;
+}
+.search-box {
+    width: 100%;
+    padding: 10px 15px;
+    border: 2px solid var(--border-color);
+    border-radius: 20px;
+    background-color: var(--search-bg);
+    color: var(--text-color);
+    font-size: 1em;
+    box-shadow: 0 2px 5px var(--shadow-color);
+    box-sizing: border-box;
+}
+.search-box:focus {
+    outline: none;
+    border-color: var(--primary-color);
+    box-shadow: 0 0 8px var(--accent-color);
+}
+.search-results {
+    position: absolute;
+    top: 100%;
+    left: 0;
+    right: 0;
+    background-color: var(--search-bg);
+    border: 2px solid var(--border-color);
+    border-top: none;
+    border-radius: 0 0 20px 20px;
+    max-height: 300px;
+    overflow-y: auto;
+    z-index: 200;
+    box-shadow: 0 4px 12px var(--shadow-color);
+    display: none;
+}
+.search-result-item {
+    padding: 10px 15px;
+    cursor: pointer;
+    border-bottom: 1px solid var(--border-color);
+}
+.search-result-item:last-child {
+    border-bottom: none;
+}
+.search-result-item:hover {
+    background-color: var(--button-hover);
+}
+.search-result-item a {
+    text-decoration: none;
+    color: var(--text-color);
+    display: block;
+}
+.search-result-tags {
+    display: flex;
+    flex-wrap: wrap;
+    gap: 5px;
+    margin-top: 5px;
+}
+.search-result-tag {
+    background-color: var(--tag-bg);
+    color: var(--tag-color);
+    padding: 2px 8px;
+    border-radius: 10px;
+    font-size: 0.8em;
+}
+/* 新增: 搜索结果中的路径和标签匹配标识 */
+.search-result-path {
+    font-size: 0.8em;
+    color: var(--accent-color);
+    margin-top: 3px;
+}
+.search-result-tag-match-icon {
+    font-size: 0.8em;
+    color: var(--tag-color);
+    margin-right: 5px;
+}
+/* 标签搜索 (已移除相关HTML/CSS) */
+/* 传统滚动视图 */
+#scroll-view {
+    display: block;
+    width: 100%;
+}
+.scroll-gallery {
+    display: flex;
+    flex-direction: column;
+    gap: 30px;
+    width: 100%;
+}
+.scroll-item {
+    background-color: var(--card-bg);
+    border: 2px solid var(--border-color);
+    border-radius: 15px;
+    overflow: hidden;
+    box-shadow: 0 4px 15px var(--shadow-color);
+    transition: all 0.3s;
+    width: 100%;
+}
+.scroll-item:hover {
+    transform: translateY(-5px);
+    box-shadow: 0 8px 20px var(--shadow-color);
+    border-color: var(--accent-color);
+}
+.scroll-item img {
+    width: 100%;
+    height: auto;
+    display: block;
+    margin: 0 auto;
+}
+/* 虚拟滚动视图：容器保持完整高度，只有视口附近的图片项按预先算出的位置绝对定位 */
+.scroll-gallery.virtual {
+    display: block;
+    position: relative;
+}
+.scroll-gallery.virtual .scroll-item {
+    position: absolute;
+    left: 0;
+    right: 0;
+    width: auto;
+}
+.scroll-item .label {
+    padding: 12px;
+    text-align: center;
+    background-color: rgba(255, 255, 255, 0.7);
+    border-top: 1px solid var(--border-color);
+    font-weight: bold;
+}
+body.dark-theme .scroll-item .label {
+    background-color: rgba(70, 70, 90, 0.7);
+}
+/* 双页视图 */
+#book-view {
+    display: none;
+    position: fixed;
+    top: 0;
+    left: 0;
+    width: 100%;
+    height: 100%;
+    background-color: rgba(0, 0, 0, 0.9);
+    z-index: 1000;
+}
+.book-header {
+    position: absolute;
+    top: 0;
+    left: 0;
+    width: 100%;
+    padding: 15px 20px;
+    background-color: rgba(0, 0, 0, 0.7);
+    display: flex;
+    justify-content: space-between;
+    align-items: center;
+    z-index: 1001;
+    border-bottom: 2px solid var(--primary-color);
+}
+.book-title {
+    margin: 0;
+    font-size: 1.2em;
+    color: white;
+}
+.book-controls {
+    display: flex;
+    gap: 10px;
+}
+.book-control-btn {
+    background-color: rgba(255, 255, 255, 0.2);
+    color: white;
+    border: 2px solid var(--border-color);
+    border-radius: 20px;
+    padding: 8px 12px;
+    cursor: pointer;
+    transition: all 0.3s;
+    font-weight: bold;
+    box-shadow: 0 2px 5px rgba(0,0,0,0.3);
+}
+.book-control-btn:hover {
+    background-color: rgba(255, 255, 255, 0.3);
+    transform: translateY(-2px);
+    box-shadow: 0 4px 8px rgba(0,0,0,0.4);
+}
+.pages-container {
+    position: absolute;
+    top: 70px;
+    left: 0;
+    width: 100%;
+    height: calc(100% - 70px);
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    overflow: hidden;
+}
+.pages-wrapper {
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    gap: 40px;
+    width: 100%;
+    height: 100%;
+}
+.page {
+    flex: 1;
+    text-align: center;
+    max-width: 45%;
+    height: 100%;
+    display: flex;
+    flex-direction: column;
+    justify-content: center;
+    align-items: center;
+    position: relative;
+}
+.page-content {
+    width: 100%;
+    height: 100%;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    overflow: hidden;
+    position: relative;
+}
+.page img {
+    max-width: 100%;
+    max-height: 100%;
+    width: auto;
+    height: auto;
+    box-shadow: 0 8px 25px rgba(0,0,0,0.7);
+    background-color: #fff;
+    object-fit: contain;
+    user-select: none;
+    transform-origin: center center;
+    border: 3px solid white;
+    border-radius: 5px;
+}
+.page-number {
+    position: absolute;
+    bottom: 20px;
+    font-size: 0.9em;
+    color: var(--page-number-color);
+    background-color: var(--page-number-bg);
+    padding: 5px 10px;
+    border-radius: 20px;
+    font-weight: bold;
+}
+.left-page-number {
+    left: 20px;
+}
+.right-page-number {
+    right: 20px;
+}
+.nav-button {
+    position: absolute;
+    top: 50%;
+    transform: translateY(-50%);
+    background-color: var(--nav-button-bg);
+    color: var(--primary-color);
+    border: 2px solid var(--border-color);
+    font-size: 2em;
+    width: 70px;
+    height: 70px;
+    border-radius: 50%;
+    cursor: pointer;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    transition: all 0.3s;
+    user-select: none;
+    z-index: 1001;
+    box-shadow: 0 4px 15px rgba(0,0,0,0.5);
+}
+.nav-button:hover {
+    background-color: var(--nav-button-hover);
+    transform: translateY(-50%) scale(1.1);
+    box-shadow: 0 6px 20px rgba(0,0,0,0.6);
+    color: var(--primary-hover);
+}
+.nav-button:disabled {
+    background-color: rgba(100, 100, 100, 0.3);
+    cursor: not-allowed;
+    transform: translateY(-50%);
+    color: #888;
+}
+#prev-button {
+    left: 20px;
+}
+#next-button {
+    right: 20px;
+}
+.zoom-controls {
+    position: absolute;
+    bottom: 20px;
+    left: 50%;
+    transform: translateX(-50%);
+    display: flex;
+    gap: 10px;
+    z-index: 1001;
+}
+.zoom-btn {
+    width: 50px;
+    height: 50px;
+    border-radius: 50%;
+    background-color: var(--zoom-button-bg);
+    color: var(--primary-color);
+    border: 2px solid var(--border-color);
+    font-size: 1.5em;
+    cursor: pointer;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    box-shadow: 0 4px 10px rgba(0,0,0,0.3);
+}
+.zoom-btn:hover {
+    background-color: var(--zoom-button-hover);
+    transform: scale(1.1);
+    box-shadow: 0 6px 15px rgba(0,0,0,0.4);
+    color: var(--primary-hover);
+}
+.no-content {
+    text-align: center;
+    padding: 40px;
+    color: #999;
+    font-style: italic;
+}
+/* 目录网格 */
+.folders-grid {
+    display: grid;
+    grid-template-columns: repeat(auto-fill, minmax(200px, 1fr));
+    gap: 20px;
+    margin-top: 30px;
+}
+.folder-item {
+    background-color: var(--card-bg);
+    border: 2px solid var(--border-color);
+    border-radius: 15px;
+    overflow: hidden;
+    box-shadow: 0 4px 15px var(--shadow-color);
+    transition: all 0.3s;
+}
+.folder-item:hover {
+    transform: translateY(-5px);
+    box-shadow: 0 8px 20px var(--shadow-color);
+    border-color: var(--accent-color);
+}
+.folder-item a {
+    text-decoration: none;
+    color: inherit;
+    display: block;
+}
+.folder-icon {
+    width: 100%;
+    height: 150px;
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    background-color: rgba(255, 255, 255, 0.7);
+    font-size: 4em;
+    color: var(--text-color);
+}
+body.dark-theme .folder-icon {
+    background-color: rgba(70, 70, 90, 0.7);
+}
+.folder-label {
+    padding: 12px;
+    text-align: center;
+    white-space: nowrap;
+    overflow: hidden;
+    text-overflow: ellipsis;
+    font-weight: bold;
+}
+.folder-tags {
+    display: flex;
+    flex-wrap: wrap;
+    gap: 5px;
+    padding: 0 12px 12px 12px;
+}
+.folder-tag {
+    background-color: var(--tag-bg);
+    color: var(--tag-color);
+    padding: 2px 8px;
+    border-radius: 10px;
+    font-size: 0.8em;
+}
+/* 移动端优化 */
+@media (max-width: 768px) {
+    .page {
+        max-width: 95%;
+    }
+    .pages-wrapper {
+        gap: 10px;
+    }
+    .nav-button {
+        width: 50px;
+        height: 50px;
+        font-size: 1.5em;
+    }
+    #prev-button {
+        left: 10px;
+    }
+    #next-button {
+        right: 10px;
+    }
+    .zoom-controls {
+        bottom: 10px;
+    }
+    .zoom-btn {
+        width: 40px;
+        height: 40px;
+        font-size: 1.1em;
+    }
+    .book-header {
+        padding: 10px 15px;
+    }
+    .book-title {
+        font-size: 1em;
+    }
+    .book-control-btn {
+        padding: 6px 10px;
+        font-size: 0.9em;
+    }
+    header {
+        flex-direction: column;
+        text-align: center;
+    }
+    .controls {
+        width: 100%;
+        display: flex;
+        justify-content: center;
+        flex-wrap: wrap;
+    }
+    /* .tag-search-container 已移除 */
+}
+/* 超小屏幕优化 */
+@media (max-width: 480px) {
+    .nav-button {
+        width: 40px;
+        height: 40px;
+        font-size: 1.2em;
+    }
+    #prev-button {
+        left: 5px;
+    }
+    #next-button {
+        right: 5px;
+    }
+    .zoom-btn {
+        width: 35px;
+        height: 35px;
+        font-size: 1em;
+    }
+    .page-number {
+        font-size: 0.8em;
+        padding: 3px 8px;
+    }
+    .left-page-number {
+        left: 10px;
+    }
+    .right-page-number {
+        right: 10px;
+    }
+}
+"""
+
+# 所有页面共享的脚本，本页数据从页面中的 #page-data 读取
+APP_JS = """// 本页数据 (由生成器写在页面的 #page-data 中)
+const pageData = JSON.parse(document.getElementById('page-data').textContent);
+// 图片列表 (单页应用模式下切换目录时会被替换)
+let images = pageData.images;
+// 图片宽高 ([宽, 高]，未知时为 null)
+let imageSizes = pageData.imageSizes;
+// 响应式图片的 srcset (没有缩小版本时为 null)
+let imageSrcsets = pageData.imageSrcsets;
+// 子目录列表（用于搜索，排除点文件背景）
+let subdirs = pageData.subdirs;
+// 目录标签
+let dirTags = pageData.dirTags;
+// 返回根目录的路径
+const backToRootPath = pageData.backToRootPath;
+// 原图根目录的地址 (页面输出到图片目录之外时不同于 backToRootPath)
+const imageRoot = pageData.imageRoot || backToRootPath;
+// 双页视图向后预读的跨页数 (向前固定预读一个跨页)
+const prefetchSpreads = pageData.prefetchSpreads;
+// 全局搜索索引 (第一次搜索时从根目录的搜索索引文件加载，每个分片一个倒排索引)
+const searchIndexUrl = pageData.searchIndexUrl;
+let searchShards = null;
+let searchShardsPromise = null;
+// 最多显示的搜索结果数，以及输入停止多少毫秒后开始搜索
+const SEARCH_RESULT_LIMIT = 50;
+const SEARCH_DEBOUNCE_MS = 80;
+let searchTimer = null;
+let currentIndex = 0;
+let leftScale = 1;
+let rightScale = 1;
+let isDarkTheme = localStorage.getItem('darkTheme') === 'true';
+let isBackgroundEnabled = localStorage.getItem('backgroundEnabled') !== 'false';
+let isBlurEnabled = localStorage.getItem('blurEnabled') === 'true';
+let isMobileView = window.innerWidth <= 768;
+// 视图控制元素
+const scrollViewBtn = document.getElementById('scroll-view-btn');
+const bookViewBtn = document.getElementById('book-view-btn');
+const scrollView = document.getElementById('scroll-view');
+const bookView = document.getElementById('book-view');
+const themeToggle = document.getElementById('theme-toggle');
+const bgToggle = document.getElementById('bg-toggle');
+const blurToggle = document.getElementById('blur-toggle');
+const body = document.body;
+// 搜索元素 (合并后，移除了 tagSearchBox)
+const searchBox = document.getElementById('search-box');
+const searchResults = document.getElementById('search-results');
+// 双页视图元素
+const exitBookViewBtn = document.getElementById('exit-book-view');
+const prevButton = document.getElementById('prev-button');
+const nextButton = document.getElementById('next-button');
+const pagesContainer = document.getElementById('pages-container');
+const pagesWrapper = document.getElementById('pages-wrapper');
+const leftPage = document.getElementById('left-page');
+const rightPage = document.getElementById('right-page');
+const leftPageContainer = document.getElementById('left-page-container');
+const rightPageContainer = document.getElementById('right-page-container');
+const leftPageNumber = document.getElementById('left-page-number');
+const rightPageNumber = document.getElementById('right-page-number');
+// 缩放控制元素
+const zoomInBtn = document.getElementById('zoom-in');
+const zoomOutBtn = document.getElementById('zoom-out');
+const zoomResetBtn = document.getElementById('zoom-reset');
+// 应用主题
+function applyTheme() {
+    if (isDarkTheme) {
+        body.classList.add('dark-theme');
+        themeToggle.textContent = '☀️ 浅色';
+    } else {
+        body.classList.remove('dark-theme');
+        themeToggle.textContent = '🌙 深色';
+    }
+    localStorage.setItem('darkTheme', isDarkTheme);
+}
+// 切换主题
+function toggleTheme() {
+    isDarkTheme = !isDarkTheme;
+    applyTheme();
+}
+// 应用背景
+function applyBackground() {
+    if (isBackgroundEnabled) {
+        body.classList.add('bg-enabled');
+        // 使用相对于根目录的路径
+        const img = new Image();
+        img.onload = function() {
+            body.style.backgroundImage = `url("${imageRoot}.dotfile_background.png")`;
+        };
+        img.onerror = function() {
+            const img2 = new Image();
+            img2.onload = function() {
+                body.style.backgroundImage = `url("${imageRoot}.dotfile_background.jpg")`;
+            };
+            img2.onerror = function() {
+                body.style.backgroundImage = `url("${imageRoot}.dotfile_background.webp")`;
+            };
+            img2.src = `${imageRoot}.dotfile_background.jpg`;
+        };
+        img.src = `${imageRoot}.dotfile_background.png`;
+        bgToggle.textContent = '🖼️ 隐藏背景';
+    } else {
+        body.classList.remove('bg-enabled');
+        body.style.backgroundImage = 'none';
+        bgToggle.textContent = '🖼️ 显示背景';
+    }
+    localStorage.setItem('backgroundEnabled', isBackgroundEnabled);
+    applyBlur(); // 重新应用模糊状态
+}
+// 切换背景
+function toggleBackground() {
+    isBackgroundEnabled = !isBackgroundEnabled;
+    applyBackground();
+}
+// 应用模糊效果
+function applyBlur() {
+    if (isBackgroundEnabled && isBlurEnabled) {
+        body.classList.add('bg-blur');
+        blurToggle.textContent = '❄️ 关闭模糊';
+    } else {
+        body.classList.remove('bg-blur');
+        blurToggle.textContent = '💧 开启模糊';
+    }
+    localStorage.setItem('blurEnabled', isBlurEnabled);
+}
+// 切换模糊效果
+function toggleBlur() {
+    isBlurEnabled = !isBlurEnabled;
+    applyBlur();
+}
+// 检查是否为移动设备
+function checkMobile() {
+    isMobileView = window.innerWidth <= 768;
+}
+// 切换视图
+function switchToScrollView() {
+    scrollView.style.display = 'block';
+    bookView.style.display = 'none';
+    scrollViewBtn.classList.add('active');
+    bookViewBtn.classList.remove('active');
+    document.body.style.overflow = 'auto';
+    scheduleVirtualUpdate();
+}
+function switchToBookView() {
+    scrollView.style.display = 'none';
+    bookView.style.display = 'block';
+    bookViewBtn.classList.add('active');
+    scrollViewBtn.classList.remove('active');
+    document.body.style.overflow = 'hidden';
+    checkMobile();
+    resetView();
+    showPages();
+}
+// 退出双页视图
+function exitBookView() {
+    switchToScrollView();
+}
+// 切换到另一个目录的数据 (单页应用模式下由 spa 脚本调用)
+function loadPageData(data) {
+    images = data.images;
+    imageSizes = data.imageSizes;
+    imageSrcsets = data.imageSrcsets;
+    subdirs = data.subdirs;
+    dirTags = data.dirTags;
+    nextChapter = data.nextChapter || null;
+    nextChapterRequested = false;
+    currentIndex = 0;
+    prefetchGeneration++;
+    for (const index of Array.from(pageCache.keys())) {
+        cancelPrefetch(index);
+    }
+    switchToScrollView();
+}
+// 重置视图（缩放）
+function resetView() {
+    leftScale = 1;
+    rightScale = 1;
+    applyTransform();
+}
+// 应用变换（独立缩放）
+function applyTransform() {
+    leftPage.style.transform = `scale(${leftScale})`;
+    rightPage.style.transform = `scale(${rightScale})`;
+}
+// 双页视图中一页的显示宽度 (CSS 像素)：受页面容器宽度 (移动端单页 95%，否则 45%) 和屏幕高度限制
+function pageDisplayWidth(index) {
+    const maxWidth = window.innerWidth * (isMobileView ? 0.95 : 0.45);
+    const size = imageSizes[index];
+    if (!size) {
+        return maxWidth;
+    }
+    return Math.min(maxWidth, window.innerHeight * size[0] / size[1]);
+}
+// 设置响应式图片的候选列表，浏览器按显示宽度和像素密度只下载需要的一档
+function setImageSource(img, index) {
+    const srcset = imageSrcsets && imageSrcsets[index];
+    if (srcset) {
+        img.sizes = `${Math.ceil(pageDisplayWidth(index))}px`;
+        img.srcset = srcset;
+    } else if (img.srcset) {
+        img.removeAttribute('srcset');
+        img.removeAttribute('sizes');
+    }
+    img.src = images[index];
+}
+// 设置图片的宽高属性，让浏览器在加载完成前就按正确比例排版
+function setPageImage(img, index) {
+    const size = imageSizes[index];
+    if (size) {
+        img.width = size[0];
+        img.height = size[1];
+    } else {
+        img.removeAttribute('width');
+        img.removeAttribute('height');
+    }
+    setImageSource(img, index);
+}
+// --- 双页视图预读 ---
+// 预读并解码前后几个跨页的图片，放在有上限的 LRU 缓存中，翻页时直接使用已解码的图片
+const pageCache = new Map(); // 图片序号 -> { img, ready }
+const pageCacheLimit = (prefetchSpreads + 2) * 2 + 2;
+let prefetchGeneration = 0;
+// 取消一个尚未完成的预读 (清空 src 会中止下载)
+function cancelPrefetch(index) {
+    const entry = pageCache.get(index);
+    if (entry && !entry.ready) {
+        entry.img.src = '';
+    }
+    pageCache.delete(index);
+}
+// 预读一张图片，返回解码完成的 Promise
+function prefetchPage(index) {
+    let entry = pageCache.get(index);
+    if (entry) {
+        // 移到 LRU 的末尾 (最近使用)
+        pageCache.delete(index);
+        pageCache.set(index, entry);
+        return entry.promise;
+    }
+    const img = new Image();
+    img.decoding = 'async';
+    // 和显示时使用相同的 sizes，预读的正是翻页后要显示的那一档
+    setImageSource(img, index);
+    entry = { img, ready: false };
+    entry.promise = img.decode()
+        .then(() => { entry.ready = true; })
+        .catch(() => {});
+    pageCache.set(index, entry);
+    // 超出上限时淘汰最久没有使用的图片
+    while (pageCache.size > pageCacheLimit) {
+        cancelPrefetch(pageCache.keys().next().value);
+    }
+    return entry.promise;
+}
+// 按距离从近到远预读当前页之后 prefetchSpreads 个跨页和之前一个跨页
+function prefetchAround() {
+    const generation = ++prefetchGeneration;
+    const step = isMobileView ? 1 : 2;
+    const wanted = [];
+    for (let i = 0; i < step * (prefetchSpreads + 1); i++) {
+        wanted.push(currentIndex + i);
+    }
+    for (let i = 1; i <= step; i++) {
+        wanted.push(currentIndex - i);
+    }
+    const queue = wanted.filter(index => index >= 0 && index < images.length);
+    // 快速翻页时，取消不再需要的未完成预读
+    const wantedSet = new Set(queue);
+    for (const index of Array.from(pageCache.keys())) {
+        if (!wantedSet.has(index)) {
+            const entry = pageCache.get(index);
+            if (!entry.ready) {
+                cancelPrefetch(index);
+            }
+        }
+    }
+    // 两个并发通道依次预读，翻页后旧的预读链自动停止
+    const worker = () => {
+        if (generation !== prefetchGeneration || queue.length === 0) {
+            return;
+        }
+        prefetchPage(queue.shift()).then(worker);
+    };
+    worker();
+    worker();
+}
+// 显示双页内容
+function showPages() {
+    checkMobile();
+    if (currentIndex < images.length) {
+        setPageImage(leftPage, currentIndex);
+        leftPageNumber.textContent = `第 ${currentIndex + 1} 页`;
+        leftPage.style.display = 'block';
+        leftPageNumber.style.display = 'block';
+        // 移动端显示单页（全屏）
+        if (isMobileView) {
+            leftPageContainer.style.maxWidth = '95%';
+            rightPageContainer.style.display = 'none';
+        } else {
+            leftPageContainer.style.maxWidth = '45%';
+            rightPageContainer.style.display = 'flex';
+        }
+    } else {
+        leftPage.style.display = 'none';
+        leftPageNumber.style.display = 'none';
+    }
+    if (!isMobileView && currentIndex + 1 < images.length) {
+        setPageImage(rightPage, currentIndex + 1);
+        rightPageNumber.textContent = `第 ${currentIndex + 2} 页`;
+        rightPage.style.display = 'block';
+        rightPageNumber.style.display = 'block';
+    } else {
+        rightPage.style.display = 'none';
+        rightPageNumber.style.display = 'none';
+    }
+    // 更新按钮状态
+    prevButton.disabled = currentIndex === 0;
+    nextButton.disabled = currentIndex >= images.length - (isMobileView ? 1 : 2);
+    // 重置视图
+    resetView();
+    prefetchAround();
+    if (currentIndex + OFFLINE_PRECACHE_REMAINING >= images.length) {
+        precacheNextChapter();
+    }
+}
+// 导航功能
+function goToPrev() {
+    checkMobile();
+    currentIndex = Math.max(0, currentIndex - (isMobileView ? 1 : 2));
+    showPages();
+}
+function goToNext() {
+    checkMobile();
+    currentIndex = Math.min(images.length - 1, currentIndex + (isMobileView ? 1 : 2));
+    showPages();
+}
+// 缩放功能（独立缩放）
+function zoomIn() {
+    if (!isMobileView) {
+        // 双页模式：同时放大两张图片
+        leftScale = Math.min(5, leftScale + 0.1);
+        rightScale = Math.min(5, rightScale + 0.1);
+    } else {
+        // 单页模式：只放大当前图片
+        leftScale = Math.min(5, leftScale + 0.1);
+    }
+    applyTransform();
+}
+function zoomOut() {
+    if (!isMobileView) {
+        // 双页模式：同时缩小两张图片
+        leftScale = Math.max(0.3, leftScale - 0.1);
+        rightScale = Math.max(0.3, rightScale - 0.1);
+    } else {
+        // 单页模式：只缩小当前图片
+        leftScale = Math.max(0.3, leftScale - 0.1);
+    }
+    applyTransform();
+}
+// --- 新增/修改的全局搜索功能 ---
+// 辅助函数：计算从当前页面到目标目录的相对路径
+function getRelativePathToTarget(targetPathStr) {
+     // 当前页面相对于根的路径 (不包含文件名)
+    const currentPathStr = backToRootPath ? backToRootPath.replace(/\\/$/, '') : '.';
+
+    // 如果目标是根目录
+    if (targetPathStr === '.') {
+         // 计算需要向上返回的层级数
+        const upLevels = (currentPathStr.match(/\\.\\./g) || []).length;
+        return '../'.repeat(upLevels) || './';
+    }
+
+    // 如果当前就在根目录
+    if (currentPathStr === '.') {
+        return targetPathStr + '/';
+    }
+
+    // 计算共同前缀长度
+    const currentParts = currentPathStr.split('/');
+    const targetParts = targetPathStr.split('/');
+
+    let commonLength = 0;
+    const minLength = Math.min(currentParts.length, targetParts.length);
+    while (commonLength < minLength && currentParts[commonLength] === targetParts[commonLength]) {
+        commonLength++;
+    }
+
+    // 计算需要向上返回的步数
+    const upSteps = currentParts.length - commonLength;
+    // 计算需要向下进入的路径
+    const downPath = targetParts.slice(commonLength).join('/');
+
+    // 构建相对路径
+    let relativePath = '../'.repeat(upSteps);
+    if (downPath) {
+        relativePath += downPath + '/';
+    } else if (relativePath === '') {
+         // 如果路径相同
+        relativePath = './';
+    }
+
+    return relativePath;
+}
+
+// 加载全局搜索索引 (只加载一次，分片时并行加载所有分片)
+function loadSearchIndex() {
+    if (!searchShardsPromise) {
+        const baseUrl = searchIndexUrl.slice(0, searchIndexUrl.lastIndexOf('/') + 1);
+        const fetchJson = url => fetch(url).then(response => {
+            if (!response.ok) {
+                throw new Error(`${url}: ${response.status}`);
+            }
+            return response.json();
+        });
+        searchShardsPromise = fetchJson(searchIndexUrl)
+            .then(index => index.shards ? Promise.all(index.shards.map(name => fetchJson(baseUrl + name))) : [index])
+            .then(shards => {
+                searchShards = shards.map(prepareSearchShard);
+                // 根目录所在的分片先搜索，其他分片需要知道根目录是否匹配
+                searchShards.sort((a, b) => (b.paths[0] === '.') - (a.paths[0] === '.'));
+                return searchShards;
+            })
+            .catch(error => {
+                // 允许下次搜索时重试
+                searchShardsPromise = null;
+                throw error;
+            });
+    }
+    return searchShardsPromise;
+}
+
+// 预先计算小写名称、标签和目录深度，倒排表在第一次用到时才解码
+function prepareSearchShard(shard) {
+    shard.lowerNames = shard.names.map(name => name.toLowerCase());
+    shard.lowerTags = shard.tags.map(tag => tag.toLowerCase());
+    // 父目录的编号总是更小，按编号顺序计算深度时父目录已经算好
+    shard.depths = new Array(shard.paths.length);
+    shard.paths.forEach((path, id) => {
+        const parent = shard.parents[id];
+        shard.depths[id] = parent >= 0 ? shard.depths[parent] + 1 : (path === '.' ? 0 : path.split('/').length);
+    });
+    shard.decoded = new Map();
+    return shard;
+}
+
+// 把差值形式的编号列表还原成递增的目录编号
+function decodePostings(deltas) {
+    const ids = new Array(deltas.length);
+    let id = 0;
+    for (let i = 0; i < deltas.length; i++) {
+        id += deltas[i];
+        ids[i] = id;
+    }
+    return ids;
+}
+
+// 解码后的编号列表按键缓存 (n-gram 或 '#' + 标签编号)，之后的按键不再重复解码
+function cachedPostings(shard, key, deltas) {
+    let ids = shard.decoded.get(key);
+    if (!ids) {
+        ids = decodePostings(deltas);
+        shard.decoded.set(key, ids);
+    }
+    return ids;
+}
+
+// 名称包含查询字符串的目录编号 (按递增顺序逐个产生，调用方凑够结果后可以停止)：
+// 先用 n-gram 倒排表求交集缩小候选，再逐个确认
+function* nameMatches(shard, query) {
+    const chars = Array.from(query);
+    if (chars.length < shard.n) {
+        for (let id = 0; id < shard.lowerNames.length; id++) {
+            if (shard.lowerNames[id].includes(query)) yield id;
+        }
+        return;
+    }
+    const lists = [];
+    const seen = new Set();
+    for (let i = 0; i + shard.n <= chars.length; i++) {
+        const gram = chars.slice(i, i + shard.n).join('');
+        if (seen.has(gram)) continue;
+        seen.add(gram);
+        const deltas = shard.grams[gram];
+        if (!deltas) return;
+        lists.push(cachedPostings(shard, gram, deltas));
+    }
+    // 遍历最短的列表，在其余列表中顺序前进查找同一个编号
+    lists.sort((a, b) => a.length - b.length);
+    const positions = new Array(lists.length).fill(0);
+    outer: for (const id of lists[0]) {
+        for (let k = 1; k < lists.length; k++) {
+            const list = lists[k];
+            let j = positions[k];
+            while (j < list.length && list[j] < id) j++;
+            positions[k] = j;
+            if (j === list.length) return;
+            if (list[j] !== id) continue outer;
+        }
+        if (shard.lowerNames[id].includes(query)) yield id;
+    }
+}
+
+// 标签包含查询字符串的目录编号 (递增)：合并所有匹配标签的编号列表
+function* tagMatches(shard, query) {
+    const lists = [];
+    shard.lowerTags.forEach((tag, tagId) => {
+        if (tag.includes(query)) {
+            lists.push(cachedPostings(shard, '#' + tagId, shard.tagDirs[tagId]));
+        }
+    });
+    const positions = new Array(lists.length).fill(0);
+    while (true) {
+        let id = Infinity;
+        for (let k = 0; k < lists.length; k++) {
+            if (positions[k] < lists[k].length && lists[k][positions[k]] < id) id = lists[k][positions[k]];
+        }
+        if (id === Infinity) return;
+        for (let k = 0; k < lists.length; k++) {
+            if (lists[k][positions[k]] === id) positions[k]++;
+        }
+        yield id;
+    }
+}
+
+// 在一个分片中搜索：编号顺序就是按深度排序的顺序，父目录也在结果中的项被过滤掉 (保留最顶层)。
+// matchedPaths 记录所有分片中已匹配的目录，用来判断父目录在其他分片 (根目录) 的情况；
+// 其他分片已经凑够了不深于 maxDepth 的结果时，更深的目录不需要再看。
+function searchShard(shard, query, limit, matchedPaths, maxDepth) {
+    const byName = nameMatches(shard, query);
+    const byTag = tagMatches(shard, query);
+    let nextName = byName.next().value;
+    let nextTag = byTag.next().value;
+    const matched = new Uint8Array(shard.paths.length);
+    const results = [];
+    while ((nextName !== undefined || nextTag !== undefined) && results.length < limit) {
+        // 两个递增序列按编号合并，名称匹配优先于标签匹配
+        let id;
+        let matchType;
+        if (nextTag === undefined || (nextName !== undefined && nextName <= nextTag)) {
+            id = nextName;
+            if (nextTag === id) nextTag = byTag.next().value;
+            nextName = byName.next().value;
+            matchType = 'directory';
+        } else {
+            id = nextTag;
+            nextTag = byTag.next().value;
+            matchType = 'tag';
+        }
+        if (shard.depths[id] > maxDepth) break;
+        matched[id] = 1;
+        const path = shard.paths[id];
+        matchedPaths.add(path);
+        const parent = shard.parents[id];
+        if (parent >= 0) {
+            if (matched[parent]) continue;
+        } else if (path !== '.') {
+            const slash = path.lastIndexOf('/');
+            if (matchedPaths.has(slash < 0 ? '.' : path.slice(0, slash))) continue;
+        }
+        const tagIds = shard.dirTags[id] || [];
+        results.push({
+            path,
+            matchType,
+            clean_name: shard.names[id],
+            full_path: path,
+            tags: tagIds.map(tagId => shard.tags[tagId]),
+            depth: shard.depths[id],
+        });
+    }
+    return results;
+}
+
+// 目录链接：单页应用模式下使用 ?dir= 地址，并由 spa 脚本接管导航
+function directoryHref(targetPathStr) {
+    return pageData.spa ? '?dir=' + encodeURIComponent(targetPathStr) : getRelativePathToTarget(targetPathStr);
+}
+function openDirectory(targetPathStr) {
+    if (pageData.spa && window.spaNavigate) {
+        searchResults.style.display = 'none';
+        window.spaNavigate(targetPathStr);
+    } else {
+        window.location.href = directoryHref(targetPathStr);
+    }
+}
+
+// 全局搜索功能 (合并目录名和标签搜索，并优化结果)
+function performGlobalSearch() {
+    const query = searchBox.value.toLowerCase().trim();
+    // 清空之前的搜索结果
+    searchResults.innerHTML = '';
+    // 如果查询为空，隐藏搜索结果
+    if (query === '') {
+        searchResults.style.display = 'none';
+        return;
+    }
+    // 索引尚未加载：先显示提示，加载完成后重新搜索当前输入
+    if (!searchShards) {
+        const loadingItem = document.createElement('div');
+        loadingItem.className = 'search-result-item';
+        loadingItem.textContent = '正在加载搜索索引...';
+        searchResults.appendChild(loadingItem);
+        searchResults.style.display = 'block';
+        loadSearchIndex().then(performGlobalSearch, () => {
+            loadingItem.textContent = '搜索索引加载失败';
+        });
+        return;
+    }
+
+    // 每个分片最多取 limit + 1 个结果 (多出的一个用来判断是否还有更多)，再按深度合并
+    const limit = SEARCH_RESULT_LIMIT + 1;
+    const matchedPaths = new Set();
+    let matches = [];
+    let maxDepth = Infinity;
+    for (const shard of searchShards) {
+        matches = matches.concat(searchShard(shard, query, limit, matchedPaths, maxDepth));
+        if (searchShards.length > 1 && matches.length >= limit) {
+            matches.sort((a, b) => a.depth - b.depth);
+            matches.length = limit;
+            maxDepth = matches[limit - 1].depth;
+        }
+    }
+    if (searchShards.length > 1) {
+        matches.sort((a, b) => a.depth - b.depth);
+    }
+    const hasMore = matches.length > SEARCH_RESULT_LIMIT;
+    const filteredMatches = matches.slice(0, SEARCH_RESULT_LIMIT);
+
+    // --- 显示匹配结果 ---
+    if (filteredMatches.length > 0) {
+        filteredMatches.forEach(dir => {
+            const resultItem = document.createElement('div');
+            resultItem.className = 'search-result-item';
+
+            // 计算正确的相对链接
+            const href = directoryHref(dir.path);
+
+            // 根据匹配类型决定显示内容
+            let displayText = dir.clean_name;
+            if (dir.matchType === 'tag') {
+                // 如果是标签匹配，添加标签图标
+                displayText = `<span class="search-result-tag-match-icon">🏷️</span>${displayText}`;
+            }
+
+            resultItem.innerHTML = `
+                <a href="${href}">${displayText}</a>
+                <div class="search-result-path">${dir.full_path}</div>
+            `;
+            // 添加标签显示 (如果有的话)
+            if (dir.tags && dir.tags.length > 0) {
+                const tagsContainer = document.createElement('div');
+                tagsContainer.className = 'search-result-tags';
+                dir.tags.forEach(tag => {
+                    const tagElement = document.createElement('span');
+                    tagElement.className = 'search-result-tag';
+                    tagElement.textContent = tag;
+                    tagsContainer.appendChild(tagElement);
+                });
+                resultItem.appendChild(tagsContainer);
+            }
+            // 为整个结果项添加点击事件监听器
+            resultItem.addEventListener('click', (e) => {
+                 // 阻止默认的 <a> 标签跳转，因为我们自己处理
+                e.preventDefault(); 
+                 // 使用 window.location 进行跳转 (单页应用模式下不刷新页面)
+                openDirectory(dir.path);
+            });
+            searchResults.appendChild(resultItem);
+        });
+        if (hasMore) {
+            const moreItem = document.createElement('div');
+            moreItem.className = 'search-result-item';
+            moreItem.textContent = `只显示前 ${SEARCH_RESULT_LIMIT} 个结果，输入更多字符以缩小范围`;
+            searchResults.appendChild(moreItem);
+        }
+        searchResults.style.display = 'block';
+    } else {
+        // 没有匹配结果
+        const noResultItem = document.createElement('div');
+        noResultItem.className = 'search-result-item';
+        noResultItem.textContent = '未找到匹配的目录或标签';
+        searchResults.appendChild(noResultItem);
+        searchResults.style.display = 'block';
+    }
+}
+// --- 修改结束 ---
+// --- 虚拟滚动视图 ---
+// 图片很多的目录只渲染视口附近的几项：每项的位置由图片宽高比预先算出，
+// 容器保持完整的高度，滚出范围的节点放回节点池，给新进入范围的图片复用
+const VIRTUAL_GAP = 30; // 和 .scroll-gallery 的 gap 一致
+const VIRTUAL_DEFAULT_RATIO = 1.4142; // 宽高未知的图片按 A4 竖版比例预留
+let virtualGallery = null;
+// 创建一个滚动视图的图片项 (图片 + 文件名)
+function createScrollItem() {
+    const item = document.createElement('div');
+    item.className = 'scroll-item';
+    const img = document.createElement('img');
+    img.loading = 'lazy';
+    img.decoding = 'async';
+    const label = document.createElement('div');
+    label.className = 'label';
+    item.appendChild(img);
+    item.appendChild(label);
+    return item;
+}
+// 把一张图片填入图片项；entry 为 { name, src, srcset, size }
+function fillScrollItem(item, entry) {
+    const img = item.firstChild;
+    // 先去掉旧的 srcset，复用的节点不会继续加载上一张图片
+    img.removeAttribute('srcset');
+    if (entry.size) {
+        img.width = entry.size[0];
+        img.height = entry.size[1];
+        img.style.aspectRatio = '';
+    } else {
+        img.removeAttribute('width');
+        img.removeAttribute('height');
+        img.style.aspectRatio = `1 / ${VIRTUAL_DEFAULT_RATIO}`;
+    }
+    if (entry.srcset) {
+        img.sizes = '100vw';
+        img.srcset = entry.srcset;
+    }
+    img.src = entry.src;
+    img.alt = entry.name;
+    item.lastChild.textContent = entry.name;
+}
+// 计算每一项的顶部位置 (offsets[i]) 和容器总高度 (offsets[n])
+function layoutVirtualGallery(gallery) {
+    const width = gallery.container.clientWidth - gallery.inset;
+    const count = gallery.entries.length;
+    const offsets = new Float64Array(count + 1);
+    for (let i = 0; i < count; i++) {
+        const size = gallery.entries[i].size;
+        const ratio = size ? size[1] / size[0] : VIRTUAL_DEFAULT_RATIO;
+        offsets[i + 1] = offsets[i] + width * ratio + gallery.chrome + (i + 1 < count ? VIRTUAL_GAP : 0);
+    }
+    gallery.offsets = offsets;
+    gallery.width = gallery.container.clientWidth;
+    gallery.container.style.height = `${offsets[count]}px`;
+    for (const [index, item] of gallery.active) {
+        item.style.top = `${offsets[index]}px`;
+    }
+}
+// 第一个底部超过 y 的项
+function virtualIndexAt(offsets, y) {
+    let lo = 0;
+    let hi = offsets.length - 1;
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1;
+        if (offsets[mid + 1] <= y) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    return lo;
+}
+// 按当前滚动位置渲染视口上下各一屏范围内的项
+function updateVirtualGallery() {
+    const gallery = virtualGallery;
+    if (!gallery || scrollView.style.display === 'none') {
+        return;
+    }
+    if (gallery.container.clientWidth !== gallery.width) {
+        layoutVirtualGallery(gallery);
+    }
+    const count = gallery.entries.length;
+    const viewTop = -gallery.container.getBoundingClientRect().top;
+    const first = virtualIndexAt(gallery.offsets, viewTop - window.innerHeight);
+    const last = Math.min(count - 1, virtualIndexAt(gallery.offsets, viewTop + 2 * window.innerHeight));
+    for (const [index, item] of gallery.active) {
+        if (index < first || index > last) {
+            gallery.active.delete(index);
+            gallery.pool.push(item);
+        }
+    }
+    for (let i = first; i <= last; i++) {
+        if (gallery.active.has(i)) {
+            continue;
+        }
+        let item = gallery.pool.pop();
+        if (!item) {
+            item = createScrollItem();
+            gallery.container.appendChild(item);
+        }
+        fillScrollItem(item, gallery.entries[i]);
+        item.style.top = `${gallery.offsets[i]}px`;
+        item.style.display = '';
+        gallery.active.set(i, item);
+    }
+    // 没有用到的节点留在池中，隐藏起来
+    for (const item of gallery.pool) {
+        item.style.display = 'none';
+    }
+    // 第一次渲染后量出图片以外部分 (边框、文件名) 的实际宽高，和预估不同时重新排版
+    if (!gallery.measured && gallery.active.size > 0) {
+        const item = gallery.active.values().next().value;
+        const chrome = item.offsetHeight - item.firstChild.offsetHeight;
+        const inset = gallery.width - item.firstChild.offsetWidth;
+        gallery.measured = true;
+        if (chrome > 0 && inset >= 0 && (Math.abs(chrome - gallery.chrome) > 1 || inset !== gallery.inset)) {
+            gallery.chrome = chrome;
+            gallery.inset = inset;
+            layoutVirtualGallery(gallery);
+            updateVirtualGallery();
+        }
+    }
+}
+// 在 container 中显示 entries 的虚拟滚动视图 (替换之前的虚拟视图)
+function renderVirtualGallery(container, entries) {
+    virtualGallery = {
+        container, entries, active: new Map(), pool: [],
+        chrome: 50, inset: 4, measured: false, width: -1,
+    };
+    layoutVirtualGallery(virtualGallery);
+    updateVirtualGallery();
+}
+let virtualFrame = 0;
+function scheduleVirtualUpdate() {
+    if (virtualGallery && !virtualFrame) {
+        virtualFrame = requestAnimationFrame(() => {
+            virtualFrame = 0;
+            updateVirtualGallery();
+        });
+    }
+}
+window.addEventListener('scroll', scheduleVirtualUpdate, { passive: true });
+window.addEventListener('resize', scheduleVirtualUpdate);
+// --- 离线缓存 ---
+// 启用时注册根目录的 service worker；读到本章最后几页时让它预先缓存下一章
+const offline = pageData.offline || null;
+const OFFLINE_PRECACHE_REMAINING = 4;
+let nextChapter = offline ? offline.next : null;
+let nextChapterRequested = false;
+// 读取下一章要加载的图片：返回 { url, page, book, scroll }，图片为 { src, srcset, size }，
+// 地址相对于 base。单页应用模式下由 spa 脚本替换为读取 manifest.json
+let loadChapter = function(chapter) {
+    const url = new URL(chapter, location.href).href;
+    return fetch(url).then(response => response.text()).then(html => {
+        const match = html.match(/<script id="page-data" type="application\/json">([\s\S]*?)<\/script>/);
+        const data = JSON.parse(match[1]);
+        const gallery = data.scrollGallery;
+        return {
+            url, page: url, base: url,
+            book: data.images.map((src, i) => ({ src, srcset: data.imageSrcsets[i], size: data.imageSizes[i] })),
+            scroll: gallery.srcs.map((src, i) => ({ src, srcset: gallery.srcsets[i], size: data.imageSizes[i] })),
+        };
+    });
+};
+// 按显示宽度从 srcset 中选出浏览器会加载的一档 (和 sizes 的计算方式一致)
+function pickSource(entry, cssWidth) {
+    if (!entry.srcset) {
+        return entry.src;
+    }
+    const target = cssWidth * (window.devicePixelRatio || 1);
+    const candidates = entry.srcset.split(', ').map(candidate => {
+        const space = candidate.lastIndexOf(' ');
+        return [parseInt(candidate.slice(space + 1), 10), candidate.slice(0, space)];
+    }).sort((a, b) => a[0] - b[0]);
+    const chosen = candidates.find(([w]) => w >= target) || candidates[candidates.length - 1];
+    return chosen[1];
+}
+function precacheNextChapter() {
+    const controller = navigator.serviceWorker && navigator.serviceWorker.controller;
+    if (!nextChapter || nextChapterRequested || !controller || images.length === 0) {
+        return;
+    }
+    nextChapterRequested = true;
+    const requested = nextChapter;
+    const inBookView = scrollView.style.display === 'none';
+    loadChapter(requested).then(chapter => {
+        if (requested !== nextChapter) {
+            return;
+        }
+        const maxWidth = window.innerWidth * (isMobileView ? 0.95 : 0.45);
+        const sources = inBookView
+            ? chapter.book.map(entry => pickSource(entry, entry.size
+                ? Math.min(maxWidth, window.innerHeight * entry.size[0] / entry.size[1]) : maxWidth))
+            : chapter.scroll.map(entry => pickSource(entry, window.innerWidth));
+        const urls = [chapter.page].concat(sources.map(src => new URL(src, chapter.base).href));
+        controller.postMessage({ type: 'precache', chapter: chapter.url, urls });
+    }).catch(() => {
+        nextChapterRequested = false;
+    });
+}
+// 滚动视图接近底部时预先缓存下一章
+function checkScrollNearEnd() {
+    if (nextChapter && !nextChapterRequested && scrollView.style.display !== 'none'
+            && scrollView.getBoundingClientRect().bottom < window.innerHeight * 3) {
+        precacheNextChapter();
+    }
+}
+if (offline && 'serviceWorker' in navigator) {
+    navigator.serviceWorker.register(offline.sw).catch(() => {});
+    window.addEventListener('scroll', checkScrollNearEnd, { passive: true });
+    // 第一次访问时 service worker 激活后才接管页面，图片很少的目录不需要滚动也能预先缓存
+    navigator.serviceWorker.addEventListener('controllerchange', checkScrollNearEnd);
+}
+// 事件监听器
+scrollViewBtn.addEventListener('click', switchToScrollView);
+bookViewBtn.addEventListener('click', switchToBookView);
+exitBookViewBtn.addEventListener('click', exitBookView);
+prevButton.addEventListener('click', goToPrev);
+nextButton.addEventListener('click', goToNext);
+zoomInBtn.addEventListener('click', zoomIn);
+zoomOutBtn.addEventListener('click', zoomOut);
+zoomResetBtn.addEventListener('click', resetView);
+themeToggle.addEventListener('click', toggleTheme);
+bgToggle.addEventListener('click', toggleBackground);
+blurToggle.addEventListener('click', toggleBlur);
+// 搜索框事件 (合并后，只监听一个框)
+// 连续输入时只在停顿后搜索一次
+searchBox.addEventListener('input', () => {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(performGlobalSearch, SEARCH_DEBOUNCE_MS);
+});
+// 点击其他地方隐藏搜索结果 (更新了监听器列表)
+document.addEventListener('click', (e) => {
+    if (!searchBox.contains(e.target) && 
+        !searchResults.contains(e.target)) {
+        searchResults.style.display = 'none';
+    }
+});
+// 响应窗口大小变化
+window.addEventListener('resize', function() {
+    if (bookView.style.display !== 'none') {
+        showPages();
+    }
+});
+// 键盘导航
+document.addEventListener('keydown', function(e) {
+    if (bookView.style.display !== 'none') {
+        if (e.key === 'Escape') {
+            exitBookView();
+        } else if (e.key === 'ArrowLeft') {
+            goToPrev();
+        } else if (e.key === 'ArrowRight') {
+            goToNext();
+        } else if (e.key === '+' || e.key === '=') {
+            zoomIn();
+        } else if (e.key === '-') {
+            zoomOut();
+        } else if (e.key === '0') {
+            resetView();
+        }
+    }
+});
+// 鼠标滚轮缩放
+pagesContainer.addEventListener('wheel', function(e) {
+    if (bookView.style.display !== 'none') {
+        e.preventDefault();
+        if (e.deltaY < 0) {
+            zoomIn();
+        } else {
+            zoomOut();
+        }
+    }
+});
+// 双指缩放支持（移动端）
+let initialDistance = 0;
+let initialScale = 1;
+let currentScaleTarget = null;
+pagesContainer.addEventListener('touchstart', function(e) {
+    if (e.touches.length === 2) {
+        initialDistance = Math.hypot(
+            e.touches[0].clientX - e.touches[1].clientX,
+            e.touches[0].clientY - e.touches[1].clientY
+        );
+        // 确定缩放目标
+        if (e.touches[0].clientX < window.innerWidth / 2 || e.touches[1].clientX < window.innerWidth / 2) {
+            currentScaleTarget = 'left';
+            initialScale = leftScale;
+        } else {
+            currentScaleTarget = 'right';
+            initialScale = rightScale;
+        }
+    }
+});
+pagesContainer.addEventListener('touchmove', function(e) {
+    if (e.touches.length === 2 && currentScaleTarget) {
+        e.preventDefault();
+        const currentDistance = Math.hypot(
+            e.touches[0].clientX - e.touches[1].clientX,
+            e.touches[0].clientY - e.touches[1].clientY
+        );
+        if (initialDistance > 0) {
+            const scale = initialScale * (currentDistance / initialDistance);
+            const clampedScale = Math.min(5, Math.max(0.3, scale));
+            if (currentScaleTarget === 'left') {
+                leftScale = clampedScale;
+            } else if (currentScaleTarget === 'right') {
+                rightScale = clampedScale;
+            }
+            applyTransform();
+        }
+    }
+});
+pagesContainer.addEventListener('touchend', function() {
+    initialDistance = 0;
+    currentScaleTarget = null;
+});
+// 初始化
+applyTheme();
+applyBackground();
+applyBlur();
+checkScrollNearEnd();
+if (document.getElementById('virtual-gallery')) {
+    const data = pageData.scrollGallery;
+    renderVirtualGallery(document.getElementById('virtual-gallery'), data.names.map((name, i) => ({
+        name, src: data.srcs[i], srcset: data.srcsets[i], size: imageSizes[i],
+    })));
+}
+"""
+
+# 单页应用模式的脚本：按目录获取 manifest.json，在客户端渲染目录，并用 history 导航
+SPA_JS = """// 单页应用模式：目录内容来自每个目录的 manifest.json
+(function () {
+    const manifestName = pageData.manifestName;
+    const siteDir = pageData.siteDir;
+    const pageTitle = document.getElementById('page-title');
+    const breadcrumb = document.getElementById('breadcrumb');
+    const folders = document.getElementById('folders');
+    let currentDir = null;
+    let navigationId = 0;
+
+    // 目录相对于根目录 (阅读器所在位置) 的 URL 前缀；图片的地址前面还要加上原图根目录 imageRoot
+    function dirUrl(path) {
+        return path === '.' ? '' : path.split('/').map(encodeURIComponent).join('/') + '/';
+    }
+    function dirLink(path, text) {
+        const link = document.createElement('a');
+        link.href = '?dir=' + encodeURIComponent(path);
+        link.dataset.dir = path;
+        link.textContent = text;
+        return link;
+    }
+    function noContent(text) {
+        const div = document.createElement('div');
+        div.className = 'no-content';
+        div.textContent = text;
+        return div;
+    }
+
+    function renderBreadcrumb(path) {
+        breadcrumb.innerHTML = '';
+        if (path === '.') {
+            const span = document.createElement('span');
+            span.textContent = '🏠 根目录';
+            breadcrumb.appendChild(span);
+            return;
+        }
+        breadcrumb.appendChild(dirLink('.', '🏠 根目录'));
+        const parts = path.split('/');
+        parts.forEach((part, i) => {
+            breadcrumb.appendChild(document.createTextNode(' / '));
+            breadcrumb.appendChild(dirLink(parts.slice(0, i + 1).join('/'), part));
+        });
+    }
+
+    // 图片地址：转码过的图片使用数据目录中的转码结果
+    function imageUrl(manifest, base, name) {
+        const derived = manifest.derived[name];
+        return derived ? siteDir + derived : base + encodeURIComponent(name);
+    }
+    // 响应式图片的 srcset：缩小的宽度档位加上原图本身
+    function imageSrcset(manifest, base, name, size) {
+        const variants = manifest.variants[name];
+        if (!variants || !size) {
+            return null;
+        }
+        return variants.map(([w, url]) => `${siteDir}${url} ${w}w`)
+            .concat(`${imageUrl(manifest, base, name)} ${size[0]}w`).join(', ');
+    }
+
+    // 滚动视图的图片：图片占满页面宽度，有缩略图时缩略图也作为一个候选
+    function galleryEntries(manifest, base) {
+        return manifest.images.map((name, i) => {
+            const thumb = manifest.thumbs[name];
+            const size = manifest.imageSizes[i];
+            let srcset = imageSrcset(manifest, base, name, size);
+            if (srcset && thumb) {
+                const thumbWidth = Math.min(size[0], parseInt(thumb.split('-').pop(), 10));
+                const widths = manifest.variants[name].map(([w]) => w).concat(size[0]);
+                if (!widths.includes(thumbWidth)) {
+                    srcset = `${siteDir}${thumb} ${thumbWidth}w, ${srcset}`;
+                }
+            }
+            return { name, src: thumb ? siteDir + thumb : imageUrl(manifest, base, name), srcset, size };
+        });
+    }
+
+    function renderGallery(manifest, base) {
+        scrollView.innerHTML = '';
+        virtualGallery = null;
+        if (manifest.images.length === 0) {
+            scrollView.appendChild(noContent('此目录中没有图片。'));
+            return;
+        }
+        const entries = galleryEntries(manifest, base);
+        const gallery = document.createElement('div');
+        gallery.className = 'scroll-gallery';
+        if (pageData.virtualScroll > 0 && entries.length >= pageData.virtualScroll) {
+            gallery.classList.add('virtual');
+            scrollView.appendChild(gallery);
+            renderVirtualGallery(gallery, entries);
+            return;
+        }
+        entries.forEach(entry => {
+            const item = createScrollItem();
+            fillScrollItem(item, entry);
+            gallery.appendChild(item);
+        });
+        scrollView.appendChild(gallery);
+    }
+
+    function renderFolders(manifest) {
+        folders.innerHTML = '';
+        if (manifest.subdirs.length === 0) {
+            folders.appendChild(noContent('此目录中没有子目录。'));
+            return;
+        }
+        const grid = document.createElement('div');
+        grid.className = 'folders-grid';
+        manifest.subdirs.forEach(subdir => {
+            const item = document.createElement('div');
+            item.className = 'folder-item';
+            // 别名目录 (符号链接指向的重复目录) 带有它在模型中的路径
+            const path = subdir.target || (manifest.path === '.' ? subdir.name : manifest.path + '/' + subdir.name);
+            const link = dirLink(path, '');
+            const icon = document.createElement('div');
+            icon.className = 'folder-icon';
+            icon.textContent = '📁';
+            const label = document.createElement('div');
+            label.className = 'folder-label';
+            label.textContent = subdir.label;
+            link.appendChild(icon);
+            link.appendChild(label);
+            if (subdir.tags.length > 0) {
+                const tags = document.createElement('div');
+                tags.className = 'folder-tags';
+                subdir.tags.forEach(tag => {
+                    const span = document.createElement('span');
+                    span.className = 'folder-tag';
+                    span.textContent = tag;
+                    tags.appendChild(span);
+                });
+                link.appendChild(tags);
+            }
+            item.appendChild(link);
+            grid.appendChild(item);
+        });
+        folders.appendChild(grid);
+    }
+
+    function renderDirectory(manifest) {
+        const base = imageRoot + dirUrl(manifest.path);
+        document.title = `图片库 - ${manifest.title}`;
+        pageTitle.textContent = `图片库 - ${manifest.title}`;
+        renderBreadcrumb(manifest.path);
+        renderGallery(manifest, base);
+        renderFolders(manifest);
+        const tags = {};
+        manifest.subdirs.forEach(subdir => {
+            if (subdir.tags.length > 0) {
+                tags[subdir.name] = subdir.tags;
+            }
+        });
+        loadPageData({
+            images: manifest.images.map(name => imageUrl(manifest, base, name)),
+            imageSizes: manifest.imageSizes,
+            imageSrcsets: manifest.images.map((name, i) => imageSrcset(manifest, base, name, manifest.imageSizes[i])),
+            subdirs: manifest.subdirs.map(subdir => subdir.name).filter(name => !name.startsWith('.')),
+            dirTags: tags,
+            nextChapter: manifest.next,
+        });
+    }
+
+    // 离线缓存预先读取下一章时，从它的 manifest.json 得到要加载的图片
+    loadChapter = function(path) {
+        const base = dirUrl(path);
+        const imageBase = imageRoot + base;
+        return fetch(base + manifestName).then(response => response.json()).then(manifest => ({
+            url: new URL(base, location.href).href,
+            page: new URL(base + manifestName, location.href).href,
+            base: location.href,
+            book: manifest.images.map((name, i) => ({
+                src: imageUrl(manifest, imageBase, name),
+                srcset: imageSrcset(manifest, imageBase, name, manifest.imageSizes[i]),
+                size: manifest.imageSizes[i],
+            })),
+            scroll: galleryEntries(manifest, imageBase),
+        }));
+    };
+
+    // 加载并显示一个目录；push 为 true 时新增一条历史记录
+    function navigate(path, push) {
+        const id = ++navigationId;
+        return fetch(dirUrl(path) + manifestName)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`${path}: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(manifest => {
+                // 快速连续点击时只显示最后一次导航的结果
+                if (id !== navigationId) {
+                    return;
+                }
+                const url = path === '.' ? location.pathname : '?dir=' + encodeURIComponent(path);
+                if (push && path !== currentDir) {
+                    history.pushState({ dir: path }, '', url);
+                } else {
+                    history.replaceState({ dir: path }, '', url);
+                }
+                currentDir = path;
+                renderDirectory(manifest);
+                window.scrollTo(0, 0);
+            })
+            .catch(error => {
+                console.error(error);
+                folders.innerHTML = '';
+                folders.appendChild(noContent('无法加载目录: ' + path));
+            });
+    }
+
+    function dirFromLocation() {
+        return new URLSearchParams(location.search).get('dir') || '.';
+    }
+
+    // 拦截带 data-dir 的目录链接 (保留 Ctrl/中键在新标签页打开)
+    document.addEventListener('click', e => {
+        const link = e.target.closest('a[data-dir]');
+        if (!link || e.button !== 0 || e.ctrlKey || e.metaKey || e.shiftKey) {
+            return;
+        }
+        e.preventDefault();
+        navigate(link.dataset.dir, true);
+    });
+    window.addEventListener('popstate', e => {
+        navigate(e.state && e.state.dir ? e.state.dir : dirFromLocation(), false);
+    });
+    window.spaNavigate = path => navigate(path, true);
+    navigate(dirFromLocation(), false);
+})();
+"""
+
+# 离线缓存的 service worker，写在根目录的 SERVICE_WORKER_NAME 中，
+# 前面由 render_service_worker 加上 OFFLINE_CONFIG (共享资源列表、存储上限等)
+SERVICE_WORKER_JS = """// 离线缓存：共享样式表和脚本安装时缓存；页面和图片按 "章" (所在目录) 分别缓存，
+// 超出存储上限时删除最久没有阅读的章节
+const SHELL_CACHE = 'mangapages-shell-' + OFFLINE_CONFIG.version;
+const CHAPTER_PREFIX = 'mangapages-chapter:';
+const META_CACHE = 'mangapages-meta';
+const META_KEY = 'chapters.json';
+const CACHED_AT_HEADER = 'x-mangapages-cached-at';
+const PRECACHE_CONCURRENCY = 4;
+const scopePath = new URL(self.registration.scope).pathname;
+const siteDir = scopePath + OFFLINE_CONFIG.siteDir;
+const hashedAsset = /^[a-z]+\\.[0-9a-f]{10}\\.(?:css|js)$/;
+const contentAsset = /^(?:thumbs|derived|variants)\\//;
+
+self.addEventListener('install', event => {
+    // 单个资源失败不影响安装，之后访问时再缓存
+    event.waitUntil(caches.open(SHELL_CACHE)
+        .then(cache => Promise.all(OFFLINE_CONFIG.shell.map(url => cache.add(url).catch(() => {}))))
+        .then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(caches.keys()
+        .then(keys => Promise.all(keys
+            .filter(key => key.startsWith('mangapages-shell-') && key !== SHELL_CACHE)
+            .map(key => caches.delete(key))))
+        .then(() => self.clients.claim()));
+});
+
+// --- 章节的最近阅读时间和占用空间 (保存在 META_CACHE 中) ---
+let chaptersPromise = null;
+let persistPromise = null;
+function loadChapters() {
+    if (!chaptersPromise) {
+        chaptersPromise = caches.open(META_CACHE)
+            .then(cache => cache.match(META_KEY))
+            .then(response => response ? response.json() : {})
+            .catch(() => ({}))
+            .then(data => new Map(Object.entries(data)));
+    }
+    return chaptersPromise;
+}
+// 合并短时间内的多次更新，只写一次
+function persistChapters() {
+    if (!persistPromise) {
+        persistPromise = new Promise(resolve => setTimeout(resolve, 500))
+            .then(() => Promise.all([loadChapters(), caches.open(META_CACHE)]))
+            .then(([chapters, cache]) => {
+                persistPromise = null;
+                return cache.put(META_KEY, new Response(JSON.stringify(Object.fromEntries(chapters))));
+            });
+    }
+    return persistPromise;
+}
+// 记录一次阅读 (或写入 bytes 字节)，超出存储上限时淘汰最久没有阅读的其他章节
+async function touchChapter(chapter, bytes) {
+    const chapters = await loadChapters();
+    const entry = chapters.get(chapter) || { bytes: 0, lastRead: 0 };
+    entry.bytes += bytes;
+    entry.lastRead = Date.now();
+    chapters.set(chapter, entry);
+    let total = 0;
+    for (const value of chapters.values()) {
+        total += value.bytes;
+    }
+    if (total > OFFLINE_CONFIG.budget) {
+        const oldest = Array.from(chapters.entries()).sort((a, b) => a[1].lastRead - b[1].lastRead);
+        for (const [key, value] of oldest) {
+            if (total <= OFFLINE_CONFIG.budget) {
+                break;
+            }
+            if (key === chapter) {
+                continue;
+            }
+            chapters.delete(key);
+            total -= value.bytes;
+            await caches.delete(CHAPTER_PREFIX + key);
+        }
+    }
+    return persistChapters();
+}
+async function responseSize(response) {
+    const length = Number(response.headers.get('content-length'));
+    if (length && !response.headers.get('content-encoding')) {
+        return length;
+    }
+    return (await response.clone().blob()).size;
+}
+function cacheable(response) {
+    return response.status === 200 && response.type === 'basic' && !response.redirected;
+}
+async function storeResponse(chapter, url, response) {
+    const cache = await caches.open(CHAPTER_PREFIX + chapter);
+    await cache.put(url, response.clone());
+    return touchChapter(chapter, await responseSize(response));
+}
+// 页面加上缓存时间，用来判断什么时候需要在后台重新验证
+async function stampResponse(response) {
+    const headers = new Headers(response.headers);
+    headers.set(CACHED_AT_HEADER, String(Date.now()));
+    headers.delete('content-encoding');
+    headers.delete('content-length');
+    return new Response(await response.blob(), { status: response.status, statusText: response.statusText, headers });
+}
+
+// --- 请求所属的章节 ---
+// 章节是目录的 URL 路径；单页应用模式下根目录阅读器的当前目录在 ?dir= 中
+function chapterOfPage(url) {
+    const dir = url.searchParams.get('dir');
+    if (url.pathname === scopePath && dir && dir !== '.') {
+        return scopePath + dir.split('/').map(encodeURIComponent).join('/') + '/';
+    }
+    return url.pathname.slice(0, url.pathname.lastIndexOf('/') + 1);
+}
+// 数据目录中的缩略图等按内容哈希命名、多个目录共用，归到引用它的页面所在的章节
+function chapterOfAsset(request) {
+    if (request.referrer) {
+        const referrer = new URL(request.referrer);
+        if (referrer.origin === self.location.origin) {
+            return chapterOfPage(referrer);
+        }
+    }
+    return siteDir;
+}
+
+async function cacheFirst(chapter, request, event) {
+    const cache = await caches.open(CHAPTER_PREFIX + chapter);
+    const cached = await cache.match(request.url);
+    if (cached) {
+        event.waitUntil(touchChapter(chapter, 0));
+        return cached;
+    }
+    const response = await fetch(request);
+    if (cacheable(response)) {
+        event.waitUntil(storeResponse(chapter, request.url, response.clone()));
+    }
+    return response;
+}
+// 页面和目录清单：有缓存时直接使用 (不访问网络)，缓存超过 OFFLINE_CONFIG.revalidate 毫秒后在后台重新验证
+async function pageFirst(chapter, request, event) {
+    const url = new URL(request.url);
+    url.search = '';
+    const cache = await caches.open(CHAPTER_PREFIX + chapter);
+    const cached = await cache.match(url.href);
+    if (cached) {
+        event.waitUntil(touchChapter(chapter, 0));
+        if (Date.now() - Number(cached.headers.get(CACHED_AT_HEADER) || 0) > OFFLINE_CONFIG.revalidate) {
+            event.waitUntil(revalidatePage(chapter, url.href, cached));
+        }
+        return cached;
+    }
+    const response = await fetch(request);
+    if (!cacheable(response)) {
+        return response;
+    }
+    const stamped = await stampResponse(response);
+    event.waitUntil(storeResponse(chapter, url.href, stamped.clone()));
+    return stamped;
+}
+// 页面变化说明目录内容可能变了：清空这一章的缓存，图片在下次阅读时重新下载
+async function revalidatePage(chapter, url, cached) {
+    let response;
+    try {
+        response = await fetch(url, { cache: 'no-cache' });
+    } catch (e) {
+        return;
+    }
+    if (!cacheable(response)) {
+        return;
+    }
+    const stamped = await stampResponse(response);
+    const [oldText, newText] = await Promise.all([cached.clone().text(), stamped.clone().text()]);
+    if (oldText === newText) {
+        // 只更新缓存时间
+        await (await caches.open(CHAPTER_PREFIX + chapter)).put(url, stamped);
+        return touchChapter(chapter, 0);
+    }
+    await caches.delete(CHAPTER_PREFIX + chapter);
+    (await loadChapters()).delete(chapter);
+    return storeResponse(chapter, url, stamped);
+}
+async function networkFirst(request) {
+    const cache = await caches.open(SHELL_CACHE);
+    try {
+        const response = await fetch(request);
+        if (cacheable(response)) {
+            await cache.put(request.url, response.clone());
+        }
+        return response;
+    } catch (e) {
+        const cached = await cache.match(request.url);
+        if (cached) {
+            return cached;
+        }
+        throw e;
+    }
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET' || request.headers.has('range')) {
+        return;
+    }
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin || !url.pathname.startsWith(scopePath)
+            || url.pathname === scopePath + OFFLINE_CONFIG.serviceWorker) {
+        return;
+    }
+    if (url.pathname.startsWith(siteDir)) {
+        const name = url.pathname.slice(siteDir.length);
+        if (hashedAsset.test(name)) {
+            event.respondWith(caches.match(request.url, { cacheName: SHELL_CACHE })
+                .then(cached => cached || networkFirst(request)));
+        } else if (contentAsset.test(name)) {
+            event.respondWith(cacheFirst(chapterOfAsset(request), request, event));
+        } else {
+            // 搜索索引等会随目录树变化，优先使用网络
+            event.respondWith(networkFirst(request));
+        }
+        return;
+    }
+    // 目录中的页面、清单和图片都属于这个目录所在的章节
+    const chapter = url.pathname.slice(0, url.pathname.lastIndexOf('/') + 1);
+    if (request.mode === 'navigate' || url.pathname.endsWith('/') || url.pathname.endsWith('/index.html')
+            || url.pathname.endsWith('/' + OFFLINE_CONFIG.manifestName)) {
+        event.respondWith(pageFirst(chapter, request, event));
+    } else {
+        event.respondWith(cacheFirst(chapter, request, event));
+    }
+});
+
+// 阅读器读到本章末尾附近时发来下一章的地址和要加载的文件列表
+async function precacheChapter(chapterUrl, urls) {
+    const chapter = new URL(chapterUrl).pathname;
+    const cache = await caches.open(CHAPTER_PREFIX + chapter);
+    const queue = urls.slice();
+    async function worker() {
+        while (queue.length > 0) {
+            const url = queue.shift();
+            try {
+                if (await cache.match(url)) {
+                    continue;
+                }
+                const response = await fetch(url);
+                if (cacheable(response)) {
+                    const isPage = url.endsWith('/') || url.endsWith('/' + OFFLINE_CONFIG.manifestName);
+                    await storeResponse(chapter, url, isPage ? await stampResponse(response) : response);
+                }
+            } catch (e) {
+                // 网络不可用时放弃剩下的文件
+                queue.length = 0;
+            }
+        }
+    }
+    const workers = [];
+    for (let i = 0; i < PRECACHE_CONCURRENCY; i++) {
+        workers.push(worker());
+    }
+    await Promise.all(workers);
+}
+self.addEventListener('message', event => {
+    const data = event.data;
+    if (data && data.type === 'precache' && Array.isArray(data.urls)) {
+        event.waitUntil(precacheChapter(data.chapter, data.urls));
+    }
+});
+"""
+
+# 关闭离线缓存后留在根目录的 service worker：清空缓存并注销自己
+SERVICE_WORKER_UNREGISTER_JS = """// 离线缓存已关闭：删除缓存并注销
+self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', event => {
+    event.waitUntil(caches.keys()
+        .then(keys => Promise.all(keys.filter(key => key.startsWith('mangapages-')).map(key => caches.delete(key))))
+        .then(() => self.registration.unregister()));
+});
+"""
+
+def asset_names():
+    """共享样式表和脚本的文件名，包含内容哈希，内容不变时文件名不变，可以被长期缓存"""
+    def _hashed(prefix, content, ext):
+        return f"{prefix}.{hashlib.sha1(content.encode('utf-8')).hexdigest()[:10]}.{ext}"
+    return {
+        'css': _hashed('app', APP_CSS, 'css'),
+        'js': _hashed('app', APP_JS, 'js'),
+        'spa': _hashed('spa', SPA_JS, 'js'),
+    }
+
+def write_assets(root_path):
+    """把共享的样式表和脚本写入根目录的数据目录，并删除旧版本"""
+    site_dir = site_root(root_path) / SITE_DIR_NAME
+    names = asset_names()
+    write_if_changed(site_dir / names['css'], APP_CSS)
+    write_if_changed(site_dir / names['js'], APP_JS)
+    write_if_changed(site_dir / names['spa'], SPA_JS)
+    old_assets = list(site_dir.glob('app.*.css')) + list(site_dir.glob('app.*.js')) + list(site_dir.glob('spa.*.js'))
+    for old_asset in old_assets:
+        if old_asset.name not in names.values():
+            try:
+                old_asset.unlink()
+            except OSError:
+                pass
+
+def render_service_worker():
+    """离线缓存的 service worker 脚本：前面加上共享资源列表、存储上限等配置"""
+    assets = asset_names()
+    shell = [f"{SITE_DIR_NAME}/{name}" for name in assets.values()]
+    config = {
+        'version': hashlib.sha1(''.join(shell).encode('utf-8')).hexdigest()[:10],
+        'shell': shell,
+        'siteDir': SITE_DIR_NAME + '/',
+        'serviceWorker': SERVICE_WORKER_NAME,
+        'manifestName': SPA_MANIFEST_NAME,
+        'budget': page_options['offline'] * 1024 * 1024,
+        'revalidate': OFFLINE_REVALIDATE_SECONDS * 1000,
+    }
+    return f"const OFFLINE_CONFIG = {json.dumps(config, separators=(',', ':'))};\n" + SERVICE_WORKER_JS
+
+def write_service_worker(root_path):
+    """
+    启用离线缓存时在根目录写入 service worker。
+    关闭后如果根目录还留着之前的脚本，改写成注销脚本，让已经安装的浏览器清空缓存。
+    """
+    sw_path = site_root(root_path) / SERVICE_WORKER_NAME
+    if page_options['offline']:
+        write_if_changed(sw_path, render_service_worker())
+    elif sw_path.exists():
+        write_if_changed(sw_path, SERVICE_WORKER_UNREGISTER_JS)
+
+def image_url_prefix(relative_path_str, back_to_root_path):
+    """
+    页面引用目录中原图的地址前缀。页面和图片在同一个目录时为空；
+    输出到别处时指向原图所在的目录：完整 URL 直接拼接，相对路径从页面所在位置回到输出根目录再拼接。
+    """
+    image_base = page_options['image_base']
+    if not image_base:
+        return ''
+    dir_url = '' if relative_path_str == '.' else quote(relative_path_str) + '/'
+    if urlsplit(image_base).scheme or image_base.startswith('/'):
+        return image_base + dir_url
+    return back_to_root_path + image_base + dir_url
+
+# 页面模板：固定的部分预先写好，生成页面时和逐项的图片、子目录片段按顺序输出
+PAGE_HEAD_TEMPLATE = """<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>图片库 - {page_title}</title>
-    <style id="theme-styles">
-        /* 默认主题 (浅色) */
-        :root {{
-            --bg-color: #fdf6f0;
-            --text-color: #5a3e36;
-            --header-bg: rgba(255, 255, 255, 0.9);
-            --card-bg: rgba(255, 255, 255, 0.85);
-            --border-color: #d9c7b0;
-            --shadow-color: rgba(180, 150, 130, 0.3);
-            --button-bg: #f8f0e5;
-            --button-hover: #f0e0d0;
-            --primary-color: #ff9a8b;
-            --primary-hover: #ff6b6b;
-            --nav-button-bg: rgba(255, 255, 255, 0.9);
-            --nav-button-hover: rgba(255, 255, 255, 1);
-            --zoom-button-bg: rgba(255, 255, 255, 0.9);
-            --zoom-button-hover: rgba(255, 255, 255, 1);
-            --page-number-bg: rgba(0, 0, 0, 0.5);
-            --page-number-color: #fff;
-            --accent-color: #ffb6c1;
-            --accent-hover: #ff9aa2;
-            --search-bg: rgba(255, 255, 255, 0.9);
-            --tag-bg: #ffe5e5;
-            --tag-color: #d63384;
-        }}
-        body.dark-theme {{
-            --bg-color: #2b2b3b;
-            --text-color: #e0d6eb;
-            --header-bg: rgba(50, 50, 65, 0.9);
-            --card-bg: rgba(50, 50, 65, 0.85);
-            --border-color: #6a5a8c;
-            --shadow-color: rgba(0, 0, 0, 0.5);
-            --button-bg: #3a3a4a;
-            --button-hover: #4a4a5a;
-            --primary-color: #ff7bac;
-            --primary-hover: #ff5299;
-            --nav-button-bg: rgba(50, 50, 65, 0.9);
-            --nav-button-hover: rgba(70, 70, 90, 1);
-            --zoom-button-bg: rgba(50, 50, 65, 0.9);
-            --zoom-button-hover: rgba(70, 70, 90, 1);
-            --page-number-bg: rgba(255, 255, 255, 0.2);
-            --page-number-color: #fff;
-            --accent-color: #c29fbf;
-            --accent-hover: #a97fa7;
-            --search-bg: rgba(50, 50, 65, 0.9);
-            --tag-bg: #5a3e50;
-            --tag-color: #ff7bac;
-        }}
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            margin: 0;
-            padding: 0;
-            background-color: var(--bg-color);
-            color: var(--text-color);
-            transition: background-color 0.3s, color 0.3s;
-            position: relative;
-            min-height: 100vh;
-        }}
-        /* 背景图片 */
-        body.bg-enabled {{
-            background-size: cover;
-            background-position: center;
-            background-repeat: no-repeat;
-            background-attachment: fixed;
-        }}
-        body.bg-blur {{
-            backdrop-filter: blur(5px);
-        }}
-        .container {{
-            max-width: 100%;
-            margin: 0 auto;
-            padding: 20px;
-        }}
-        header {{
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            flex-wrap: nowrap; /* 修改: 禁止换行 */
-            padding: 15px 20px;
-            background-color: var(--header-bg);
-            border-bottom: 3px solid var(--primary-color);
-            margin-bottom: 20px;
-            position: sticky;
-            top: 0;
-            z-index: 100;
-            border-radius: 0 0 10px 10px;
-            box-shadow: 0 4px 12px var(--shadow-color);
-        }}
-        h1 {{
-            margin: 0;
-            color: var(--primary-color);
-            font-size: 1.8em;
-            flex: 1 1 auto; /* 新增: 弹性布局 */
-            min-width: 0; /* 新增: 允许内容溢出容器 */
-            overflow-x: auto; /* 新增: 水平滚动 */
-            white-space: nowrap; /* 新增: 禁止换行 */
-            padding-bottom: 5px; /* 新增: 为滚动条留出空间 */
-            /* 添加滚动条样式 */
-            scrollbar-width: thin;
-            scrollbar-color: var(--border-color) transparent;
-        }}
-        h1::-webkit-scrollbar {{
-            height: 8px; /* 新增: 水平滚动条高度 */
-        }}
-        h1::-webkit-scrollbar-track {{
-            background: transparent;
-        }}
-        h1::-webkit-scrollbar-thumb {{
-            background-color: var(--border-color);
-            border-radius: 4px;
-        }}
-        .breadcrumb {{
-            margin: 10px 0;
-            font-size: 0.9em;
-            overflow-x: auto; /* 新增: 水平滚动 */
-            white-space: nowrap; /* 新增: 禁止换行 */
-            padding-bottom: 5px; /* 新增: 为滚动条留出空间 */
-            /* 添加滚动条样式 */
-            scrollbar-width: thin;
-            scrollbar-color: var(--border-color) transparent;
-        }}
-        .breadcrumb::-webkit-scrollbar {{
-            height: 8px; /* 新增: 水平滚动条高度 */
-        }}
-        .breadcrumb::-webkit-scrollbar-track {{
-            background: transparent;
-        }}
-        .breadcrumb::-webkit-scrollbar-thumb {{
-            background-color: var(--border-color);
-            border-radius: 4px;
-        }}
-        .breadcrumb a {{
-            text-decoration: none;
-            color: var(--primary-color);
-            padding: 4px 8px;
-            border-radius: 4px;
-            transition: all 0.3s;
-        }}
-        .breadcrumb a:hover {{
-            background-color: var(--button-hover);
-            text-decoration: underline;
-        }}
-        .view-controls {{
-            display: flex;
-            gap: 10px;
-            margin: 15px 0;
-        }}
-        .view-btn {{
-            padding: 8px 15px;
-            background-color: var(--button-bg);
-            border: 2px solid var(--border-color);
-            border-radius: 20px;
-            cursor: pointer;
-            transition: all 0.3s;
-            font-weight: bold;
-            box-shadow: 0 2px 5px var(--shadow-color);
-        }}
-        .view-btn.active {{
-            background-color: var(--primary-color);
-            color: white;
-            border-color: var(--primary-hover);
-        }}
-        .view-btn:hover:not(.active) {{
-            background-color: var(--button-hover);
-            transform: translateY(-2px);
-            box-shadow: 0 4px 8px var(--shadow-color);
-        }}
-        .theme-controls {{
-            display: flex;
-            gap: 10px;
-            margin: 15px 0;
-            align-items: center;
-        }}
-        .theme-toggle, .bg-toggle, .blur-toggle {{
-            padding: 8px 15px;
-            background-color: var(--button-bg);
-            border: 2px solid var(--border-color);
-            border-radius: 20px;
-            cursor: pointer;
-            transition: all 0.3s;
-            font-weight: bold;
-            box-shadow: 0 2px 5px var(--shadow-color);
-        }}
-        .theme-toggle:hover, .bg-toggle:hover, .blur-toggle:hover {{
-            background-color: var(--button-hover);
-            transform: translateY(-2px);
-            box-shadow: 0 4px 8px var(--shadow-color);
-        }}
-        /* 搜索框 */
-        .search-container {{
-            position: relative;
-            margin: 15px 0;
-            width: 100%;
-        }}
-        .search-box {{
-            width: 100%;
-            padding: 10px 15px;
-            border: 2px solid var(--border-color);
-            border-radius: 20px;
-            background-color: var(--search-bg);
-            color: var(--text-color);
-            font-size: 1em;
-            box-shadow: 0 2px 5px var(--shadow-color);
-            box-sizing: border-box;
-        }}
-        .search-box:focus {{
-            outline: none;
-            border-color: var(--primary-color);
-            box-shadow: 0 0 8px var(--accent-color);
-        }}
-        .search-results {{
-            position: absolute;
-            top: 100%;
-            left: 0;
-            right: 0;
-            background-color: var(--search-bg);
-            border: 2px solid var(--border-color);
-            border-top: none;
-            border-radius: 0 0 20px 20px;
-            max-height: 300px;
-            overflow-y: auto;
-            z-index: 200;
-            box-shadow: 0 4px 12px var(--shadow-color);
-            display: none;
-        }}
-        .search-result-item {{
-            padding: 10px 15px;
-            cursor: pointer;
-            border-bottom: 1px solid var(--border-color);
-        }}
-        .search-result-item:last-child {{
-            border-bottom: none;
-        }}
-        .search-result-item:hover {{
-            background-color: var(--button-hover);
-        }}
-        .search-result-item a {{
-            text-decoration: none;
-            color: var(--text-color);
-            display: block;
-        }}
-        .search-result-tags {{
-            display: flex;
-            flex-wrap: wrap;
-            gap: 5px;
-            margin-top: 5px;
-        }}
-        .search-result-tag {{
-            background-color: var(--tag-bg);
-            color: var(--tag-color);
-            padding: 2px 8px;
-            border-radius: 10px;
-            font-size: 0.8em;
-        }}
-        /* 新增: 搜索结果中的路径和标签匹配标识 */
-        .search-result-path {{
-            font-size: 0.8em;
-            color: var(--accent-color);
-            margin-top: 3px;
-        }}
-        .search-result-tag-match-icon {{
-            font-size: 0.8em;
-            color: var(--tag-color);
-            margin-right: 5px;
-        }}
-        /* 标签搜索 (已移除相关HTML/CSS) */
-        /* 传统滚动视图 */
-        #scroll-view {{
-            display: block;
-            width: 100%;
-        }}
-        .scroll-gallery {{
-            display: flex;
-            flex-direction: column;
-            gap: 30px;
-            width: 100%;
-        }}
-        .scroll-item {{
-            background-color: var(--card-bg);
-            border: 2px solid var(--border-color);
-            border-radius: 15px;
-            overflow: hidden;
-            box-shadow: 0 4px 15px var(--shadow-color);
-            transition: all 0.3s;
-            width: 100%;
-        }}
-        .scroll-item:hover {{
-            transform: translateY(-5px);
-            box-shadow: 0 8px 20px var(--shadow-color);
-            border-color: var(--accent-color);
-        }}
-        .scroll-item img {{
-            width: 100%;
-            height: auto;
-            display: block;
-            margin: 0 auto;
-        }}
-        .scroll-item .label {{
-            padding: 12px;
-            text-align: center;
-            background-color: rgba(255, 255, 255, 0.7);
-            border-top: 1px solid var(--border-color);
-            font-weight: bold;
-        }}
-        body.dark-theme .scroll-item .label {{
-            background-color: rgba(70, 70, 90, 0.7);
-        }}
-        /* 双页视图 */
-        #book-view {{
-            display: none;
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background-color: rgba(0, 0, 0, 0.9);
-            z-index: 1000;
-        }}
-        .book-header {{
-            position: absolute;
-            top: 0;
-            left: 0;
-            width: 100%;
-            padding: 15px 20px;
-            background-color: rgba(0, 0, 0, 0.7);
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            z-index: 1001;
-            border-bottom: 2px solid var(--primary-color);
-        }}
-        .book-title {{
-            margin: 0;
-            font-size: 1.2em;
-            color: white;
-        }}
-        .book-controls {{
-            display: flex;
-            gap: 10px;
-        }}
-        .book-control-btn {{
-            background-color: rgba(255, 255, 255, 0.2);
-            color: white;
-            border: 2px solid var(--border-color);
-            border-radius: 20px;
-            padding: 8px 12px;
-            cursor: pointer;
-            transition: all 0.3s;
-            font-weight: bold;
-            box-shadow: 0 2px 5px rgba(0,0,0,0.3);
-        }}
-        .book-control-btn:hover {{
-            background-color: rgba(255, 255, 255, 0.3);
-            transform: translateY(-2px);
-            box-shadow: 0 4px 8px rgba(0,0,0,0.4);
-        }}
-        .pages-container {{
-            position: absolute;
-            top: 70px;
-            left: 0;
-            width: 100%;
-            height: calc(100% - 70px);
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            overflow: hidden;
-        }}
-        .pages-wrapper {{
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            gap: 40px;
-            width: 100%;
-            height: 100%;
-        }}
-        .page {{
-            flex: 1;
-            text-align: center;
-            max-width: 45%;
-            height: 100%;
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-            position: relative;
-        }}
-        .page-content {{
-            width: 100%;
-            height: 100%;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            overflow: hidden;
-            position: relative;
-        }}
-        .page img {{
-            max-width: 100%;
-            max-height: 100%;
-            width: auto;
-            height: auto;
-            box-shadow: 0 8px 25px rgba(0,0,0,0.7);
-            background-color: #fff;
-            object-fit: contain;
-            user-select: none;
-            transform-origin: center center;
-            border: 3px solid white;
-            border-radius: 5px;
-        }}
-        .page-number {{
-            position: absolute;
-            bottom: 20px;
-            font-size: 0.9em;
-            color: var(--page-number-color);
-            background-color: var(--page-number-bg);
-            padding: 5px 10px;
-            border-radius: 20px;
-            font-weight: bold;
-        }}
-        .left-page-number {{
-            left: 20px;
-        }}
-        .right-page-number {{
-            right: 20px;
-        }}
-        .nav-button {{
-            position: absolute;
-            top: 50%;
-            transform: translateY(-50%);
-            background-color: var(--nav-button-bg);
-            color: var(--primary-color);
-            border: 2px solid var(--border-color);
-            font-size: 2em;
-            width: 70px;
-            height: 70px;
-            border-radius: 50%;
-            cursor: pointer;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            transition: all 0.3s;
-            user-select: none;
-            z-index: 1001;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.5);
-        }}
-        .nav-button:hover {{
-            background-color: var(--nav-button-hover);
-            transform: translateY(-50%) scale(1.1);
-            box-shadow: 0 6px 20px rgba(0,0,0,0.6);
-            color: var(--primary-hover);
-        }}
-        .nav-button:disabled {{
-            background-color: rgba(100, 100, 100, 0.3);
-            cursor: not-allowed;
-            transform: translateY(-50%);
-            color: #888;
-        }}
-        #prev-button {{
-            left: 20px;
-        }}
-        #next-button {{
-            right: 20px;
-        }}
-        .zoom-controls {{
-            position: absolute;
-            bottom: 20px;
-            left: 50%;
-            transform: translateX(-50%);
-            display: flex;
-            gap: 10px;
-            z-index: 1001;
-        }}
-        .zoom-btn {{
-            width: 50px;
-            height: 50px;
-            border-radius: 50%;
-            background-color: var(--zoom-button-bg);
-            color: var(--primary-color);
-            border: 2px solid var(--border-color);
-            font-size: 1.5em;
-            cursor: pointer;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            box-shadow: 0 4px 10px rgba(0,0,0,0.3);
-        }}
-        .zoom-btn:hover {{
-            background-color: var(--zoom-button-hover);
-            transform: scale(1.1);
-            box-shadow: 0 6px 15px rgba(0,0,0,0.4);
-            color: var(--primary-hover);
-        }}
-        .no-content {{
-            text-align: center;
-            padding: 40px;
-            color: #999;
-            font-style: italic;
-        }}
-        /* 目录网格 */
-        .folders-grid {{
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(200px, 1fr));
-            gap: 20px;
-            margin-top: 30px;
-        }}
-        .folder-item {{
-            background-color: var(--card-bg);
-            border: 2px solid var(--border-color);
-            border-radius: 15px;
-            overflow: hidden;
-            box-shadow: 0 4px 15px var(--shadow-color);
-            transition: all 0.3s;
-        }}
-        .folder-item:hover {{
-            transform: translateY(-5px);
-            box-shadow: 0 8px 20px var(--shadow-color);
-            border-color: var(--accent-color);
-        }}
-        .folder-item a {{
-            text-decoration: none;
-            color: inherit;
-            display: block;
-        }}
-        .folder-icon {{
-            width: 100%;
-            height: 150px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            background-color: rgba(255, 255, 255, 0.7);
-            font-size: 4em;
-            color: var(--text-color);
-        }}
-        body.dark-theme .folder-icon {{
-            background-color: rgba(70, 70, 90, 0.7);
-        }}
-        .folder-label {{
-            padding: 12px;
-            text-align: center;
-            white-space: nowrap;
-            overflow: hidden;
-            text-overflow: ellipsis;
-            font-weight: bold;
-        }}
-        .folder-tags {{
-            display: flex;
-            flex-wrap: wrap;
-            gap: 5px;
-            padding: 0 12px 12px 12px;
-        }}
-        .folder-tag {{
-            background-color: var(--tag-bg);
-            color: var(--tag-color);
-            padding: 2px 8px;
-            border-radius: 10px;
-            font-size: 0.8em;
-        }}
-        /* 移动端优化 */
-        @media (max-width: 768px) {{
-            .page {{
-                max-width: 95%;
-            }}
-            .pages-wrapper {{
-                gap: 10px;
-            }}
-            .nav-button {{
-                width: 50px;
-                height: 50px;
-                font-size: 1.5em;
-            }}
-            #prev-button {{
-                left: 10px;
-            }}
-            #next-button {{
-                right: 10px;
-            }}
-            .zoom-controls {{
-                bottom: 10px;
-            }}
-            .zoom-btn {{
-                width: 40px;
-                height: 40px;
-                font-size: 1.1em;
-            }}
-            .book-header {{
-                padding: 10px 15px;
-            }}
-            .book-title {{
-                font-size: 1em;
-            }}
-            .book-control-btn {{
-                padding: 6px 10px;
-                font-size: 0.9em;
-            }}
-            header {{
-                flex-direction: column;
-                text-align: center;
-            }}
-            .controls {{
-                width: 100%;
-                display: flex;
-                justify-content: center;
-                flex-wrap: wrap;
-            }}
-            /* .tag-search-container 已移除 */
-        }}
-        /* 超小屏幕优化 */
-        @media (max-width: 480px) {{
-            .nav-button {{
-                width: 40px;
-                height: 40px;
-                font-size: 1.2em;
-            }}
-            #prev-button {{
-                left: 5px;
-            }}
-            #next-button {{
-                right: 5px;
-            }}
-            .zoom-btn {{
-                width: 35px;
-                height: 35px;
-                font-size: 1em;
-            }}
-            .page-number {{
-                font-size: 0.8em;
-                padding: 3px 8px;
-            }}
-            .left-page-number {{
-                left: 10px;
-            }}
-            .right-page-number {{
-                right: 10px;
-            }}
-        }}
-    </style>
+    <title>图片库 - {title}</title>
+    <link rel="stylesheet" id="theme-styles" href="{css}">
 </head>
 <body>
     <div class="container">
         <header>
-            <h1>图片库 - {page_title}</h1>
+            <h1 id="page-title">图片库 - {title}</h1>
             <div class="controls">
                 <div class="view-controls">
                     <button id="scroll-view-btn" class="view-btn active">传统滚动</button>
@@ -781,25 +3961,9 @@ def generate_index_html(directory_path):
                 </div>
             </div>
         </header>
-        <div class="breadcrumb">
+        <div class="breadcrumb" id="breadcrumb">
 """
-    # 添加面包屑导航 (使用绝对路径避免循环)
-    if directory_path != root_path:
-        # 计算返回根目录需要的 "../" 层数
-        depth = len(relative_path_from_root.parts)
-        back_to_root = "../" * depth
-        html_content += f'<a href="{back_to_root}">🏠 根目录</a>'
-        # 添加中间路径
-        path_so_far = Path('.')
-        for i, part in enumerate(relative_path_from_root.parts):
-            path_so_far /= part
-            # 计算从当前目录返回到这个part需要的 "../" 层数
-            up_levels = len(relative_path_from_root.parts) - i - 1
-            href = "../" * up_levels if up_levels > 0 else "./"
-            html_content += f' / <a href="{href}">{part}</a>'
-    else:
-        html_content += '<span>🏠 根目录</span>'
-    html_content += """
+PAGE_SCROLL_VIEW_START = """
         </div>
         <!-- 合并后的全局搜索 -->
         <div class="search-container">
@@ -809,50 +3973,26 @@ def generate_index_html(directory_path):
         <!-- 传统滚动视图 -->
         <div id="scroll-view">
 """
-    # 添加图片项 (传统滚动视图)
-    if image_files:
-        html_content += '            <div class="scroll-gallery">\n'
-        for img_name in image_files:
-            html_content += f'''                <div class="scroll-item">
-                    <img src="{img_name}" alt="{img_name}">
-                    <div class="label">{img_name}</div>
+SCROLL_ITEM_TEMPLATE = """                <div class="scroll-item">
+                    <img src="{src}" alt="{name}"{attrs} loading="lazy" decoding="async">
+                    <div class="label">{name}</div>
                 </div>
-'''
-        html_content += '            </div>\n'
-    else:
-        html_content += '            <div class="no-content">此目录中没有图片。</div>\n'
-    html_content += """
+"""
+PAGE_FOLDERS_START = """
         </div>
         <!-- 子目录 -->
         <h2>📁 子目录</h2>
+        <div id="folders">
 """
-    # 添加子目录项 (排除点文件背景)
-    if visible_subdirs:
-        html_content += '        <div class="folders-grid">\n'
-        for dir_name in visible_subdirs:
-            # 隐藏目录使用特殊标记
-            display_name = re.sub(r'\[\[([^\]]+)\]\]', '', dir_name).strip()  # 移除标签
-            if display_name.startswith('.'):
-                display_name = f"·{display_name[1:]}"  # 隐藏目录前加点
-            elif not display_name:
-                display_name = dir_name  # 如果移除标签后为空，显示原名
-            # 获取目录标签
-            tags_html = ""
-            if dir_name in dir_tags:
-                for tag in dir_tags[dir_name]:
-                    tags_html += f'<span class="folder-tag">{tag}</span>'
-            html_content += f'''            <div class="folder-item">
-                <a href="{dir_name}/">
+FOLDER_ITEM_TEMPLATE = """            <div class="folder-item">
+                <a href="{href}/">
                     <div class="folder-icon">📁</div>
-                    <div class="folder-label">{display_name}</div>
-                    {f'<div class="folder-tags">{tags_html}</div>' if tags_html else ''}
+                    <div class="folder-label">{label}</div>
+                    {tags}
                 </a>
             </div>
-'''
-        html_content += '        </div>\n'
-    else:
-        html_content += '        <div class="no-content">此目录中没有子目录。</div>\n'
-    html_content += """
+"""
+PAGE_BOOK_VIEW = """        </div>
     </div>
     <!-- 双页漫画视图 (全屏模式) -->
     <div id="book-view">
@@ -866,12 +4006,12 @@ def generate_index_html(directory_path):
             <div class="pages-wrapper" id="pages-wrapper">
                 <div class="page" id="left-page-container">
                     <div class="page-content">
-                        <img id="left-page" src="" alt="Left Page">
+                        <img id="left-page" src="" alt="Left Page" loading="lazy" decoding="async">
                     </div>
                 </div>
                 <div class="page" id="right-page-container">
                     <div class="page-content">
-                        <img id="right-page" src="" alt="Right Page">
+                        <img id="right-page" src="" alt="Right Page" loading="lazy" decoding="async">
                     </div>
                 </div>
             </div>
@@ -886,499 +4026,1677 @@ def generate_index_html(directory_path):
             <button id="zoom-reset" class="zoom-btn">↺</button>
         </div>
     </div>
-    <script>
-        // 图片列表
-        const images = """ + js_image_list + """;
-        // 子目录列表（用于搜索，排除点文件背景）
-        const subdirs = """ + js_subdirs_list + """;
-        // 目录标签
-        const dirTags = """ + js_dir_tags + """;
-        // 全局目录信息 (新增)
-        const allDirs = """ + js_all_dirs + """;
-        // 返回根目录的路径
-        const backToRootPath = '""" + back_to_root_path + """';
-        let currentIndex = 0;
-        let leftScale = 1;
-        let rightScale = 1;
-        let isDarkTheme = localStorage.getItem('darkTheme') === 'true';
-        let isBackgroundEnabled = localStorage.getItem('backgroundEnabled') !== 'false';
-        let isBlurEnabled = localStorage.getItem('blurEnabled') === 'true';
-        let isMobileView = window.innerWidth <= 768;
-        // 视图控制元素
-        const scrollViewBtn = document.getElementById('scroll-view-btn');
-        const bookViewBtn = document.getElementById('book-view-btn');
-        const scrollView = document.getElementById('scroll-view');
-        const bookView = document.getElementById('book-view');
-        const themeToggle = document.getElementById('theme-toggle');
-        const bgToggle = document.getElementById('bg-toggle');
-        const blurToggle = document.getElementById('blur-toggle');
-        const body = document.body;
-        // 搜索元素 (合并后，移除了 tagSearchBox)
-        const searchBox = document.getElementById('search-box');
-        const searchResults = document.getElementById('search-results');
-        // 双页视图元素
-        const exitBookViewBtn = document.getElementById('exit-book-view');
-        const prevButton = document.getElementById('prev-button');
-        const nextButton = document.getElementById('next-button');
-        const pagesContainer = document.getElementById('pages-container');
-        const pagesWrapper = document.getElementById('pages-wrapper');
-        const leftPage = document.getElementById('left-page');
-        const rightPage = document.getElementById('right-page');
-        const leftPageContainer = document.getElementById('left-page-container');
-        const rightPageContainer = document.getElementById('right-page-container');
-        const leftPageNumber = document.getElementById('left-page-number');
-        const rightPageNumber = document.getElementById('right-page-number');
-        // 缩放控制元素
-        const zoomInBtn = document.getElementById('zoom-in');
-        const zoomOutBtn = document.getElementById('zoom-out');
-        const zoomResetBtn = document.getElementById('zoom-reset');
-        // 应用主题
-        function applyTheme() {
-            if (isDarkTheme) {
-                body.classList.add('dark-theme');
-                themeToggle.textContent = '☀️ 浅色';
-            } else {
-                body.classList.remove('dark-theme');
-                themeToggle.textContent = '🌙 深色';
-            }
-            localStorage.setItem('darkTheme', isDarkTheme);
-        }
-        // 切换主题
-        function toggleTheme() {
-            isDarkTheme = !isDarkTheme;
-            applyTheme();
-        }
-        // 应用背景
-        function applyBackground() {
-            if (isBackgroundEnabled) {
-                body.classList.add('bg-enabled');
-                // 使用相对于根目录的路径
-                const img = new Image();
-                img.onload = function() {
-                    body.style.backgroundImage = `url("${backToRootPath}.dotfile_background.png")`;
-                };
-                img.onerror = function() {
-                    const img2 = new Image();
-                    img2.onload = function() {
-                        body.style.backgroundImage = `url("${backToRootPath}.dotfile_background.jpg")`;
-                    };
-                    img2.onerror = function() {
-                        body.style.backgroundImage = `url("${backToRootPath}.dotfile_background.webp")`;
-                    };
-                    img2.src = `${backToRootPath}.dotfile_background.jpg`;
-                };
-                img.src = `${backToRootPath}.dotfile_background.png`;
-                bgToggle.textContent = '🖼️ 隐藏背景';
-            } else {
-                body.classList.remove('bg-enabled');
-                body.style.backgroundImage = 'none';
-                bgToggle.textContent = '🖼️ 显示背景';
-            }
-            localStorage.setItem('backgroundEnabled', isBackgroundEnabled);
-            applyBlur(); // 重新应用模糊状态
-        }
-        // 切换背景
-        function toggleBackground() {
-            isBackgroundEnabled = !isBackgroundEnabled;
-            applyBackground();
-        }
-        // 应用模糊效果
-        function applyBlur() {
-            if (isBackgroundEnabled && isBlurEnabled) {
-                body.classList.add('bg-blur');
-                blurToggle.textContent = '❄️ 关闭模糊';
-            } else {
-                body.classList.remove('bg-blur');
-                blurToggle.textContent = '💧 开启模糊';
-            }
-            localStorage.setItem('blurEnabled', isBlurEnabled);
-        }
-        // 切换模糊效果
-        function toggleBlur() {
-            isBlurEnabled = !isBlurEnabled;
-            applyBlur();
-        }
-        // 检查是否为移动设备
-        function checkMobile() {
-            isMobileView = window.innerWidth <= 768;
-        }
-        // 切换视图
-        function switchToScrollView() {
-            scrollView.style.display = 'block';
-            bookView.style.display = 'none';
-            scrollViewBtn.classList.add('active');
-            bookViewBtn.classList.remove('active');
-            document.body.style.overflow = 'auto';
-        }
-        function switchToBookView() {
-            scrollView.style.display = 'none';
-            bookView.style.display = 'block';
-            bookViewBtn.classList.add('active');
-            scrollViewBtn.classList.remove('active');
-            document.body.style.overflow = 'hidden';
-            checkMobile();
-            resetView();
-            showPages();
-        }
-        // 退出双页视图
-        function exitBookView() {
-            switchToScrollView();
-        }
-        // 重置视图（缩放）
-        function resetView() {
-            leftScale = 1;
-            rightScale = 1;
-            applyTransform();
-        }
-        // 应用变换（独立缩放）
-        function applyTransform() {
-            leftPage.style.transform = `scale(${leftScale})`;
-            rightPage.style.transform = `scale(${rightScale})`;
-        }
-        // 显示双页内容
-        function showPages() {
-            checkMobile();
-            if (currentIndex < images.length) {
-                leftPage.src = images[currentIndex];
-                leftPageNumber.textContent = `第 ${currentIndex + 1} 页`;
-                leftPage.style.display = 'block';
-                leftPageNumber.style.display = 'block';
-                // 移动端显示单页（全屏）
-                if (isMobileView) {
-                    leftPageContainer.style.maxWidth = '95%';
-                    rightPageContainer.style.display = 'none';
-                } else {
-                    leftPageContainer.style.maxWidth = '45%';
-                    rightPageContainer.style.display = 'flex';
-                }
-            } else {
-                leftPage.style.display = 'none';
-                leftPageNumber.style.display = 'none';
-            }
-            if (!isMobileView && currentIndex + 1 < images.length) {
-                rightPage.src = images[currentIndex + 1];
-                rightPageNumber.textContent = `第 ${currentIndex + 2} 页`;
-                rightPage.style.display = 'block';
-                rightPageNumber.style.display = 'block';
-            } else {
-                rightPage.style.display = 'none';
-                rightPageNumber.style.display = 'none';
-            }
-            // 更新按钮状态
-            prevButton.disabled = currentIndex === 0;
-            nextButton.disabled = currentIndex >= images.length - (isMobileView ? 1 : 2);
-            // 重置视图
-            resetView();
-        }
-        // 导航功能
-        function goToPrev() {
-            checkMobile();
-            currentIndex = Math.max(0, currentIndex - (isMobileView ? 1 : 2));
-            showPages();
-        }
-        function goToNext() {
-            checkMobile();
-            currentIndex = Math.min(images.length - 1, currentIndex + (isMobileView ? 1 : 2));
-            showPages();
-        }
-        // 缩放功能（独立缩放）
-        function zoomIn() {
-            if (!isMobileView) {
-                // 双页模式：同时放大两张图片
-                leftScale = Math.min(5, leftScale + 0.1);
-                rightScale = Math.min(5, rightScale + 0.1);
-            } else {
-                // 单页模式：只放大当前图片
-                leftScale = Math.min(5, leftScale + 0.1);
-            }
-            applyTransform();
-        }
-        function zoomOut() {
-            if (!isMobileView) {
-                // 双页模式：同时缩小两张图片
-                leftScale = Math.max(0.3, leftScale - 0.1);
-                rightScale = Math.max(0.3, rightScale - 0.1);
-            } else {
-                // 单页模式：只缩小当前图片
-                leftScale = Math.max(0.3, leftScale - 0.1);
-            }
-            applyTransform();
-        }
-        // --- 新增/修改的全局搜索功能 ---
-        // 辅助函数：计算从当前页面到目标目录的相对路径
-        function getRelativePathToTarget(targetPathStr) {
-             // 当前页面相对于根的路径 (不包含文件名)
-            const currentPathStr = backToRootPath ? backToRootPath.replace(/\\/$/, '') : '.';
-            
-            // 如果目标是根目录
-            if (targetPathStr === '.') {
-                 // 计算需要向上返回的层级数
-                const upLevels = (currentPathStr.match(/\\.\\./g) || []).length;
-                return '../'.repeat(upLevels) || './';
-            }
-            
-            // 如果当前就在根目录
-            if (currentPathStr === '.') {
-                return targetPathStr + '/';
-            }
-            
-            // 计算共同前缀长度
-            const currentParts = currentPathStr.split('/');
-            const targetParts = targetPathStr.split('/');
-            
-            let commonLength = 0;
-            const minLength = Math.min(currentParts.length, targetParts.length);
-            while (commonLength < minLength && currentParts[commonLength] === targetParts[commonLength]) {
-                commonLength++;
-            }
-            
-            // 计算需要向上返回的步数
-            const upSteps = currentParts.length - commonLength;
-            // 计算需要向下进入的路径
-            const downPath = targetParts.slice(commonLength).join('/');
-            
-            // 构建相对路径
-            let relativePath = '../'.repeat(upSteps);
-            if (downPath) {
-                relativePath += downPath + '/';
-            } else if (relativePath === '') {
-                 // 如果路径相同
-                relativePath = './';
-            }
-            
-            return relativePath;
-        }
-        
-        // 全局搜索功能 (合并目录名和标签搜索，并优化结果)
-        function performGlobalSearch() {
-            const query = searchBox.value.toLowerCase().trim();
-            // 清空之前的搜索结果
-            searchResults.innerHTML = '';
-            // 如果查询为空，隐藏搜索结果
-            if (query === '') {
-                searchResults.style.display = 'none';
-                return;
-            }
-            
-            // 过滤匹配的全局子目录
-            const matches = [];
-            for (const [path, dirInfo] of Object.entries(allDirs)) {
-                let isMatch = false;
-                let matchType = 'directory'; // 'directory' or 'tag'
-                
-                // 1. 搜索目录显示名称
-                if (dirInfo.clean_name.toLowerCase().includes(query)) {
-                    isMatch = true;
-                    matchType = 'directory';
-                } 
-                // 2. 搜索标签
-                else if (dirInfo.tags && dirInfo.tags.some(tag => tag.toLowerCase().includes(query))) {
-                    isMatch = true;
-                    matchType = 'tag';
-                }
-                
-                if (isMatch) {
-                    matches.push({path, matchType, ...dirInfo});
-                }
-            }
-            
-            // --- 优化搜索结果：过滤掉有父目录在结果中的项 ---
-            // 1. 先按路径深度排序，确保父目录在前
-            matches.sort((a, b) => {
-                const depthA = a.path === '.' ? 0 : a.path.split('/').length;
-                const depthB = b.path === '.' ? 0 : b.path.split('/').length;
-                return depthA - depthB;
-            });
-            
-            // 2. 标记哪些项的父目录在结果中
-            const matchPaths = new Set(matches.map(m => m.path));
-            for (let i = 0; i < matches.length; i++) {
-                const currentPath = matches[i].path;
-                if (currentPath === '.') continue; // 根目录没有父目录
-                
-                const parentPath = currentPath.split('/').slice(0, -1).join('/') || '.';
-                if (matchPaths.has(parentPath)) {
-                    matches[i].has_parent_in_results = true;
-                }
-            }
-            
-            // 3. 过滤掉有父目录在结果中的项 (保留最顶层)
-            const filteredMatches = matches.filter(match => !match.has_parent_in_results);
-            
-            // --- 显示匹配结果 ---
-            if (filteredMatches.length > 0) {
-                filteredMatches.forEach(dir => {
-                    const resultItem = document.createElement('div');
-                    resultItem.className = 'search-result-item';
-                    
-                    // 计算正确的相对链接
-                    const href = getRelativePathToTarget(dir.path);
-                    
-                    // 根据匹配类型决定显示内容
-                    let displayText = dir.clean_name;
-                    if (dir.matchType === 'tag') {
-                        // 如果是标签匹配，添加标签图标
-                        displayText = `<span class="search-result-tag-match-icon">🏷️</span>${displayText}`;
-                    }
-                    
-                    resultItem.innerHTML = `
-                        <a href="${href}">${displayText}</a>
-                        <div class="search-result-path">${dir.full_path}</div>
-                    `;
-                    // 添加标签显示 (如果有的话)
-                    if (dir.tags && dir.tags.length > 0) {
-                        const tagsContainer = document.createElement('div');
-                        tagsContainer.className = 'search-result-tags';
-                        dir.tags.forEach(tag => {
-                            const tagElement = document.createElement('span');
-                            tagElement.className = 'search-result-tag';
-                            tagElement.textContent = tag;
-                            tagsContainer.appendChild(tagElement);
-                        });
-                        resultItem.appendChild(tagsContainer);
-                    }
-                    // 为整个结果项添加点击事件监听器
-                    resultItem.addEventListener('click', (e) => {
-                         // 阻止默认的 <a> 标签跳转，因为我们自己处理
-                        e.preventDefault(); 
-                         // 使用 window.location 进行跳转
-                        window.location.href = href; 
-                    });
-                    searchResults.appendChild(resultItem);
-                });
-                searchResults.style.display = 'block';
-            } else {
-                // 没有匹配结果
-                const noResultItem = document.createElement('div');
-                noResultItem.className = 'search-result-item';
-                noResultItem.textContent = '未找到匹配的目录或标签';
-                searchResults.appendChild(noResultItem);
-                searchResults.style.display = 'block';
-            }
-        }
-        // --- 修改结束 ---
-        // 事件监听器
-        scrollViewBtn.addEventListener('click', switchToScrollView);
-        bookViewBtn.addEventListener('click', switchToBookView);
-        exitBookViewBtn.addEventListener('click', exitBookView);
-        prevButton.addEventListener('click', goToPrev);
-        nextButton.addEventListener('click', goToNext);
-        zoomInBtn.addEventListener('click', zoomIn);
-        zoomOutBtn.addEventListener('click', zoomOut);
-        zoomResetBtn.addEventListener('click', resetView);
-        themeToggle.addEventListener('click', toggleTheme);
-        bgToggle.addEventListener('click', toggleBackground);
-        blurToggle.addEventListener('click', toggleBlur);
-        // 搜索框事件 (合并后，只监听一个框)
-        searchBox.addEventListener('input', performGlobalSearch);
-        // 点击其他地方隐藏搜索结果 (更新了监听器列表)
-        document.addEventListener('click', (e) => {
-            if (!searchBox.contains(e.target) && 
-                !searchResults.contains(e.target)) {
-                searchResults.style.display = 'none';
-            }
-        });
-        // 响应窗口大小变化
-        window.addEventListener('resize', function() {
-            if (bookView.style.display !== 'none') {
-                showPages();
-            }
-        });
-        // 键盘导航
-        document.addEventListener('keydown', function(e) {
-            if (bookView.style.display !== 'none') {
-                if (e.key === 'Escape') {
-                    exitBookView();
-                } else if (e.key === 'ArrowLeft') {
-                    goToPrev();
-                } else if (e.key === 'ArrowRight') {
-                    goToNext();
-                } else if (e.key === '+' || e.key === '=') {
-                    zoomIn();
-                } else if (e.key === '-') {
-                    zoomOut();
-                } else if (e.key === '0') {
-                    resetView();
-                }
-            }
-        });
-        // 鼠标滚轮缩放
-        pagesContainer.addEventListener('wheel', function(e) {
-            if (bookView.style.display !== 'none') {
-                e.preventDefault();
-                if (e.deltaY < 0) {
-                    zoomIn();
-                } else {
-                    zoomOut();
-                }
-            }
-        });
-        // 双指缩放支持（移动端）
-        let initialDistance = 0;
-        let initialScale = 1;
-        let currentScaleTarget = null;
-        pagesContainer.addEventListener('touchstart', function(e) {
-            if (e.touches.length === 2) {
-                initialDistance = Math.hypot(
-                    e.touches[0].clientX - e.touches[1].clientX,
-                    e.touches[0].clientY - e.touches[1].clientY
-                );
-                // 确定缩放目标
-                if (e.touches[0].clientX < window.innerWidth / 2 || e.touches[1].clientX < window.innerWidth / 2) {
-                    currentScaleTarget = 'left';
-                    initialScale = leftScale;
-                } else {
-                    currentScaleTarget = 'right';
-                    initialScale = rightScale;
-                }
-            }
-        });
-        pagesContainer.addEventListener('touchmove', function(e) {
-            if (e.touches.length === 2 && currentScaleTarget) {
-                e.preventDefault();
-                const currentDistance = Math.hypot(
-                    e.touches[0].clientX - e.touches[1].clientX,
-                    e.touches[0].clientY - e.touches[1].clientY
-                );
-                if (initialDistance > 0) {
-                    const scale = initialScale * (currentDistance / initialDistance);
-                    const clampedScale = Math.min(5, Math.max(0.3, scale));
-                    if (currentScaleTarget === 'left') {
-                        leftScale = clampedScale;
-                    } else if (currentScaleTarget === 'right') {
-                        rightScale = clampedScale;
-                    }
-                    applyTransform();
-                }
-            }
-        });
-        pagesContainer.addEventListener('touchend', function() {
-            initialDistance = 0;
-            currentScaleTarget = null;
-        });
-        // 初始化
-        applyTheme();
-        applyBackground();
-        applyBlur();
-    </script>
+    <script id="page-data" type="application/json">"""
+PAGE_TAIL_TEMPLATE = """</script>
+    <script src="{js}"></script>{extra_scripts}
 </body>
 </html>"""
-    # 写入 index.html 文件
-    index_file_path = directory_path / 'index.html'
+# 页面数据和 manifest.json 的 JSON 编码器
+PAGE_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+def render_index_html(relative_path_str):
+    """根据 all_directories_info 中的目录模型生成一个目录的 index.html 内容 (完整字符串)"""
+    return ''.join(render_index_chunks(relative_path_str))
+
+def subdir_href(relative_path_str, dir_name):
+    """子目录页面相对于本页的地址 (不含结尾的 /)：别名目录指向模型中同一个目录的页面"""
+    target = all_directories_info[relative_path_str].get('aliases', {}).get(dir_name)
+    if target is None:
+        return quote(dir_name)
+    depth = 0 if relative_path_str == '.' else relative_path_str.count('/') + 1
+    return '../' * depth + quote(target)
+
+def render_index_chunks(relative_path_str):
+    """
+    按顺序生成一个目录的 index.html 的各个片段，包含该目录下的所有支持的图片和子目录链接。
+    固定部分来自预先写好的模板，图片、子目录和页面数据逐项输出，
+    写入时不需要把整个页面拼成一个字符串；文本经过 HTML 转义，页面数据经过 JSON 编码。
+    """
+    info = all_directories_info[relative_path_str]
+    image_files = info['images']
+    subdirectories = info['subdirs']
+    # 提取目录标签
+    dir_tags = {}
+    for dir_name in subdirectories:
+        # 提取标签 [[tag]]
+        tags = re.findall(r'\[\[([^\]]+)\]\]', dir_name)
+        if tags:
+            dir_tags[dir_name] = tags
+    # 生成 HTML 内容
+    relative_path_from_root = Path(relative_path_str)
+    page_title = relative_path_str if relative_path_str != '.' else '根目录'
+    # 计算返回根目录的路径（用于背景图片路径）
+    depth = len(relative_path_from_root.parts) if relative_path_str != '.' else 0
+    back_to_root_path = "../" * depth
+    # 滚动视图优先使用缩略图，双页视图始终加载原图
+    thumbs = info.get('thumbs', {})
+    thumb_base = back_to_root_path + SITE_DIR_NAME + '/' + THUMB_DIR_NAME + '/'
+    # 转码过的图片 (BMP/TIFF/大 PNG) 用转码结果代替原图
+    derived = info.get('derived', {})
+    derived_base = back_to_root_path + SITE_DIR_NAME + '/' + DERIVED_DIR_NAME + '/'
+    image_prefix = image_url_prefix(relative_path_str, back_to_root_path)
+    image_urls = [derived_base + derived[img] if img in derived else image_prefix + img for img in image_files]
+    # 图片宽高 (未知时为 null)，双页视图用来预留图片比例
+    image_meta = info.get('image_meta', {})
+    image_sizes = []
+    for img in image_files:
+        entry = image_meta.get(img, {})
+        image_sizes.append([entry['width'], entry['height']] if entry.get('width') else None)
+    # 响应式图片：缩小的宽度档位加上原图 (或转码结果) 本身，由浏览器按显示宽度选择
+    variants = info.get('variants', {})
+    variant_base = back_to_root_path + SITE_DIR_NAME + '/' + VARIANT_DIR_NAME + '/'
+    image_srcsets = []
+    for img, img_url, size in zip(image_files, image_urls, image_sizes):
+        if img in variants and size:
+            candidates = [f"{variant_base}{name} {w}w" for w, name in variants[img]]
+            candidates.append(f"{img_url if img in derived else image_prefix + quote(img)} {size[0]}w")
+            image_srcsets.append(', '.join(candidates))
+        else:
+            image_srcsets.append(None)
+    # 滚动视图的图片地址和 srcset：图片占满页面宽度，有缩略图时缩略图也作为一个候选
+    scroll_srcs = []
+    scroll_srcsets = []
+    for img, img_url, size, srcset in zip(image_files, image_urls, image_sizes, image_srcsets):
+        scroll_srcs.append(thumb_base + thumbs[img] if img in thumbs else img_url)
+        if srcset and img in thumbs:
+            thumb_width = min(size[0], int(thumbs[img].rsplit('-', 1)[1].split('.')[0]))
+            if thumb_width not in [w for w, _ in variants[img]] + [size[0]]:
+                srcset = f"{thumb_base}{thumbs[img]} {thumb_width}w, {srcset}"
+        scroll_srcsets.append(srcset)
+    # 图片很多时滚动视图由脚本虚拟渲染，页面里不写出每一项
+    virtual_scroll = 0 < page_options['virtual_scroll'] <= len(image_files)
+    # 共享的样式表和脚本放在根目录的数据目录中
+    assets = asset_names()
+    asset_base = back_to_root_path + SITE_DIR_NAME + '/'
+    # 本页数据，供共享脚本读取 (子目录列表用于搜索，排除隐藏目录)
+    page_data = {
+        'images': image_urls,
+        'imageSizes': image_sizes,
+        'imageSrcsets': image_srcsets,
+        'subdirs': [dir for dir in subdirectories if not dir.startswith('.')],
+        'dirTags': dir_tags,
+        'backToRootPath': back_to_root_path,
+        'prefetchSpreads': page_options['prefetch_spreads'],
+        'searchIndexUrl': asset_base + SEARCH_INDEX_FILE,
+    }
+    if page_options['image_base']:
+        # 原图不在页面旁边：背景图片 (以及单页应用模式下所有目录的图片) 从原图根目录加载
+        page_data['imageRoot'] = image_url_prefix('.', back_to_root_path)
+    if page_options['offline']:
+        # 离线缓存：根目录的 service worker 和下一章 (同级的下一个目录) 的地址
+        next_path = info.get('next')
+        page_data['offline'] = {
+            'sw': back_to_root_path + SERVICE_WORKER_NAME,
+            'next': '../' + quote(next_path.rsplit('/', 1)[-1]) + '/' if next_path else None,
+        }
+    if virtual_scroll or page_options['offline']:
+        # 虚拟滚动视图按这份数据渲染；预先缓存下一章时也按它选择滚动视图要加载的图片
+        page_data['scrollGallery'] = {'names': image_files, 'srcs': scroll_srcs, 'srcsets': scroll_srcsets}
+    extra_scripts = ''
+    if page_options['mode'] == 'spa':
+        # 单页应用模式只有根目录有这个页面，目录内容由 spa 脚本根据 manifest.json 渲染
+        page_data.update({'spa': True, 'manifestName': SPA_MANIFEST_NAME, 'siteDir': asset_base,
+                          'virtualScroll': page_options['virtual_scroll']})
+        extra_scripts = f'\n    <script src="{asset_base}{assets["spa"]}"></script>'
+
+    yield PAGE_HEAD_TEMPLATE.format(title=html.escape(page_title), css=asset_base + assets['css'])
+    # 添加面包屑导航 (使用相对路径，按层数返回上级目录)
+    if relative_path_str != '.':
+        yield f'<a href="{back_to_root_path}">🏠 根目录</a>'
+        parts = relative_path_from_root.parts
+        for i, part in enumerate(parts):
+            # 计算从当前目录返回到这个part需要的 "../" 层数
+            up_levels = len(parts) - i - 1
+            href = "../" * up_levels if up_levels > 0 else "./"
+            yield f' / <a href="{href}">{html.escape(part)}</a>'
+    else:
+        yield '<span>🏠 根目录</span>'
+    yield PAGE_SCROLL_VIEW_START
+    # 添加图片项 (传统滚动视图)
+    if virtual_scroll:
+        yield '            <div class="scroll-gallery virtual" id="virtual-gallery"></div>\n'
+    elif image_files:
+        yield '            <div class="scroll-gallery">\n'
+        for img_name, size, src, srcset in zip(image_files, image_sizes, scroll_srcs, scroll_srcsets):
+            # 宽高让浏览器在图片加载前就能预留位置，避免页面跳动
+            size_attrs = f' width="{size[0]}" height="{size[1]}"' if size else ''
+            if srcset:
+                size_attrs += f' srcset="{html.escape(srcset)}" sizes="100vw"'
+            yield SCROLL_ITEM_TEMPLATE.format(src=html.escape(src), name=html.escape(img_name), attrs=size_attrs)
+        yield '            </div>\n'
+    else:
+        yield '            <div class="no-content">此目录中没有图片。</div>\n'
+    yield PAGE_FOLDERS_START
+    # 添加子目录项 (隐藏目录显示为带点的名称)
+    if subdirectories:
+        yield '        <div class="folders-grid">\n'
+        for dir_name in subdirectories:
+            tags_html = ''.join(f'<span class="folder-tag">{html.escape(tag)}</span>'
+                                for tag in dir_tags.get(dir_name, ()))
+            yield FOLDER_ITEM_TEMPLATE.format(
+                href=html.escape(subdir_href(relative_path_str, dir_name)), label=html.escape(folder_label(dir_name)),
+                tags=f'<div class="folder-tags">{tags_html}</div>' if tags_html else '')
+        yield '        </div>\n'
+    else:
+        yield '        <div class="no-content">此目录中没有子目录。</div>\n'
+    yield PAGE_BOOK_VIEW
+    # 页面数据一次编码 (C 实现的编码器比逐段 iterencode 快得多)；"</" 转义后不会提前结束 <script>
+    yield PAGE_JSON_ENCODER.encode(page_data).replace('</', '<\\/')
+    yield PAGE_TAIL_TEMPLATE.format(js=asset_base + assets['js'], extra_scripts=extra_scripts)
+
+def render_directory_manifest(relative_path_str):
+    """单页应用模式下一个目录的 manifest.json 内容 (完整字符串)"""
+    return json.dumps(directory_manifest(relative_path_str), ensure_ascii=False, separators=(',', ':'))
+
+def directory_manifest(relative_path_str):
+    """
+    单页应用模式下一个目录的 manifest.json 数据：
+    图片、宽高、缩略图、转码图片、响应式图片、子目录 (显示名称和标签)，由根目录的阅读器在客户端渲染。
+    """
+    info = all_directories_info[relative_path_str]
+    image_meta = info.get('image_meta', {})
+    image_sizes = []
+    for img in info['images']:
+        entry = image_meta.get(img, {})
+        image_sizes.append([entry['width'], entry['height']] if entry.get('width') else None)
+    manifest = {
+        'path': relative_path_str,
+        'title': relative_path_str if relative_path_str != '.' else '根目录',
+        'images': info['images'],
+        'imageSizes': image_sizes,
+        'thumbs': {img: f"{THUMB_DIR_NAME}/{name}" for img, name in info.get('thumbs', {}).items()},
+        'derived': {img: f"{DERIVED_DIR_NAME}/{name}" for img, name in info.get('derived', {}).items()},
+        'variants': {img: [[w, f"{VARIANT_DIR_NAME}/{name}"] for w, name in variants]
+                     for img, variants in info.get('variants', {}).items()},
+        'subdirs': [
+            {'name': dir_name, 'label': folder_label(dir_name),
+             'tags': re.findall(r'\[\[([^\]]+)\]\]', dir_name)}
+            for dir_name in info['subdirs']
+        ],
+    }
+    # 别名目录 (符号链接指向的重复目录) 链接到模型中同一个目录的路径
+    for subdir in manifest['subdirs']:
+        if subdir['name'] in info.get('aliases', {}):
+            subdir['target'] = info['aliases'][subdir['name']]
+    if page_options['offline']:
+        # 下一章的目录路径，阅读器读到本章末尾时让 service worker 预先缓存
+        manifest['next'] = info.get('next')
+    return manifest
+
+def render_page_chunks(relative_path_str):
+    """write_pages 为一个目录写入的内容 (index.html，单页应用模式下为 manifest.json)，按片段生成"""
+    if page_options['mode'] == 'spa':
+        return [PAGE_JSON_ENCODER.encode(directory_manifest(relative_path_str))]
+    return render_index_chunks(relative_path_str)
+
+def write_pages(root_path_str, pages, options=None, out_of_tree=False):
+    """
+    生成并写入一批页面。pages 是 (相对路径, 目录信息) 的列表，
+    目录信息和生成选项由调用方传入，因此也可以在子进程中运行。
+    root_path_str 是页面的输出根目录；out_of_tree 为 True 时它不是图片目录本身，
+    缺少的目录会被创建，写入页面也不会改变图片目录的 mtime。
+    返回 (相对路径, 状态) 的列表，状态为 'written'/'same'/'failed'。
+    """
+    if options is not None:
+        page_options.update(options)
+    results = []
+    for relative_path_str, info in pages:
+        all_directories_info[relative_path_str] = info
+        # 写入 index.html (单页应用模式下为 manifest.json) 文件，边生成边写入
+        directory = os.path.join(root_path_str, relative_path_str)
+        index_file_path = os.path.join(directory, output_file_name())
+        if out_of_tree:
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                print(f"错误: 无法创建目录 '{directory}': {e}")
+        if write_chunks_if_changed(index_file_path, render_page_chunks(relative_path_str)):
+            print(f"已生成: {index_file_path}")
+            status = 'written'
+            # 切换生成模式后删除另一种模式留下的页面 (单页应用模式下根目录的 index.html 是阅读器页面)
+            other_name = 'index.html' if page_options['mode'] == 'spa' else SPA_MANIFEST_NAME
+            if other_name != 'index.html' or relative_path_str != '.':
+                remove_generated_pages(directory, relative_path_str, (other_name,))
+        elif os.path.exists(index_file_path):
+            status = 'same'
+        else:
+            status = 'failed'
+        results.append((relative_path_str, status))
+    return results
+
+def is_generated_page(file_path, relative_path_str):
+    """
+    file_path 是否是生成器为 relative_path_str 目录写入的页面：
+    index.html 引用数据目录中的样式表，manifest.json 以这个目录的路径开头。用户自己的同名文件返回 False。
+    """
     try:
-        with open(index_file_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        print(f"已生成: {index_file_path}")
-    except Exception as e:
-        print(f"错误: 无法写入文件 '{index_file_path}': {e}")
+        with open(file_path, 'r', encoding='utf-8') as f:
+            head = f.read(4096)
+    except (OSError, UnicodeDecodeError):
+        return False
+    if os.path.basename(file_path) == SPA_MANIFEST_NAME:
+        return head.startswith('{"path":' + PAGE_JSON_ENCODER.encode(relative_path_str) + ',')
+    return head.startswith('<!DOCTYPE html>') and re.search(
+        r'<link rel="stylesheet" id="theme-styles" href="[^"]*' + re.escape(SITE_DIR_NAME) + r'/app\.', head) is not None
+
+def remove_generated_pages(directory, relative_path_str, names):
+    """删除 directory 中由生成器写入的 names 页面，用户自己的同名文件保留。返回删除的文件数"""
+    removed = 0
+    for name in names:
+        file_path = os.path.join(directory, name)
+        if not is_generated_page(file_path, relative_path_str):
+            continue
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            print(f"警告: 无法删除 '{file_path}': {e}")
+            continue
+        print(f"已删除: {file_path}")
+        removed += 1
+    return removed
+
+def remove_stale_pages(root_path, previous):
+    """
+    删除写过页面、但已经不在目录模型中的目录 (被 .mangaignore 忽略、超出 --max-depth、
+    被 --only-image-dirs 剪枝) 里由生成器写入的页面。previous 是 {相对路径: 页面签名}，
+    取自上一次运行的目录库或刷新之前的目录模型。目录本身已经删除的跳过；
+    现在是别名 (符号链接) 的路径和模型中的某个目录是同一个物理目录，那里的页面属于模型中的目录，也跳过。
+    返回删除的页面数。
+    """
+    output_path = site_root(root_path)
+    real_output_path = os.path.realpath(output_path)
+    removed = 0
+    # 先处理深层目录，输出目录中只剩空目录时可以逐层删除
+    for relative_path_str in sorted(previous, key=lambda p: p.count('/'), reverse=True):
+        if relative_path_str in all_directories_info or not previous[relative_path_str]:
+            continue
+        if relative_path_str in directory_aliases:
+            continue
+        directory = output_path / relative_path_str
+        real_path = os.path.relpath(os.path.realpath(directory), real_output_path).replace(os.sep, '/')
+        if real_path in all_directories_info:
+            # 上级目录是符号链接，同样指向模型中的目录
+            continue
+        removed += remove_generated_pages(directory, relative_path_str, ('index.html', SPA_MANIFEST_NAME))
+        if output_options['dir']:
+            try:
+                directory.rmdir()
+            except OSError:
+                pass
+    return removed
+
+def split_pages_by_subtree(pending, chunk_size=PAGES_PER_TASK):
+    """把待生成的页面按一级目录分组，再切成不超过 chunk_size 的任务"""
+    groups = {}
+    for relative_path_str in pending:
+        groups.setdefault(relative_path_str.split('/', 1)[0], []).append(relative_path_str)
+    tasks = []
+    current = []
+    for top in sorted(groups):
+        for relative_path_str in groups[top]:
+            current.append(relative_path_str)
+            if len(current) >= chunk_size:
+                tasks.append(current)
+                current = []
+    if current:
+        tasks.append(current)
+    return tasks
+
+def write_changed_pages(root_path, paths, jobs=1):
+    """
+    为 paths 中页面签名变化了的目录重新生成页面，返回 (生成的页面数, 没有变化的页面数)。
+    写入成功的目录记录新的签名。目录 mtime 仍然是扫描时的值：写入页面会改变目录的 mtime，
+    但扫描之后、写入之前加入的文件也会改变它，所以下一次运行重新列一次写过页面的目录
+    (页面签名不变，不会重写)，而不是采用写入后的 mtime 把新文件藏起来。
+    """
+    skipped = 0
+    pending = []
+    signatures = {}
+    output_path_str = os.fspath(site_root(root_path))
+    out_of_tree = output_options['dir'] is not None
+    output_name = output_file_name()
+    if page_options['offline']:
+        link_chapters(paths)
+    for relative_path_str in paths:
+        info = all_directories_info[relative_path_str]
+        if info['archive']:
+            # 页面无法写进压缩包，由内置服务器按需生成
+            continue
+        signature = page_signature(relative_path_str)
+        if signature == info['page_key']:
+            # 输出到图片目录之外时，删除页面不会改变图片目录的 mtime，扫描得到的 has_index 不可信
+            if out_of_tree:
+                has_index = os.path.exists(os.path.join(output_path_str, relative_path_str, output_name))
+            else:
+                has_index = info['has_index']
+            if has_index:
+                skipped += 1
+                continue
+        signatures[relative_path_str] = signature
+        pending.append(relative_path_str)
+
+    tasks = [[(path, all_directories_info[path]) for path in task]
+             for task in split_pages_by_subtree(pending)]
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            batches = list(executor.map(write_pages, [output_path_str] * len(tasks), tasks,
+                                        [page_options] * len(tasks), [out_of_tree] * len(tasks)))
+    else:
+        batches = [write_pages(output_path_str, task, out_of_tree=out_of_tree) for task in tasks]
+
+    written = 0
+    for batch in batches:
+        for relative_path_str, status in batch:
+            if status == 'failed':
+                # 写入失败，不记录签名，下次运行重试
+                continue
+            if status == 'written':
+                written += 1
+            else:
+                skipped += 1
+            info = all_directories_info[relative_path_str]
+            info['has_index'] = True
+            info['page_key'] = signatures[relative_path_str]
+    return written, skipped
+
+# --profile 时的统计 (BuildProfile)，None 表示不统计，生成过程没有任何额外开销
+profiler = None
+
+class BuildProfile:
+    """
+    --profile 的统计：每个阶段的用时，以及每个目录扫描、提取标签、生成页面、写入页面的用时和页面字节数。
+    install() 用计时的包装函数替换模块中的几个函数，uninstall() 换回原函数，
+    不启用时生成过程中的代码完全不变。
+    页面是边生成边写入的，生成用时是取下一个片段所花的时间，写入用时是其余的时间。
+    """
+    # 按目录计时的函数和对应的统计项
+    DIRECTORY_FUNCTIONS = {
+        'scan_directory': 'scan',
+        'make_directory_info': 'tags',
+    }
+
+    def __init__(self):
+        self.phases = {}
+        self.dirs = {}
+        self.writes = {'files': 0, 'written': 0, 'bytes': 0, 'seconds': 0.0}
+        self.originals = {}
+        self.output_root = None
+
+    def dir_stats(self, relative_path_str):
+        stats = self.dirs.get(relative_path_str)
+        if stats is None:
+            stats = self.dirs[relative_path_str] = {'scan': 0.0, 'tags': 0.0, 'render': 0.0, 'write': 0.0, 'bytes': 0}
+        return stats
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def install(self, root_path):
+        """用计时的版本替换 DIRECTORY_FUNCTIONS、write_if_changed 和 write_chunks_if_changed"""
+        module = globals()
+        self.output_root = os.fspath(site_root(root_path))
+        for name, key in self.DIRECTORY_FUNCTIONS.items():
+            self.originals[name] = module[name]
+            module[name] = self._timed(module[name], key, 1 if name == 'scan_directory' else 0)
+        self.originals['write_if_changed'] = module['write_if_changed']
+        module['write_if_changed'] = self._timed_write(module['write_if_changed'])
+        self.originals['write_chunks_if_changed'] = module['write_chunks_if_changed']
+        module['write_chunks_if_changed'] = self._timed_page_write(module['write_chunks_if_changed'])
+
+    def uninstall(self):
+        globals().update(self.originals)
+        self.originals = {}
+
+    def _timed(self, func, key, path_arg):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            self.dir_stats(args[path_arg])[key] += time.perf_counter() - start
+            return result
+        return wrapper
+
+    def _page_dir(self, file_path):
+        """页面文件所在的目录在模型中的相对路径，不是页面时返回 None"""
+        relative_path_str = os.path.relpath(os.path.dirname(os.fspath(file_path)), self.output_root)
+        relative_path_str = relative_path_str.replace(os.sep, '/')
+        return relative_path_str if relative_path_str in all_directories_info else None
+
+    def _timed_page_write(self, func):
+        def wrapper(file_path, chunks):
+            relative_path_str = self._page_dir(file_path)
+            timing = {'render': 0.0, 'bytes': 0}
+
+            def _timed_chunks():
+                it = iter(chunks)
+                while True:
+                    start = time.perf_counter()
+                    chunk = next(it, None)
+                    timing['render'] += time.perf_counter() - start
+                    if chunk is None:
+                        return
+                    timing['bytes'] += len(chunk.encode('utf-8'))
+                    yield chunk
+
+            start = time.perf_counter()
+            result = func(file_path, _timed_chunks())
+            elapsed = time.perf_counter() - start
+            self.writes['files'] += 1
+            self.writes['seconds'] += elapsed - timing['render']
+            if result:
+                self.writes['written'] += 1
+                self.writes['bytes'] += timing['bytes']
+            if relative_path_str is not None:
+                stats = self.dir_stats(relative_path_str)
+                stats['render'] += timing['render']
+                stats['write'] += elapsed - timing['render']
+                stats['bytes'] += timing['bytes']
+            return result
+        return wrapper
+
+    def _timed_write(self, func):
+        def wrapper(file_path, content):
+            start = time.perf_counter()
+            result = func(file_path, content)
+            elapsed = time.perf_counter() - start
+            self.writes['files'] += 1
+            self.writes['seconds'] += elapsed
+            if result:
+                self.writes['written'] += 1
+                self.writes['bytes'] += len(content.encode('utf-8'))
+            # 页面文件记在所在目录名下
+            relative_path_str = self._page_dir(file_path)
+            if relative_path_str is not None:
+                self.dir_stats(relative_path_str)['write'] += elapsed
+            return result
+        return wrapper
+
+    def report(self, limit=10):
+        """打印各阶段用时、合计和最慢的目录"""
+        print("性能统计 (--profile):")
+        total = sum(self.phases.values())
+        for name, seconds in self.phases.items():
+            share = seconds / total * 100 if total else 0
+            print(f"  {seconds:8.3f} 秒 {share:5.1f}%  {name}")
+        print(f"  {total:8.3f} 秒 100.0%  合计")
+        sums = {key: sum(stats[key] for stats in self.dirs.values()) for key in ('scan', 'tags', 'render', 'write')}
+        page_bytes = sum(stats['bytes'] for stats in self.dirs.values())
+        print(f"  目录 {len(self.dirs)} 个：扫描 {sums['scan']:.3f} 秒 (其中标签 {sums['tags']:.3f} 秒)，"
+              f"生成页面 {sums['render']:.3f} 秒 ({page_bytes / 1024:.1f} KB)，写入页面 {sums['write']:.3f} 秒")
+        print(f"  写入文件: 检查 {self.writes['files']} 个，实际写入 {self.writes['written']} 个 "
+              f"({self.writes['bytes'] / 1024:.1f} KB)，用时 {self.writes['seconds']:.3f} 秒")
+        slowest = sorted(self.dirs.items(), key=lambda item: item[1]['scan'] + item[1]['render'] + item[1]['write'],
+                         reverse=True)[:limit]
+        if slowest:
+            print(f"  最慢的 {len(slowest)} 个目录 (扫描 + 生成 + 写入):")
+            for relative_path_str, stats in slowest:
+                print(f"    {(stats['scan'] + stats['render'] + stats['write']) * 1000:8.2f} ms  "
+                      f"扫描 {stats['scan'] * 1000:.2f}  生成 {stats['render'] * 1000:.2f}  "
+                      f"写入 {stats['write'] * 1000:.2f}  {stats['bytes'] / 1024:.1f} KB  {relative_path_str}")
+
+def build_phase(name):
+    """生成过程中的一个阶段，启用 --profile 时计时"""
+    return profiler.phase(name) if profiler is not None else contextlib.nullcontext()
+
+def generate_index_html(directory_path, force=False, jobs=1, thumbnails=None, options=None, derivatives=None,
+                        variants=None):
+    """
+    为给定目录及其所有子目录生成 index.html 文件。
+    目录树只扫描一次，扫描结果同时用于全局搜索索引和页面生成。
+    借助数据目录中目录库保存的扫描清单做增量生成：只重新生成输入签名变化的页面，
+    内容和已有文件完全相同时也不会重写。force=True 时忽略清单。
+    jobs > 1 时按子树把页面生成分给多个进程，输出与串行生成完全相同。
+    thumbnails 是传给 update_thumbnails 的参数字典，为 None 时不生成缩略图；
+    derivatives 是传给 update_derivatives 的参数字典，为 None 时不转码；
+    variants 是传给 update_variants 的参数字典，为 None 时不生成响应式图片。
+    options 会更新到 page_options 中。
+    """
+    if options:
+        page_options.update(options)
+    root_path = Path(directory_path).resolve()
+    output_path = site_root(root_path)
+    # 先创建数据目录，避免它在扫描之后改变根目录的 mtime
+    try:
+        (output_path / SITE_DIR_NAME).mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        print(f"错误: 无法创建目录 '{output_path / SITE_DIR_NAME}': {e}")
+        return
+    print("正在扫描目录树...")
+    with build_phase('扫描目录'):
+        # --force 时也读取目录库，用来删除已经不在目录模型中的目录留下的页面
+        previous_dirs = load_manifest(root_path)
+        manifest_dirs = {} if force else previous_dirs
+        report_skipped(collect_all_subdirs(root_path, manifest_dirs))
+        if scan_options['only_image_dirs']:
+            prune_empty_directories()
+    with build_phase('图片宽高'):
+        # 缩略图、转码结果和响应式图片按记录中的原图哈希查找，开启时检查每张图片有没有被原地覆盖
+        update_image_meta(root_path, jobs=jobs,
+                          verify=any(stage is not None for stage in (thumbnails, derivatives, variants)))
+    if derivatives is not None:
+        with build_phase('转码'):
+            update_derivatives(root_path, jobs=jobs, **derivatives)
+    if thumbnails is not None:
+        with build_phase('缩略图'):
+            update_thumbnails(root_path, jobs=jobs, **thumbnails)
+    if variants is not None:
+        with build_phase('响应式图片'):
+            update_variants(root_path, jobs=jobs, **variants)
+    with build_phase('搜索索引'):
+        write_search_index(root_path)
+    with build_phase('共享资源'):
+        write_assets(root_path)
+        write_service_worker(root_path)
+    with build_phase('页面'):
+        # 统计每个目录的用时时页面在主进程中生成
+        written, skipped = write_changed_pages(root_path, all_directories_info, jobs=jobs if profiler is None else 1)
+        if page_options['mode'] == 'spa':
+            # 单页应用模式：根目录的阅读器页面
+            shell_path = output_path / 'index.html'
+            # 和其他页面一样，根目录 mtime 保持扫描时的值，下一次运行重新列一次根目录
+            if write_chunks_if_changed(shell_path, render_index_chunks('.')):
+                print(f"已生成: {shell_path}")
+        remove_stale_pages(root_path, {p: entry.get('page') for p, entry in previous_dirs.items()})
+    with build_phase('扫描清单'):
+        save_manifest(root_path)
+    print(f"共 {len(all_directories_info)} 个目录：生成 {written} 个页面，{skipped} 个页面没有变化。")
+
+class InotifyWatcher:
+    """
+    用 inotify (通过 ctypes 调用 libc) 监视目录模型中的每个目录 (以及剪枝掉的目录)。
+    只关心会影响页面的事件：文件写完、移入移出、删除，以及子目录的创建；
+    生成器自己写入的页面文件被忽略，避免循环触发。
+    """
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+                  IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, root_path_str):
+        self.root_path_str = root_path_str
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.paths = {}  # wd -> 相对路径
+        self.wds = {}    # 相对路径 -> wd
+        self.limit_warned = False
+
+    def sync(self):
+        """让监视列表和目录模型 (以及剪枝掉的目录) 保持一致：移除已删除的目录，添加新出现的目录"""
+        for relative_path_str in [p for p in self.wds
+                                  if p not in all_directories_info and p not in pruned_directories]:
+            wd = self.wds.pop(relative_path_str)
+            if self.paths.get(wd) == relative_path_str:
+                del self.paths[wd]
+                self.libc.inotify_rm_watch(self.fd, wd)
+        for relative_path_str, info in [*all_directories_info.items(), *pruned_directories.items()]:
+            if relative_path_str in self.wds or info['archive']:
+                continue
+            full_path = os.path.join(self.root_path_str, relative_path_str)
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(full_path), self.WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC and not self.limit_warned:
+                    self.limit_warned = True
+                    print("警告: inotify 监视数量达到上限，部分目录不会被监视 "
+                          "(可以调大 /proc/sys/fs/inotify/max_user_watches)。")
+                elif err != errno.ENOSPC:
+                    print(f"警告: 无法监视目录 '{full_path}': {os.strerror(err)}")
+                continue
+            old_path = self.paths.get(wd)
+            if old_path is not None and old_path != relative_path_str:
+                # 同一个 inode 换了路径 (目录被移动)，旧路径的记录作废
+                self.wds.pop(old_path, None)
+            self.paths[wd] = relative_path_str
+            self.wds[relative_path_str] = wd
+
+    def wait(self, timeout=None):
+        """
+        等待事件，返回 (有变化的目录集合, 是否需要全部重新检查)。
+        超时没有事件时返回空集合。
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set(), False
+        changed = set()
+        overflow = False
+        output_name = output_file_name()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + self.EVENT_HEADER.size:
+                                        offset + self.EVENT_HEADER.size + name_len].rstrip(b'\0'))
+                offset += self.EVENT_HEADER.size + name_len
+                if mask & self.IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                relative_path_str = self.paths.get(wd)
+                if relative_path_str is None or mask & self.IN_IGNORED:
+                    continue
+                if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                    # 目录本身被删除或移走，由父目录的重新扫描处理
+                    if relative_path_str != '.':
+                        changed.add(posixpath.dirname(relative_path_str) or '.')
+                    continue
+                if name == output_name or (relative_path_str == '.' and name == SITE_DIR_NAME):
+                    continue
+                if name.startswith(output_name + '.') and name.endswith('.tmp'):
+                    # 原子写入页面时的临时文件
+                    continue
+                if mask & self.IN_CREATE and not mask & self.IN_ISDIR:
+                    # 文件刚创建时可能还没写完，等 IN_CLOSE_WRITE
+                    continue
+                changed.add(relative_path_str)
+        return changed, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """没有 inotify 时的退路：定时检查目录模型中每个目录 (以及剪枝掉的目录) 的 mtime"""
+
+    def __init__(self, root_path_str):
+        self.root_path_str = root_path_str
+        # 上一次轮询看到的 mtime，避免在去抖等待期间重复报告同一个变化
+        self.seen = {}
+
+    def sync(self):
+        self.seen = {}
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            interval = WATCH_POLL_INTERVAL
+            if deadline is not None:
+                interval = min(interval, max(0.0, deadline - time.monotonic()))
+            time.sleep(interval)
+            changed = set()
+            for relative_path_str, info in [*all_directories_info.items(), *pruned_directories.items()]:
+                try:
+                    mtime = os.stat(os.path.join(self.root_path_str, relative_path_str)).st_mtime_ns
+                except OSError:
+                    mtime = None
+                if mtime != self.seen.get(relative_path_str, info['mtime']):
+                    changed.add(relative_path_str)
+                self.seen[relative_path_str] = mtime
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed, False
+
+    def close(self):
+        pass
+
+
+def make_watcher(root_path_str):
+    """Linux 上优先使用 inotify，不可用时退回轮询"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root_path_str)
+        except (OSError, AttributeError) as e:
+            print(f"警告: 无法使用 inotify ({e})，改为轮询目录 mtime。")
+    return PollingWatcher(root_path_str)
+
+def refresh_directories(root_path, paths, force=False, jobs=1, thumbnails=None, derivatives=None, variants=None):
+    """
+    只重新扫描 paths 中的目录 (以及新出现的子目录)，并更新受影响的页面。
+    目录集合有变化时重写搜索索引；面包屑只取决于祖先目录的名称，
+    祖先改名等同于整棵子树重新出现，因此不需要另外处理。
+    返回生成的页面数。
+    """
+    root_path_str = os.fspath(root_path)
+    changed = []
+    tree_changed = False
+    previous = {p: info['page_key'] for p, info in all_directories_info.items()}
+    restored = []
+    if any(p in pruned_directories for p in paths):
+        # 剪枝掉的目录有了变化 (例如新章节目录里放进了图片)：放回模型重新扫描，之后重新剪枝
+        restored = list(pruned_directories)
+        restore_pruned_directories()
+    # 先处理上层目录，子目录如果已经随父目录一起删除或扫描过就跳过
+    for relative_path_str in sorted(paths, key=lambda p: (p != '.', p.count('/'), p)):
+        if relative_path_str not in all_directories_info or relative_path_str in changed:
+            continue
+        rescanned, subtree_changed = rescan_directory(root_path_str, relative_path_str, force=force)
+        changed.extend(rescanned)
+        tree_changed = tree_changed or subtree_changed
+    if scan_options['only_image_dirs'] and (changed or tree_changed):
+        # 目录有了或没了图片会改变上级目录是否保留，受影响的父目录也要更新页面
+        changed.extend(prune_empty_directories())
+    # 放回的目录有了图片就重新出现在目录集合中
+    tree_changed = tree_changed or any(p in all_directories_info for p in restored)
+    changed = [p for p in dict.fromkeys(changed) if p in all_directories_info]
+    # 图片被原地覆盖时目录 mtime 不变，有事件但没有重新扫描的目录逐个检查图片的大小和 mtime
+    changed.extend(update_image_meta(root_path, jobs=jobs, verify=True, paths=[
+        p for p in dict.fromkeys(paths) if p in all_directories_info and p not in changed]))
+    if not changed and not tree_changed:
+        return 0
+    update_image_meta(root_path, jobs=jobs, paths=changed)
+    # 只处理变化的目录；删除不再引用的缓存文件和检查缓存大小留给完整生成
+    if derivatives is not None:
+        update_derivatives(root_path, jobs=jobs, paths=changed, **derivatives)
+    if thumbnails is not None:
+        update_thumbnails(root_path, jobs=jobs, paths=changed, **thumbnails)
+    if variants is not None:
+        update_variants(root_path, jobs=jobs, paths=changed, **variants)
+    if tree_changed:
+        write_search_index(root_path)
+        if page_options['offline']:
+            # 子目录增减会改变同级目录的 "下一章"，页面签名没有变化的不会重写
+            changed = list(dict.fromkeys(changed + [child_path(p, name) for p in changed
+                                                    for name in all_directories_info[p]['subdirs']]))
+    written, _ = write_changed_pages(root_path, changed, jobs=jobs)
+    remove_stale_pages(root_path, previous)
+    save_manifest(root_path)
+    return written
+
+def watch(directory_path, jobs=1, thumbnails=None, derivatives=None, variants=None):
+    """
+    监视目录树，文件变化后只更新受影响的目录。目录模型一直保存在内存中。
+    一批事件在 WATCH_DEBOUNCE 秒内没有新事件 (或最多等待 WATCH_MAX_DELAY 秒) 后一起处理。
+    """
+    root_path = Path(directory_path).resolve()
+    root_path_str = os.fspath(root_path)
+    watcher = make_watcher(root_path_str)
+    watcher.sync()
+    kind = 'inotify' if isinstance(watcher, InotifyWatcher) else '轮询'
+    print(f"正在监视 '{root_path}' ({kind}，Ctrl+C 停止)...")
+    try:
+        while True:
+            changed, overflow = watcher.wait()
+            if not changed and not overflow:
+                continue
+            first_event = time.monotonic()
+            deadline = first_event + WATCH_MAX_DELAY
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                more, more_overflow = watcher.wait(min(WATCH_DEBOUNCE, remaining))
+                overflow = overflow or more_overflow
+                if not more and not more_overflow:
+                    break
+                changed |= more
+            if overflow:
+                print("警告: 事件队列溢出，重新检查所有目录。")
+                changed = set(all_directories_info) | set(pruned_directories)
+            written = refresh_directories(root_path, changed, force=not overflow, jobs=jobs,
+                                          thumbnails=thumbnails, derivatives=derivatives, variants=variants)
+            watcher.sync()
+            if written:
+                print(f"已更新 {written} 个页面 (用时 {time.monotonic() - first_event:.2f} 秒)。")
+    except KeyboardInterrupt:
+        print("\n已停止监视。")
+    finally:
+        watcher.close()
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """
+    用固定大小的线程池处理请求的 HTTP 服务器，同时保存按需生成页面所需的状态。
+    on_demand 为 True 时，目录页面、共享样式表/脚本和搜索索引都根据内存中的
+    目录模型生成，不需要在磁盘上写入任何文件。
+    压缩包的页面无法事先写入磁盘，任何模式下都按需生成；manifest_dirs 是生成时的扫描清单，
+    用来复用其中记录的压缩包成员列表和图片宽高。
+    """
+
+    def __init__(self, server_address, handler_class, root_path_str, workers=SERVE_WORKERS, on_demand=False,
+                 manifest_dirs=None):
+        super().__init__(server_address, handler_class)
+        self.root_path_str = root_path_str
+        self.on_demand = on_demand
+        self.manifest_dirs = manifest_dirs or {}
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.gzip_cache = OrderedDict()
+        self.page_cache = {}
+        self.search_files = None
+        self.archives = OrderedDict()
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+        for _, zf in self.archives.values():
+            zf.close()
+
+    def open_archive(self, relative_path_str):
+        """
+        返回打开的压缩包 (ZipFile, stat 结果)，无法读取时返回 None。
+        最近使用的压缩包保持打开，中央目录只解析一次；文件大小或 mtime 变化后重新打开。
+        """
+        archive_path = os.path.join(self.root_path_str, relative_path_str)
+        try:
+            st = os.stat(archive_path)
+        except OSError:
+            return None
+        key = (st.st_size, st.st_mtime_ns)
+        with self.lock:
+            cached = self.archives.get(relative_path_str)
+            if cached and cached[0] == key:
+                self.archives.move_to_end(relative_path_str)
+                return cached[1], st
+        try:
+            zf = zipfile.ZipFile(archive_path)
+        except (OSError, zipfile.BadZipFile):
+            return None
+        with self.lock:
+            self.archives[relative_path_str] = (key, zf)
+            self.archives.move_to_end(relative_path_str)
+            # 被挤出缓存的压缩包可能还有其他线程在读取，不主动关闭，交给垃圾回收
+            while len(self.archives) > ARCHIVE_CACHE_ENTRIES:
+                self.archives.popitem(last=False)
+        return zf, st
+
+    def gzip_bytes(self, key, data):
+        """压缩响应内容，按 key (路径和 ETag) 缓存最近的压缩结果"""
+        with self.lock:
+            cached = self.gzip_cache.get(key)
+            if cached is not None:
+                self.gzip_cache.move_to_end(key)
+                return cached
+        compressed = gzip.compress(data, compresslevel=6)
+        with self.lock:
+            self.gzip_cache[key] = compressed
+            while len(self.gzip_cache) > GZIP_CACHE_ENTRIES:
+                self.gzip_cache.popitem(last=False)
+        return compressed
+
+    def site_file(self, name):
+        """按需模式下数据目录中的文件 (共享样式表/脚本、搜索索引)，返回 (内容, 类型) 或 None"""
+        assets = asset_names()
+        if name == assets['css']:
+            return APP_CSS.encode('utf-8'), 'text/css'
+        if name == assets['js']:
+            return APP_JS.encode('utf-8'), 'text/javascript'
+        if name == assets['spa']:
+            return SPA_JS.encode('utf-8'), 'text/javascript'
+        with self.lock:
+            if self.search_files is None:
+                self.search_files = {file_name: content.encode('utf-8')
+                                     for file_name, content in build_search_index().items()}
+            content = self.search_files.get(name)
+        return (content, 'application/json') if content is not None else None
+
+    def directory_info(self, relative_path_str):
+        """
+        返回目录的最新信息：目录 mtime 变化时重新扫描这个目录 (不递归)。
+        新出现的目录会加入目录模型，并让搜索索引在下次请求时重新生成。
+        """
+        with self.lock:
+            cached = self.manifest_dirs.get(relative_path_str)
+            if relative_path_str not in all_directories_info and cached:
+                # 静态模式下第一次访问压缩包：从生成时的清单开始，而不是重新读取全部成员
+                info = scan_directory(self.root_path_str, relative_path_str, cached)
+                if info is not None:
+                    all_directories_info[relative_path_str] = info
+            changed, tree_changed = rescan_directory(self.root_path_str, relative_path_str)
+            if tree_changed:
+                self.search_files = None
+            if changed:
+                update_image_meta(self.root_path_str, paths=changed)
+            return all_directories_info.get(relative_path_str)
+
+    def render_page(self, relative_path_str, manifest=False):
+        """按需生成目录的 index.html (或单页应用模式下的 manifest.json)，页面签名不变时复用上一次的结果"""
+        if self.directory_info(relative_path_str) is None:
+            return None
+        with self.lock:
+            if page_options['offline']:
+                link_chapters([relative_path_str])
+            signature = page_signature(relative_path_str)
+            key = (relative_path_str, manifest)
+            cached = self.page_cache.get(key)
+            if cached and cached[0] == signature:
+                return cached[1]
+            if manifest:
+                content = render_directory_manifest(relative_path_str).encode('utf-8')
+            else:
+                content = render_index_html(relative_path_str).encode('utf-8')
+            self.page_cache[key] = (signature, content)
+        return content
+
+
+class MangaRequestHandler(BaseHTTPRequestHandler):
+    """
+    静态文件处理：sendfile 零拷贝发送文件，支持 Range、强 ETag/Last-Modified 和 304，
+    哈希命名的资源长期缓存，HTML/JSON 等文本在客户端支持时 gzip 压缩。
+    """
+    protocol_version = 'HTTP/1.1'
+    server_version = 'Creatmangapages'
+    # 空闲的长连接超过这个秒数后关闭，避免长期占用线程池
+    timeout = 30
+
+    def do_GET(self):
+        self.serve(head=False)
+
+    def do_HEAD(self):
+        self.serve(head=True)
+
+    def serve(self, head):
+        url = urlsplit(self.path)
+        url_path = unquote(url.path)
+        if '\0' in url_path:
+            self.send_error(HTTPStatus.BAD_REQUEST)
+            return
+        relative_path_str = posixpath.normpath('/' + url_path).lstrip('/') or '.'
+        if relative_path_str.split('/', 1)[0] == '..':
+            self.send_error(HTTPStatus.FORBIDDEN)
+            return
+        server = self.server
+        fs_path = os.path.join(server.root_path_str, relative_path_str)
+        spa_mode = page_options['mode'] == 'spa'
+
+        if server.on_demand and page_options['offline'] and relative_path_str == SERVICE_WORKER_NAME:
+            self.send_bytes(relative_path_str, render_service_worker().encode('utf-8'), 'text/javascript', head)
+            return
+
+        site_prefix = SITE_DIR_NAME + '/'
+        if server.on_demand and relative_path_str.startswith(site_prefix):
+            site_file = server.site_file(relative_path_str[len(site_prefix):])
+            if site_file is not None:
+                self.send_bytes(relative_path_str, site_file[0], site_file[1], head)
+                return
+
+        archive = self.find_archive(relative_path_str, url.path.endswith('/'))
+        if archive:
+            self.serve_archive(archive[0], archive[1], head)
+            return
+
+        if os.path.isdir(fs_path):
+            if not url.path.endswith('/'):
+                # 目录地址补上结尾的 /，页面中的相对链接才能正确解析
+                self.redirect(url.path + '/' + (f'?{url.query}' if url.query else ''), HTTPStatus.MOVED_PERMANENTLY)
+                return
+            index_path = os.path.join(fs_path, 'index.html')
+            if not server.on_demand and os.path.isfile(index_path):
+                self.send_file(relative_path_str + '/index.html', index_path, head)
+                return
+            if server.on_demand:
+                if spa_mode and relative_path_str != '.':
+                    # 单页应用模式只有根目录有阅读器页面
+                    self.redirect('/?dir=' + quote(relative_path_str, safe=''))
+                    return
+                content = server.render_page(relative_path_str)
+                if content is not None:
+                    self.send_bytes(relative_path_str + '/index.html', content, 'text/html', head)
+                    return
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        if os.path.isfile(fs_path) and not (server.on_demand and os.path.basename(fs_path) == output_file_name()):
+            self.send_file(relative_path_str, fs_path, head)
+            return
+        if server.on_demand and spa_mode and posixpath.basename(relative_path_str) == SPA_MANIFEST_NAME:
+            content = server.render_page(posixpath.dirname(relative_path_str) or '.', manifest=True)
+            if content is not None:
+                self.send_bytes(relative_path_str, content, 'application/json', head)
+                return
+        self.send_error(HTTPStatus.NOT_FOUND)
+
+    def redirect(self, location, status=HTTPStatus.FOUND):
+        self.send_response(status)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def find_archive(self, relative_path_str, trailing_slash):
+        """
+        如果路径经过一个压缩包，返回 (压缩包的相对路径, 成员名)，成员名为空表示压缩包的页面。
+        不带结尾 / 的压缩包地址仍然是压缩包文件本身 (下载)，返回 None。
+        """
+        parts = relative_path_str.split('/')
+        for i, part in enumerate(parts):
+            if os.path.splitext(part)[1].lower() not in ARCHIVE_EXTENSIONS:
+                continue
+            archive_rel = '/'.join(parts[:i + 1])
+            if not os.path.isfile(os.path.join(self.server.root_path_str, archive_rel)):
+                continue
+            member = '/'.join(parts[i + 1:])
+            if not member and not trailing_slash:
+                return None
+            return archive_rel, member
+        return None
+
+    def serve_archive(self, archive_rel, member, head):
+        """提供压缩包的页面 (按需生成) 或其中的一个成员"""
+        server = self.server
+        spa_mode = page_options['mode'] == 'spa'
+        if not member:
+            if spa_mode:
+                self.redirect('/?dir=' + quote(archive_rel, safe=''))
+                return
+            content = server.render_page(archive_rel)
+            if content is None:
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            self.send_bytes(archive_rel + '/index.html', content, 'text/html', head)
+            return
+        opened = server.open_archive(archive_rel)
+        if opened is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        zf, st = opened
+        try:
+            member_info = zf.getinfo(member)
+        except KeyError:
+            member_info = None
+        if member_info is None or member_info.is_dir() or member_info.flag_bits & 0x1:
+            if spa_mode and member == SPA_MANIFEST_NAME:
+                content = server.render_page(archive_rel, manifest=True)
+                if content is not None:
+                    self.send_bytes(archive_rel + '/' + member, content, 'application/json', head)
+                    return
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        relative_path_str = archive_rel + '/' + member
+        # 成员内容由 CRC 和大小确定，作为强 ETag
+        etag = f'"{member_info.CRC:08x}-{member_info.file_size:x}"'
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+        if member_info.compress_type == zipfile.ZIP_STORED:
+            # 未压缩的成员：从本地文件头算出数据偏移，直接用 sendfile 发送压缩包中的这段字节
+            try:
+                f = open(os.path.join(server.root_path_str, archive_rel), 'rb')
+            except OSError:
+                self.send_error(HTTPStatus.NOT_FOUND)
+                return
+            with f:
+                f.seek(member_info.header_offset)
+                local_header = f.read(30)
+                if len(local_header) < 30 or local_header[:4] != b'PK\x03\x04':
+                    self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, "损坏的压缩包")
+                    return
+                name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+                data_offset = member_info.header_offset + 30 + name_length + extra_length
+                self.send_stream(relative_path_str, f, data_offset, member_info.file_size,
+                                 etag, last_modified, st.st_mtime, head)
+            return
+        try:
+            f = zf.open(member_info)
+        except (RuntimeError, NotImplementedError, zipfile.BadZipFile) as e:
+            self.send_error(HTTPStatus.NOT_IMPLEMENTED, str(e))
+            return
+        with f:
+            self.send_stream(relative_path_str, f, 0, member_info.file_size,
+                             etag, last_modified, st.st_mtime, head, seekable=False)
+
+    def content_type(self, relative_path_str):
+        return mimetypes.guess_type(relative_path_str)[0] or 'application/octet-stream'
+
+    def send_content_type(self, content_type):
+        if content_type.startswith('text/') or content_type == 'application/json':
+            self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        else:
+            self.send_header('Content-Type', content_type)
+        if content_type in COMPRESSIBLE_TYPES:
+            self.send_header('Vary', 'Accept-Encoding')
+
+    def cache_control(self, relative_path_str, content_type):
+        site_prefix = SITE_DIR_NAME + '/'
+        if relative_path_str.startswith(site_prefix) and IMMUTABLE_ASSET_PATTERN.search(relative_path_str[len(site_prefix):]):
+            return 'public, max-age=31536000, immutable'
+        if content_type in ('text/html', 'application/json') or relative_path_str == SERVICE_WORKER_NAME:
+            return 'no-cache'
+        return 'public, max-age=3600'
+
+    @staticmethod
+    def gzip_etag(etag):
+        """gzip 压缩版本的 ETag：不同的内容编码不能共用同一个强 ETag (RFC 7232)"""
+        return etag[:-1] + '-gz"'
+
+    def is_not_modified(self, etag, mtime=None):
+        """
+        根据 If-None-Match / If-Modified-Since 判断客户端缓存是否仍然有效。
+        etag 是原始内容的 ETag，客户端持有的是原始版本或压缩版本的 ETag 都算有效
+        (If-None-Match 使用弱比较，两者内容相同)。
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            tags = {tag.strip() for tag in if_none_match.split(',')}
+            tags.update(tag[2:] for tag in list(tags) if tag.startswith('W/'))
+            return '*' in tags or etag in tags or self.gzip_etag(etag) in tags
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since and mtime is not None:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+        return False
+
+    def accepts_gzip(self, content_type, size):
+        if content_type not in COMPRESSIBLE_TYPES or size < GZIP_MIN_SIZE:
+            return False
+        accept_encoding = self.headers.get('Accept-Encoding', '')
+        return any(part.split(';')[0].strip() == 'gzip' for part in accept_encoding.split(','))
+
+    def parse_range(self, size, etag, last_modified):
+        """
+        解析单个字节范围，返回 (起始, 长度)；没有 Range 或范围无效时返回 None (发送完整内容)，
+        起始位置超出文件大小时返回 False。If-Range 只接受未压缩内容的强 ETag 或 Last-Modified。
+        """
+        range_header = self.headers.get('Range')
+        if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range not in (etag, last_modified):
+            return None
+        start_str, _, end_str = range_header[6:].strip().partition('-')
+        try:
+            if start_str:
+                start = int(start_str)
+                end = int(end_str) if end_str else size - 1
+            else:
+                suffix = int(end_str)
+                if suffix == 0:
+                    return False
+                start = max(0, size - suffix)
+                end = size - 1
+        except ValueError:
+            return None
+        if start_str and end_str and end < start:
+            # 语法上无效的范围 (例如 bytes=5-2) 忽略，返回完整内容
+            return None
+        if start >= size:
+            return False
+        return start, min(end, size - 1) - start + 1
+
+    def send_common_headers(self, relative_path_str, content_type, etag, last_modified=None):
+        self.send_header('ETag', etag)
+        if last_modified:
+            self.send_header('Last-Modified', last_modified)
+        self.send_header('Cache-Control', self.cache_control(relative_path_str, content_type))
+
+    def send_file(self, relative_path_str, fs_path, head):
+        try:
+            f = open(fs_path, 'rb')
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+            last_modified = formatdate(st.st_mtime, usegmt=True)
+            self.send_stream(relative_path_str, f, 0, st.st_size, etag, last_modified, st.st_mtime, head)
+
+    def send_stream(self, relative_path_str, f, base_offset, size, etag, last_modified, mtime, head, seekable=True):
+        """
+        发送文件对象 f 中从 base_offset 开始的 size 个字节。
+        seekable 为 True 时 f 是磁盘上的文件：支持 Range，并用 sendfile 发送；
+        否则 (压缩包中需要解压的成员) 顺序读取复制，忽略 Range。
+        """
+        content_type = self.content_type(relative_path_str)
+        if self.is_not_modified(etag, mtime):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_common_headers(relative_path_str, content_type,
+                                     self.gzip_etag(etag) if self.accepts_gzip(content_type, size) else etag,
+                                     last_modified)
+            self.end_headers()
+            return
+        if self.accepts_gzip(content_type, size):
+            f.seek(base_offset)
+            self.send_bytes(relative_path_str, f.read(size), content_type, head, etag, last_modified)
+            return
+        byte_range = self.parse_range(size, etag, last_modified) if seekable else None
+        if byte_range is False:
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if byte_range:
+            offset, count = byte_range
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header('Content-Range', f'bytes {offset}-{offset + count - 1}/{size}')
+        else:
+            offset, count = 0, size
+            self.send_response(HTTPStatus.OK)
+        self.send_content_type(content_type)
+        self.send_header('Content-Length', str(count))
+        self.send_header('Accept-Ranges', 'bytes' if seekable else 'none')
+        self.send_common_headers(relative_path_str, content_type, etag, last_modified)
+        self.end_headers()
+        if head or not count:
+            return
+        if seekable:
+            # socket.sendfile 在支持的平台上使用 os.sendfile，文件内容不经过用户态
+            self.wfile.flush()
+            self.connection.sendfile(f, base_offset + offset, count)
+        else:
+            shutil.copyfileobj(f, self.wfile, 64 * 1024)
+
+    def send_bytes(self, relative_path_str, data, content_type, head, etag=None, last_modified=None):
+        """发送内存中的响应内容 (按需生成的页面或需要压缩的文本)"""
+        if etag is None:
+            etag = '"' + hashlib.sha1(data).hexdigest()[:20] + '"'
+        gzipped = self.accepts_gzip(content_type, len(data))
+        # 压缩版本使用自己的 ETag
+        sent_etag = self.gzip_etag(etag) if gzipped else etag
+        if self.is_not_modified(etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_common_headers(relative_path_str, content_type, sent_etag, last_modified)
+            self.end_headers()
+            return
+        if gzipped:
+            data = self.server.gzip_bytes((relative_path_str, etag), data)
+        self.send_response(HTTPStatus.OK)
+        self.send_content_type(content_type)
+        self.send_header('Content-Length', str(len(data)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_common_headers(relative_path_str, content_type, sent_etag, last_modified)
+        self.end_headers()
+        if not head:
+            self.wfile.write(data)
+
+
+def format_size(size):
+    """把字节数格式化为便于阅读的大小"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def print_stats(directory_path, top=STATS_TOP):
+    """
+    只读取目录库 (不访问图片目录) 打印图片库的统计：
+    目录、图片总数和总大小，最大的 top 个系列 (一级目录) 和图片最多的 top 个标签。
+    统计的是上一次 build 时的状态。
+    """
+    root_path = Path(directory_path).resolve()
+    path = catalog_path(root_path)
+    if not path.exists():
+        print(f"错误: 没有找到目录库 '{path}'，请先运行 build。")
+        return
+    try:
+        with contextlib.closing(sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True)) as db:
+            meta = dict(db.execute('SELECT key, value FROM meta'))
+            if meta.get('version') != str(CATALOG_VERSION):
+                print(f"错误: 目录库 '{path}' 的版本不同，请先运行 build。")
+                return
+            dir_count, image_count, image_bytes = db.execute(
+                'SELECT COUNT(*), SUM(image_count), SUM(image_bytes) FROM dirs').fetchone()
+            series = db.execute(
+                "SELECT series, COUNT(*), SUM(image_count), SUM(image_bytes) FROM dirs WHERE series != '.' "
+                "GROUP BY series ORDER BY SUM(image_bytes) DESC, SUM(image_count) DESC LIMIT ?", (top,)).fetchall()
+            tags = db.execute(
+                "SELECT tag, COUNT(*), SUM(image_count), SUM(image_bytes) FROM tags JOIN dirs USING (path) "
+                "GROUP BY tag ORDER BY SUM(image_count) DESC, tag LIMIT ?", (top,)).fetchall()
+    except sqlite3.Error as e:
+        print(f"错误: 无法读取目录库 '{path}': {e}")
+        return
+    updated = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(int(meta.get('updated', 0))))
+    print(f"图片库 '{root_path}' (目录库更新于 {updated})")
+    print(f"  {dir_count} 个目录，{image_count or 0} 张图片，共 {format_size(image_bytes or 0)}")
+    if series:
+        print(f"最大的 {len(series)} 个系列 (一级目录):")
+        for name, dirs, images, size in series:
+            print(f"  {format_size(size):>10} {images:>8} 张 {dirs:>6} 个目录  {name}")
+    if tags:
+        print(f"图片最多的 {len(tags)} 个标签:")
+        for tag, dirs, images, size in tags:
+            print(f"  {images:>8} 张 {format_size(size):>10} {dirs:>6} 个目录  {tag}")
+
+def find_duplicates(root_path, jobs=1):
+    """
+    在目录模型中查找内容完全相同的图片 (压缩包中的图片除外)。
+    先按清单中的文件大小分组，只读取大小相同的文件开头的哈希，开头也相同的才计算完整的 SHA-1
+    (图片元数据中已有 SHA-1 的不再读取全文)；jobs > 1 时哈希在进程池中计算。
+    同一个文件的多个路径 (硬链接，或符号链接指向的图片) 不算重复。
+    返回按可节省空间从大到小排列的重复组 [(文件大小, 副本列表)]，每个副本是指向同一个文件的相对路径列表。
+    计算出的 SHA-1 记入图片元数据，保存清单后下次 (以及生成缩略图时) 不必重新读取。
+    """
+    root_path_str = os.fspath(root_path)
+    by_size = {}
+    for relative_path_str, info in all_directories_info.items():
+        if info['archive']:
+            continue
+        for img_name in info['images']:
+            entry = info['image_meta'].get(img_name)
+            if entry and entry.get('size'):
+                by_size.setdefault(entry['size'], []).append((relative_path_str, img_name))
+    candidates = [item for items in by_size.values() if len(items) > 1 for item in items]
+
+    def _map(func, items, chunksize):
+        paths = [os.path.join(root_path_str, relative_path_str, img_name) for relative_path_str, img_name in items]
+        if jobs > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                return list(executor.map(func, paths, chunksize=chunksize))
+        return list(map(func, paths))
+
+    def _meta(item):
+        return all_directories_info[item[0]]['image_meta'][item[1]]
+
+    # 大小相同的文件比较开头，同时得到 inode：同一个文件的多个路径只需要计算一次完整哈希
+    by_head = {}
+    for item, result in zip(candidates, _map(partial_sha1, candidates, 64)):
+        if result is not None:
+            head, dev, ino = result
+            by_head.setdefault((_meta(item)['size'], head), {}).setdefault((dev, ino), []).append(item)
+    to_hash = []
+    for (size, head), inodes in by_head.items():
+        if len(inodes) < 2:
+            continue
+        for items in inodes.values():
+            if size <= DUPES_PARTIAL_BYTES:
+                # 开头的哈希就是整个文件的哈希
+                for item in items:
+                    _meta(item)['sha1'] = head
+            elif 'sha1' not in _meta(items[0]):
+                to_hash.append(items)
+    for items, sha1 in zip(to_hash, _map(full_sha1, [items[0] for items in to_hash], 4)):
+        if sha1:
+            for item in items:
+                _meta(item)['sha1'] = sha1
+
+    groups = []
+    for (size, head), inodes in by_head.items():
+        if len(inodes) < 2:
+            continue
+        by_sha1 = {}
+        for items in inodes.values():
+            sha1 = _meta(items[0]).get('sha1')
+            if sha1:
+                by_sha1.setdefault(sha1, []).append(sorted(child_path(*item) for item in items))
+        for copies in by_sha1.values():
+            if len(copies) > 1:
+                groups.append((size, sorted(copies)))
+    groups.sort(key=lambda group: (-group[0] * (len(group[1]) - 1), group[1][0][0]))
+    return groups
+
+def print_duplicates(groups, top=STATS_TOP, limit=10):
+    """打印重复组的总数、多余副本占用的空间，以及可节省空间最多的 top 组 (每组最多列出 limit 份)"""
+    if not groups:
+        print("没有发现重复的图片。")
         return
-    # 递归处理子目录 (包括隐藏目录)
-    for subdir_name in subdirectories:
-        subdir_path = directory_path / subdir_name
-        generate_index_html(subdir_path)
+    extra = sum(len(copies) - 1 for _, copies in groups)
+    wasted = sum(size * (len(copies) - 1) for size, copies in groups)
+    print(f"发现 {len(groups)} 组重复的图片，多余的副本 {extra} 个，共 {format_size(wasted)}:")
+    for size, copies in groups[:top]:
+        print(f"  {format_size(size * (len(copies) - 1)):>10}  {len(copies)} 份，每份 {format_size(size)}")
+        for paths in copies[:limit]:
+            print(f"      {paths[0]}" + (f" (另有 {len(paths) - 1} 个路径指向同一个文件)" if len(paths) > 1 else ''))
+        if len(copies) > limit:
+            print(f"      ... 还有 {len(copies) - limit} 份")
+    if len(groups) > top:
+        print(f"  ... 还有 {len(groups) - top} 组")
+
+def link_duplicates(root_path, groups):
+    """
+    把每个重复组中其余副本的路径替换为第一个副本的硬链接，返回 (替换的路径数, 释放的字节数)。
+    符号链接保持不变；替换前逐字节比较，先在旁边建立硬链接再改名覆盖，失败时原文件保持不变。
+    """
+    root_path_str = os.fspath(root_path)
+    linked = freed = 0
+    for size, copies in groups:
+        keep = os.path.join(root_path_str, copies[0][0])
+        for paths in copies[1:]:
+            for relative_file in paths:
+                target = os.path.join(root_path_str, relative_file)
+                tmp_path = f"{target}.{os.getpid()}.tmp"
+                try:
+                    st = os.lstat(target)
+                    if stat.S_ISLNK(st.st_mode):
+                        continue
+                    if not filecmp.cmp(keep, target, shallow=False):
+                        print(f"警告: '{relative_file}' 的内容和 '{copies[0][0]}' 不同 (扫描后被修改过)，跳过。")
+                        break
+                    os.link(keep, tmp_path)
+                    os.replace(tmp_path, target)
+                except OSError as e:
+                    print(f"警告: 无法把 '{relative_file}' 替换为硬链接: {e}")
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+                    break
+                linked += 1
+                # 最后一个指向旧文件的路径被替换后，旧文件的空间才被释放
+                if st.st_nlink == 1:
+                    freed += size
+    return linked, freed
+
+def find_duplicate_images(directory_path, jobs=1, hardlink=False, top=STATS_TOP):
+    """
+    dupes 命令：扫描目录树 (和 build 一样复用目录库，目录没有变化时不需要列目录)，
+    查找并报告重复的图片；hardlink 为 True 时把重复的副本替换为硬链接。
+    """
+    root_path = Path(directory_path).resolve()
+    print("正在扫描目录树...")
+    report_skipped(collect_all_subdirs(root_path, load_manifest(root_path)))
+    if scan_options['only_image_dirs']:
+        prune_empty_directories()
+    # 分组用到记录中的大小和哈希，原地覆盖的图片也要检查出来
+    update_image_meta(root_path, jobs=jobs, verify=True)
+    print("正在比较大小相同的图片...")
+    groups = find_duplicates(root_path, jobs=jobs)
+    print_duplicates(groups, top=top)
+    if (site_root(root_path) / SITE_DIR_NAME).is_dir():
+        # 保存计算出的哈希，下次查找 (以及生成缩略图、转码) 时复用
+        save_manifest(root_path)
+    if hardlink and groups:
+        linked, freed = link_duplicates(root_path, groups)
+        print(f"已把 {linked} 个文件替换为硬链接，释放了 {format_size(freed)}。")
+
+def serve(directory_path, host=SERVE_HOST, port=SERVE_PORT, workers=SERVE_WORKERS, on_demand=False):
+    """
+    启动内置的多线程静态服务器。
+    on_demand 为 True 时先扫描一次目录树 (复用扫描清单)，之后按需生成页面，不写入任何文件。
+    """
+    root_path = Path(directory_path).resolve()
+    mimetypes.add_type('image/webp', '.webp')
+    mimetypes.add_type('text/javascript', '.js')
+    manifest_dirs = load_manifest(root_path)
+    if on_demand:
+        print("正在扫描目录树...")
+        report_skipped(collect_all_subdirs(root_path, manifest_dirs))
+        if scan_options['only_image_dirs']:
+            prune_empty_directories()
+        update_image_meta(root_path, jobs=workers)
+    server = ThreadPoolHTTPServer((host, port), MangaRequestHandler, os.fspath(root_path),
+                                  workers=workers, on_demand=on_demand, manifest_dirs=manifest_dirs)
+    print(f"正在提供 '{root_path}'：http://{host}:{port}/  (Ctrl+C 停止)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务器已停止。")
+    finally:
+        server.server_close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="遍历当前目录，在每个目录生成漫画阅读用的 index.html")
+    parser.add_argument('command', nargs='?', choices=['build', 'serve', 'stats', 'dupes'], default='build',
+                        help="build: 生成页面 (默认)；serve: 启动内置的静态服务器；"
+                             "stats: 根据目录库打印统计 (最大的系列、每个标签的图片数)，不扫描目录；"
+                             "dupes: 查找内容相同的重复图片")
+    parser.add_argument('--force', action='store_true', help="忽略扫描清单，重新检查所有页面")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="生成页面 (以及 dupes 计算哈希) 使用的进程数，0 表示使用全部 CPU 核心 (默认: 1)")
+    parser.add_argument('--thumbnails', action='store_true',
+                        help="为滚动视图生成缩略图 (需要 Pillow)，双页视图仍然加载原图")
+    parser.add_argument('--thumb-width', type=int, default=THUMB_WIDTH,
+                        help=f"缩略图宽度 (默认: {THUMB_WIDTH})")
+    parser.add_argument('--thumb-format', choices=['webp', 'jpeg'], default=THUMB_FORMAT,
+                        help=f"缩略图格式 (默认: {THUMB_FORMAT})")
+    parser.add_argument('--thumb-quality', type=int, default=THUMB_QUALITY,
+                        help=f"缩略图质量 (默认: {THUMB_QUALITY})")
+    parser.add_argument('--thumb-cache-size', type=int, default=THUMB_CACHE_SIZE_MB,
+                        help=f"缩略图缓存大小上限，单位 MB (默认: {THUMB_CACHE_SIZE_MB})")
+    parser.add_argument('--transcode', action='store_true',
+                        help="把 BMP、TIFF 和过大的 PNG 转码为适合网页的格式 (需要 Pillow)，原图保持不变")
+    parser.add_argument('--transcode-format', choices=['webp', 'jpeg'], default=TRANSCODE_FORMAT,
+                        help=f"转码格式 (默认: {TRANSCODE_FORMAT})")
+    parser.add_argument('--transcode-quality', type=int, default=TRANSCODE_QUALITY,
+                        help=f"转码质量 (默认: {TRANSCODE_QUALITY})")
+    parser.add_argument('--transcode-png-mb', type=float, default=TRANSCODE_PNG_MIN_MB,
+                        help=f"超过这个大小 (MB) 的 PNG 才转码 (默认: {TRANSCODE_PNG_MIN_MB})")
+    parser.add_argument('--srcset', action='store_true',
+                        help="为每张图片生成几个宽度档位的缩小版本 (需要 Pillow)，页面用 srcset 按屏幕选择")
+    parser.add_argument('--srcset-widths', default=','.join(map(str, SRCSET_WIDTHS)),
+                        help=f"响应式图片的宽度档位，用逗号分隔 (默认: {','.join(map(str, SRCSET_WIDTHS))})")
+    parser.add_argument('--srcset-format', choices=['webp', 'jpeg'], default=VARIANT_FORMAT,
+                        help=f"响应式图片格式 (默认: {VARIANT_FORMAT})")
+    parser.add_argument('--srcset-quality', type=int, default=VARIANT_QUALITY,
+                        help=f"响应式图片质量 (默认: {VARIANT_QUALITY})")
+    parser.add_argument('--mode', choices=['pages', 'spa'], default='pages',
+                        help="pages: 每个目录生成完整的 index.html；"
+                             "spa: 根目录生成一个阅读器，每个目录只写一个小的 manifest.json")
+    parser.add_argument('--prefetch', type=int, default=PREFETCH_SPREADS,
+                        help=f"双页视图向后预读并解码的跨页数 (默认: {PREFETCH_SPREADS})")
+    parser.add_argument('--virtual-scroll', type=int, nargs='?', const=VIRTUAL_SCROLL_MIN_IMAGES, default=0,
+                        help=f"图片数达到 N 的目录使用虚拟滚动视图，只渲染视口附近的图片 "
+                             f"(不带数值时 N={VIRTUAL_SCROLL_MIN_IMAGES}，默认不使用)")
+    parser.add_argument('--offline', type=int, nargs='?', const=OFFLINE_CACHE_MB, default=0,
+                        help=f"注册 service worker 离线缓存阅读过的章节，并预先缓存下一章；"
+                             f"超过 MB 上限时删除最久没读的章节 (不带数值时为 {OFFLINE_CACHE_MB} MB，默认不启用)")
+    parser.add_argument('--watch', action='store_true',
+                        help="生成后继续监视目录树，只为发生变化的目录更新页面")
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help="最多扫描到第几层子目录 (根目录为第 0 层，默认不限制)")
+    parser.add_argument('--only-image-dirs', action='store_true',
+                        help="只为自身或下级目录中有图片的目录生成页面")
+    parser.add_argument('--no-follow-symlinks', dest='follow_symlinks', action='store_false',
+                        help="不进入符号链接指向的目录，也不读取指向文件的符号链接 "
+                             "(默认跟随；指回上级目录的循环和重复的目录总是会被跳过)")
+    parser.add_argument('--output', metavar='DIR',
+                        help="把页面、数据目录和 service worker 写到 DIR 下 (按相同的目录结构)，"
+                             "不写入图片目录本身；页面通过相对路径引用原图")
+    parser.add_argument('--base-url', metavar='URL',
+                        help="和 --output 一起使用：页面通过 URL 引用原图 (URL 对应图片根目录)，而不是相对路径")
+    parser.add_argument('--profile', action='store_true',
+                        help="统计扫描、生成页面、写入等各阶段和每个目录的用时，生成后打印最慢的目录")
+    parser.add_argument('--profile-out', metavar='FILE',
+                        help="同时用 cProfile 记录整个生成过程，结果写入 FILE (pstats 格式，隐含 --profile)")
+    parser.add_argument('--host', default=SERVE_HOST, help=f"serve: 监听地址 (默认: {SERVE_HOST})")
+    parser.add_argument('--port', type=int, default=SERVE_PORT, help=f"serve: 监听端口 (默认: {SERVE_PORT})")
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS,
+                        help=f"serve: 处理请求的线程数 (默认: {SERVE_WORKERS})")
+    parser.add_argument('--on-demand', action='store_true',
+                        help="serve: 根据扫描结果按需生成页面，不需要事先生成 index.html")
+    parser.add_argument('--top', type=int, default=STATS_TOP,
+                        help=f"stats: 列出的系列和标签数；dupes: 列出的重复组数 (默认: {STATS_TOP})")
+    parser.add_argument('--hardlink', action='store_true',
+                        help="dupes: 把重复的图片替换为同一个文件的硬链接以释放空间 "
+                             "(之后修改其中一个会同时改变所有副本)")
+    args = parser.parse_args()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    thumbnails = None
+    if args.thumbnails:
+        thumbnails = {
+            'width': args.thumb_width,
+            'fmt': args.thumb_format,
+            'quality': args.thumb_quality,
+            'cache_size_mb': args.thumb_cache_size,
+        }
+    derivatives = None
+    if args.transcode:
+        derivatives = {
+            'fmt': args.transcode_format,
+            'quality': args.transcode_quality,
+            'png_min_mb': args.transcode_png_mb,
+        }
+    variants = None
+    if args.srcset:
+        try:
+            widths = tuple(sorted({int(w) for w in args.srcset_widths.split(',') if w.strip()}))
+        except ValueError:
+            parser.error(f"无效的宽度档位: '{args.srcset_widths}'")
+        if not widths or widths[0] <= 0:
+            parser.error(f"无效的宽度档位: '{args.srcset_widths}'")
+        variants = {
+            'widths': widths,
+            'fmt': args.srcset_format,
+            'quality': args.srcset_quality,
+        }
+    scan_options.update({
+        'max_depth': max(0, args.max_depth) if args.max_depth is not None else None,
+        'only_image_dirs': args.only_image_dirs,
+        'follow_symlinks': args.follow_symlinks,
+    })
     current_dir = Path.cwd()
-    print(f"开始为目录 '{current_dir}' 及其子目录生成图片库...")
-    generate_index_html(current_dir)
-    print("完成！在浏览器中打开 index.html 查看结果。")
+    options = {
+        'mode': args.mode,
+        'prefetch_spreads': max(0, args.prefetch),
+        'virtual_scroll': max(0, args.virtual_scroll),
+        'offline': max(0, args.offline),
+    }
+    if args.base_url and not args.output:
+        parser.error("--base-url 需要和 --output 一起使用")
+    if args.output:
+        if args.command == 'serve':
+            parser.error("--output 只能用于 build，serve 直接读取图片目录")
+        output_dir = Path(args.output).resolve()
+        if output_dir != current_dir:
+            if current_dir in output_dir.parents:
+                parser.error(f"输出目录 '{output_dir}' 不能位于图片目录之内")
+            output_options['dir'] = os.fspath(output_dir)
+            if args.base_url:
+                options['image_base'] = args.base_url if args.base_url.endswith('/') else args.base_url + '/'
+            else:
+                options['image_base'] = quote(Path(os.path.relpath(current_dir, output_dir)).as_posix()) + '/'
+    if args.command == 'stats':
+        print_stats(current_dir, top=max(1, args.top))
+    elif args.command == 'dupes':
+        find_duplicate_images(current_dir, jobs=jobs, hardlink=args.hardlink, top=max(1, args.top))
+    elif args.command == 'serve':
+        page_options.update(options)
+        serve(current_dir, host=args.host, port=args.port, workers=max(1, args.workers), on_demand=args.on_demand)
+    else:
+        print(f"开始为目录 '{current_dir}' 及其子目录生成图片库...")
+        cprofile = None
+        if args.profile or args.profile_out:
+            if jobs > 1:
+                print("注意: --profile 时页面在主进程中生成，才能统计每个目录的用时。")
+            profiler = BuildProfile()
+            profiler.install(current_dir)
+            if args.profile_out:
+                import cProfile
+                cprofile = cProfile.Profile()
+                cprofile.enable()
+        generate_index_html(current_dir, force=args.force, jobs=jobs, thumbnails=thumbnails, options=options,
+                            derivatives=derivatives, variants=variants)
+        if profiler is not None:
+            if cprofile is not None:
+                cprofile.disable()
+                cprofile.dump_stats(args.profile_out)
+            profiler.uninstall()
+            profiler.report()
+            if cprofile is not None:
+                print(f"cProfile 结果已写入 '{args.profile_out}' (python -m pstats {args.profile_out})")
+            profiler = None
+        print("完成！在浏览器中打开 index.html 查看结果。")
+        if args.watch:
+            watch(current_dir, jobs=jobs, thumbnails=thumbnails, derivatives=derivatives, variants=variants)
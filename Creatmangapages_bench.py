@@ -0,0 +1,367 @@
+#!/bin/env python3
+"""
+Creatmangapages 的基准测试：在临时目录中生成一个合成的漫画库，
+分别测量完整生成和没有任何变化时的重新生成 (no-op)，结果以 JSON 输出，方便比较不同版本。
+
+每次生成都在单独的子进程中运行，子进程里包装了 os.stat/os.scandir/open 等函数来计数，
+结束时报告用时、各类调用次数、峰值内存 (RSS) 和写入的字节数。
+生成器的额外参数写在 -- 之后，例如:
+    python Creatmangapages_bench.py --dirs 2000 --images 30 -- --mode spa
+注意 -j 大于 1 时页面在工作进程中生成，工作进程里的调用不计入次数。
+
+--page-images N 改为单页面的微基准：一个有 N 张图片的目录，测量生成并写入页面、
+内容没有变化时重新生成的用时和峰值内存分配。--generator 可以指定另一个版本的生成器脚本用来对比。
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import struct
+import zlib
+import argparse
+import builtins
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+GENERATOR_SCRIPT = Path(__file__).resolve().with_name('Creatmangapages.py')
+# 合成目录名使用的标签和 CJK 字符
+TAG_POOL = ['热血', '冒险', '恋爱', '科幻', 'romance', 'action', 'comedy', 'drama', '完结', '连载']
+CJK_CHARS = '漫画系列第话卷篇章之夜月光海风花雪的少年少女王国战记物语异世界转生魔法学园'
+# 子进程中计数的函数
+COUNTED_OS_FUNCTIONS = ['stat', 'lstat', 'scandir', 'listdir', 'replace', 'unlink', 'makedirs', 'mkdir']
+
+def png_bytes(width, height):
+    """生成一张纯色 PNG (只用 zlib)，生成器读取文件头就能得到宽高"""
+    raw = b''.join(b'\x00' + b'\x80\x40\x20' * width for _ in range(height))
+    def _chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    return (b'\x89PNG\r\n\x1a\n' + _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            _chunk(b'IDAT', zlib.compress(raw)) + _chunk(b'IEND', b''))
+
+def synthetic_name(rng, index, depth, tag_density, cjk_ratio):
+    """生成一个目录名：部分使用中文，部分带 [[标签]]"""
+    if rng.random() < cjk_ratio:
+        name = ''.join(rng.choice(CJK_CHARS) for _ in range(rng.randint(2, 6))) + f" 第{index}话"
+    else:
+        name = f"Series {index:05d} d{depth}"
+    if rng.random() < tag_density:
+        name += ''.join(f" [[{tag}]]" for tag in rng.sample(TAG_POOL, rng.randint(1, 3)))
+    return name
+
+def build_library(root, dirs=500, depth=3, images=20, tag_density=0.3, cjk_ratio=0.5, seed=1):
+    """
+    在 root 下生成合成的漫画库：共 dirs 个目录 (不含根目录)，最深 depth 层，
+    没有子目录的目录 (章节) 各有 images 张图片。种子相同时生成的树完全相同。
+    返回树的统计信息。
+    """
+    rng = random.Random(seed)
+    # 几种不同尺寸的图片，内容只生成一次
+    samples = [png_bytes(8 + i, 12 + i * 2) for i in range(4)]
+    nodes = [('.', 0)]
+    children = {'.': 0}
+    for index in range(dirs):
+        # 在还没到最大深度的目录中随机选一个父目录
+        while True:
+            parent, parent_depth = rng.choice(nodes)
+            if parent_depth < depth:
+                break
+        name = synthetic_name(rng, index, parent_depth + 1, tag_density, cjk_ratio)
+        path = name if parent == '.' else f"{parent}/{name}"
+        nodes.append((path, parent_depth + 1))
+        children[parent] += 1
+        children[path] = 0
+    total_images = 0
+    total_bytes = 0
+    for path, _ in nodes:
+        directory = os.path.join(root, path)
+        os.makedirs(directory, exist_ok=True)
+        if children[path] or path == '.':
+            continue
+        for i in range(images):
+            data = samples[i % len(samples)]
+            with open(os.path.join(directory, f"{i:04d}.png"), 'wb') as f:
+                f.write(data)
+            total_images += 1
+            total_bytes += len(data)
+    return {
+        'dirs': len(nodes),
+        'leaf_dirs': sum(1 for path, _ in nodes if not children[path] and path != '.'),
+        'images': total_images,
+        'image_bytes': total_bytes,
+        'max_depth': max(d for _, d in nodes),
+    }
+
+class CountingFile:
+    """包装以写入方式打开的文件，统计写入的字节数"""
+
+    def __init__(self, f, counters):
+        self._f = f
+        self._counters = counters
+
+    def write(self, data):
+        self._counters['bytes_written'] += len(data)
+        return self._f.write(data)
+
+    def __enter__(self):
+        self._f.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._f.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._f)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+def install_counters(counters):
+    """包装 os 模块中的文件系统函数和 open，每次调用计数"""
+    def _wrap(name):
+        original = getattr(os, name)
+        def _counted(*args, **kwargs):
+            counters[name] += 1
+            return original(*args, **kwargs)
+        setattr(os, name, _counted)
+    for name in COUNTED_OS_FUNCTIONS:
+        counters[name] = 0
+        _wrap(name)
+    counters.update({'open_read': 0, 'open_write': 0, 'bytes_written': 0})
+    original_open = builtins.open
+    def _open(file, mode='r', *args, **kwargs):
+        f = original_open(file, mode, *args, **kwargs)
+        if any(c in mode for c in 'wax+'):
+            counters['open_write'] += 1
+            return CountingFile(f, counters)
+        counters['open_read'] += 1
+        return f
+    builtins.open = _open
+
+def run_child(result_path, generator_args):
+    """子进程：装好计数器后运行生成器，把测量结果写入 result_path"""
+    import runpy
+    sys.argv = [str(GENERATOR_SCRIPT)] + generator_args
+    sys.path.insert(0, str(GENERATOR_SCRIPT.parent))
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    counters = {}
+    install_counters(counters)
+    start = time.perf_counter()
+    try:
+        runpy.run_path(str(GENERATOR_SCRIPT), run_name='__main__')
+    finally:
+        wall = time.perf_counter() - start
+        sys.stdout.close()
+        sys.stdout = stdout
+    result = {'wall_s': round(wall, 4)}
+    result['stat_calls'] = counters['stat'] + counters['lstat']
+    result.update(counters)
+    if resource is not None:
+        # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+        scale = 1 if sys.platform == 'darwin' else 1024
+        result['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+        result['workers_peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+def load_generator():
+    """把生成器脚本作为模块导入 (不运行命令行部分)"""
+    import importlib.util
+    sys.path.insert(0, str(GENERATOR_SCRIPT.parent))
+    spec = importlib.util.spec_from_file_location('Creatmangapages', GENERATOR_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['Creatmangapages'] = module
+    spec.loader.exec_module(module)
+    return module
+
+def run_page_child(result_path, images, subdirs, runs):
+    """子进程：为一个有 images 张图片、subdirs 个子目录的目录生成并写入页面，测量用时和峰值内存分配"""
+    import tracemalloc
+    module = load_generator()
+    relative_path_str = '大型合集 [[测试]]/第1卷'
+    names = [f"{i:05d} 页.png" for i in range(images)]
+    subdir_names = [f"番外 {i:03d} [[{TAG_POOL[i % len(TAG_POOL)]}]]" for i in range(subdirs)]
+
+    def _info():
+        info = module.make_directory_info(relative_path_str)
+        info.update({
+            'images': names, 'subdirs': subdir_names, 'mtime': 0, 'has_index': False, 'page_key': None,
+            'image_meta': {name: {'size': 500000, 'mtime': 0, 'width': 1200, 'height': 1800} for name in names},
+            'archive': False, 'rescanned': True,
+        })
+        return info
+
+    work_dir = tempfile.mkdtemp(prefix='mangapages-page-bench-')
+    page_path = os.path.join(work_dir, relative_path_str, 'index.html')
+    os.makedirs(os.path.dirname(page_path))
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    write_times = []
+    same_times = []
+    try:
+        for _ in range(runs):
+            # 页面不存在时生成并写入；再生成一次，内容相同不需要写入
+            if os.path.exists(page_path):
+                os.unlink(page_path)
+            start = time.perf_counter()
+            module.write_pages(work_dir, [(relative_path_str, _info())])
+            write_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            module.write_pages(work_dir, [(relative_path_str, _info())])
+            same_times.append(time.perf_counter() - start)
+        page_bytes = os.path.getsize(page_path)
+        # 峰值内存单独测量，tracemalloc 会拖慢执行
+        os.unlink(page_path)
+        info = _info()
+        tracemalloc.start()
+        module.write_pages(work_dir, [(relative_path_str, info)])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        shutil.rmtree(work_dir, ignore_errors=True)
+    result = {
+        'images': images,
+        'subdirs': subdirs,
+        'page_bytes': page_bytes,
+        'write_s': round(statistics.median(write_times), 4),
+        'same_s': round(statistics.median(same_times), 4),
+        'peak_alloc_bytes': peak,
+    }
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+def run_page_benchmark(args):
+    """单页面微基准 (在子进程中运行)，返回 JSON 报告"""
+    fd, result_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--generator', str(GENERATOR_SCRIPT),
+                        '--page-child', result_path, '--page-images', str(args.page_images),
+                        '--page-subdirs', str(args.page_subdirs), '--runs', str(args.runs)], check=True)
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+    finally:
+        os.unlink(result_path)
+    return {
+        'generator': str(GENERATOR_SCRIPT),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'runs': args.runs,
+        'page': result,
+    }
+
+def measure(tree_root, generator_args):
+    """在 tree_root 中运行一次生成器 (单独的子进程)，返回测量结果"""
+    fd, result_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--generator', str(GENERATOR_SCRIPT),
+                        '--child', result_path, '--'] + generator_args, cwd=tree_root, check=True)
+        process_wall = time.perf_counter() - start
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+    finally:
+        os.unlink(result_path)
+    # 包含解释器启动和导入的总用时
+    result['process_s'] = round(process_wall, 4)
+    return result
+
+def summarize(samples):
+    """多次运行的每项指标取中位数"""
+    keys = samples[0].keys()
+    return {key: statistics.median(sample[key] for sample in samples) for key in keys}
+
+def run_benchmark(args, generator_args):
+    """生成合成库并测量 runs 次完整生成和 no-op 重新生成，返回 JSON 报告"""
+    work_dir = tempfile.mkdtemp(prefix='mangapages-bench-')
+    runs = []
+    tree = None
+    try:
+        for i in range(args.runs):
+            # 每一轮使用一棵新生成的树 (种子相同，内容完全一样)，完整生成不受上一轮输出的影响
+            tree_root = os.path.join(work_dir, f"run{i}")
+            tree = build_library(tree_root, dirs=args.dirs, depth=args.depth, images=args.images,
+                                 tag_density=args.tag_density, cjk_ratio=args.cjk, seed=args.seed)
+            full = measure(tree_root, generator_args)
+            noop = measure(tree_root, generator_args)
+            runs.append({'full': full, 'noop': noop})
+            print(f"第 {i + 1}/{args.runs} 轮: 完整生成 {full['wall_s']:.3f} 秒, "
+                  f"no-op {noop['wall_s']:.3f} 秒", file=sys.stderr)
+            if not args.keep:
+                shutil.rmtree(tree_root, ignore_errors=True)
+    finally:
+        if args.keep:
+            print(f"合成库保留在 '{work_dir}'", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        'config': {
+            'dirs': args.dirs, 'depth': args.depth, 'images': args.images,
+            'tag_density': args.tag_density, 'cjk': args.cjk, 'seed': args.seed, 'runs': args.runs,
+            'generator': str(GENERATOR_SCRIPT), 'generator_args': generator_args,
+        },
+        'tree': tree,
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'runs': runs,
+        'summary': {
+            'full': summarize([run['full'] for run in runs]),
+            'noop': summarize([run['noop'] for run in runs]),
+        },
+    }
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    generator_args = []
+    if '--' in argv:
+        split = argv.index('--')
+        argv, generator_args = argv[:split], argv[split + 1:]
+    parser = argparse.ArgumentParser(description="Creatmangapages 基准测试：合成漫画库上的完整生成和 no-op 重新生成")
+    parser.add_argument('--dirs', type=int, default=500, help="目录数量，不含根目录 (默认: 500)")
+    parser.add_argument('--depth', type=int, default=3, help="最大目录深度 (默认: 3)")
+    parser.add_argument('--images', type=int, default=20, help="每个章节目录的图片数 (默认: 20)")
+    parser.add_argument('--tag-density', type=float, default=0.3, help="带 [[标签]] 的目录比例 (默认: 0.3)")
+    parser.add_argument('--cjk', type=float, default=0.5, help="使用中文名称的目录比例 (默认: 0.5)")
+    parser.add_argument('--seed', type=int, default=1, help="随机种子 (默认: 1)")
+    parser.add_argument('--runs', type=int, default=3, help="重复测量的轮数，报告取中位数 (默认: 3)")
+    parser.add_argument('--keep', action='store_true', help="保留生成的合成库")
+    parser.add_argument('-o', '--output', help="把 JSON 结果写入文件 (默认输出到标准输出)")
+    parser.add_argument('--generator', default=str(GENERATOR_SCRIPT),
+                        help="要测量的生成器脚本 (默认: 同目录下的 Creatmangapages.py)")
+    parser.add_argument('--page-images', type=int, default=0,
+                        help="单页面微基准：测量一个有 N 张图片的目录的页面生成 (例如 10000)")
+    parser.add_argument('--page-subdirs', type=int, default=100, help="单页面微基准中目录的子目录数 (默认: 100)")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--page-child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    GENERATOR_SCRIPT = Path(args.generator).resolve()
+    if args.child:
+        run_child(args.child, generator_args)
+        sys.exit(0)
+    if args.page_child:
+        run_page_child(args.page_child, args.page_images, args.page_subdirs, args.runs)
+        sys.exit(0)
+    if args.runs < 1 or args.dirs < 0 or args.depth < 1:
+        parser.error("--runs 和 --depth 至少为 1，--dirs 不能为负数")
+    if args.page_images > 0:
+        report = run_page_benchmark(args)
+    else:
+        report = run_benchmark(args, generator_args)
+    report = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+    else:
+        print(report)